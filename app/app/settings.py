@@ -142,3 +142,82 @@ MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
 AUTH_USER_MODEL = 'core.User'
+
+
+# Expense record list pagination
+# Page size of the keyset paginated record list, clients may ask for
+# a different size up to RECORD_MAX_PAGE_SIZE with the page_size param
+
+RECORD_PAGE_SIZE = 50
+RECORD_MAX_PAGE_SIZE = 500
+
+# Most records accepted by one bulk create request
+RECORD_BULK_MAX_SIZE = 500
+
+# Rows fetched per round trip by the streaming record export
+RECORD_EXPORT_CHUNK_SIZE = 2000
+
+
+# Caches
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Local memory by default, point CACHE_BACKEND at the file based or
+# database cache to share cached responses between workers
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'familyexpense'),
+    }
+}
+
+# Summary and category responses are cached per scope version. The
+# versions, and the ETags built from them, live in the database, so with
+# the local memory cache a worker only recomputes what another cached.
+EXPENSE_CACHE_ALIAS = 'default'
+EXPENSE_CACHE_TTL = 300
+EXPENSE_CACHE_STALE_TTL = 60
+EXPENSE_CACHE_LOCK_TIMEOUT = 10
+
+# Per process token -> user cache of CachedTokenAuthentication, the TTL
+# bounds how long other processes accept a deleted token
+TOKEN_AUTH_CACHE_SIZE = int(os.environ.get('TOKEN_AUTH_CACHE_SIZE', 1024))
+TOKEN_AUTH_CACHE_TTL = int(os.environ.get('TOKEN_AUTH_CACHE_TTL', 60))
+
+# Image variants rendered off the request thread for every record image
+# and avatar: name -> ((width, height), crop to fill)
+IMAGE_VARIANTS = {
+    'thumbnail': ((160, 160), True),
+    'medium': ((800, 800), False),
+}
+IMAGE_VARIANT_QUALITY = 80
+# Worker threads per process, 0 renders inline after the commit
+IMAGE_VARIANT_WORKERS = int(os.environ.get('IMAGE_VARIANT_WORKERS', 2))
+
+# Uploaded record images are re-encoded within this size, without their
+# metadata, to IMAGE_INGEST_FORMAT (one of core.images.INGEST_EXTENSIONS)
+IMAGE_INGEST_MAX_SIZE = (2048, 2048)
+IMAGE_INGEST_FORMAT = os.environ.get('IMAGE_INGEST_FORMAT', 'WEBP')
+IMAGE_INGEST_QUALITY = int(os.environ.get('IMAGE_INGEST_QUALITY', 80))
+# Threads per process re-encoding the images of batch uploads, and the
+# most images accepted by one batch upload request
+IMAGE_INGEST_WORKERS = int(os.environ.get('IMAGE_INGEST_WORKERS', 4))
+IMAGE_BATCH_MAX_SIZE = 50
+
+# Media is served by core.media.MediaView after an access check. With a
+# header set the file itself is sent by the front server: 'X-Accel-Redirect'
+# (nginx, internal location MEDIA_ACCEL_REDIRECT_PREFIX aliased to
+# MEDIA_ROOT) or 'X-Sendfile' (Apache, lighttpd). Unset, Django streams it.
+MEDIA_SENDFILE_HEADER = os.environ.get('MEDIA_SENDFILE_HEADER') or None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+# Stored names never change content, browsers may keep them privately
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24
+
+# Resumable chunked image uploads: largest accepted image, and hours after
+# which a session nothing was written to is deleted by process_image_uploads
+IMAGE_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+IMAGE_UPLOAD_SESSION_HOURS = 24
+
+# collect_media leaves files younger than this alone, they may belong to
+# an upload or variant render whose row is not committed yet
+MEDIA_GC_GRACE_HOURS = 24
@@ -1,5 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from rest_framework.authtoken.models import Token
+        from core.authentication import evict_token
+        from core.images import release_images
+        from core.models import ExpenseRecord, Family, UserProfile
+        post_delete.connect(evict_token, sender=Token,
+                            dispatch_uid='core.evict_token')
+        for model in (ExpenseRecord, UserProfile, Family):
+            post_delete.connect(
+                release_images, sender=model,
+                dispatch_uid=f'core.release_images.{model.__name__}')
@@ -0,0 +1,138 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """
+    Bounded LRU of token key -> (user, token) with a time to live
+
+    The cache lives in the worker process. Token deletions and user saves
+    (deactivation, password change) evict the entries of the process that
+    made them right away, the TTL bounds how long other processes keep
+    accepting a revoked token.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached (user, token) of key or None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        user, token = entry[1:]
+        # Each request gets its own copy, views may change request.user
+        return copy.copy(user), token
+
+    def set(self, key, user, token):
+        """Cache the user and token of key, evicting the least recent"""
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, user, token)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """Evict key"""
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def delete_users(self, user_ids):
+        """Evict every key of the users"""
+        user_ids = set(user_ids)
+        with self.lock:
+            for key in [key for key, entry in self.entries.items()
+                        if entry[1].pk in user_ids]:
+                del self.entries[key]
+
+    def clear(self):
+        """Evict everything and reset the counters"""
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Return the hit/miss counters and the current size"""
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self.entries),
+            }
+
+
+token_cache = TokenCache(settings.TOKEN_AUTH_CACHE_SIZE,
+                         settings.TOKEN_AUTH_CACHE_TTL)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Drop-in TokenAuthentication that serves repeated keys from the token
+    cache instead of the Token + User query
+
+    The user's profile and family are loaded in the same query, so
+    get_user_profile() does not need one of its own.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+
+        model = self.get_model()
+        try:
+            token = model.objects.select_related(
+                'user__userprofile__family').get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+
+        token_cache.set(key, token.user, token)
+        return token.user, token
+
+
+def get_user_profile(request):
+    """
+    Return the request user's profile with its family, resolved once per
+    request and reusing the one loaded by CachedTokenAuthentication
+    """
+    if not hasattr(request, 'user_profile'):
+        from core.models import UserProfile
+
+        user = request.user
+        if type(user).userprofile.is_cached(user):
+            request.user_profile = user.userprofile
+        else:
+            request.user_profile = UserProfile.objects \
+                .select_related('user', 'family').get(user=user)
+    return request.user_profile
+
+
+def evict_token(sender, instance, **kwargs):
+    """Evict a deleted token"""
+    token_cache.delete(instance.key)
@@ -0,0 +1,32 @@
+import hashlib
+
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def make_etag(request, versions):
+    """
+    Return an ETag for the request's response built from scope versions
+
+    The versions change whenever the data behind the response does, so
+    the tag is known without running the query or the serializer.
+    """
+    params = sorted(request.query_params.lists())
+    accept = request.META.get('HTTP_ACCEPT', '')
+    key = repr((request.user.pk, request.path, params, accept, versions))
+    return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+
+def not_modified(request, etag):
+    """Return a 304 response if If-None-Match matches etag, else None"""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return None
+
+    etags = [tag[2:] if tag.startswith('W/') else tag
+             for tag in parse_etags(if_none_match)]
+    if '*' in etags or etag in etags:
+        return Response(status=status.HTTP_304_NOT_MODIFIED,
+                        headers={'ETag': etag})
+    return None
@@ -0,0 +1,250 @@
+import io
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_ingest_executor = None
+
+
+def get_executor():
+    """Return the worker pool rendering image variants"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_VARIANT_WORKERS,
+            thread_name_prefix='image-variants'
+        )
+    return _executor
+
+
+def get_ingest_executor():
+    """
+    Return the worker pool validating and re-encoding batch uploads
+
+    Apart from the variants pool, so requests waiting on it are not
+    queued behind background renders. Its jobs do not use the database.
+    """
+    global _ingest_executor
+    if _ingest_executor is None:
+        _ingest_executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_INGEST_WORKERS,
+            thread_name_prefix='image-ingest'
+        )
+    return _ingest_executor
+
+
+INGEST_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'WEBP': 'webp',
+}
+
+
+def ingest_image(upload):
+    """
+    Re-encode an uploaded image within IMAGE_INGEST_MAX_SIZE, dropping
+    its metadata, returning the new file and a bytes saved report
+
+    The upload is decoded from its (temporary) file and the result is
+    written to another temporary file, neither is read into memory as a
+    whole. JPEGs are decoded straight at the smallest scale still above
+    the maximum size. A missing encoder raises ValueError, like an image
+    that cannot be decoded.
+    """
+    max_size = settings.IMAGE_INGEST_MAX_SIZE
+    image_format = settings.IMAGE_INGEST_FORMAT
+
+    upload.seek(0)
+    image = Image.open(upload)
+    # Square so the draft scale holds whatever the EXIF orientation
+    image.draft('RGB', (max(max_size), max(max_size)))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(max_size, Image.LANCZOS)
+    if image_format == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or \
+            'transparency' in image.info
+        image = image.convert(
+            'RGBA' if has_alpha and image_format != 'JPEG' else 'RGB')
+
+    output = tempfile.TemporaryFile()
+    try:
+        # Metadata is only written when passed explicitly, none is
+        image.save(output, format=image_format,
+                   quality=settings.IMAGE_INGEST_QUALITY)
+    except KeyError:
+        # Pillow was built without the encoder, libwebp for WEBP
+        output.close()
+        logger.error('No %s encoder, check IMAGE_INGEST_FORMAT',
+                     image_format)
+        raise ValueError(f'Cannot encode {image_format} images')
+    stored_bytes = output.tell()
+    output.seek(0)
+
+    stem = os.path.splitext(os.path.basename(upload.name))[0]
+    name = f'{stem}.{INGEST_EXTENSIONS[image_format]}'
+    report = {
+        'original_bytes': upload.size,
+        'stored_bytes': stored_bytes,
+        'saved_bytes': upload.size - stored_bytes,
+        'width': image.width,
+        'height': image.height,
+    }
+    logger.info('Ingested image %s: %d -> %d bytes', upload.name,
+                upload.size, stored_bytes)
+    return File(output, name=name), report
+
+
+def variant_name(name, variant):
+    """Return the storage name of an image's variant"""
+    stem, ext = os.path.splitext(name)
+    return f'{stem}.{variant}.jpg'
+
+
+def delete_image(name):
+    """Delete a stored image and all of its variants"""
+    for variant in settings.IMAGE_VARIANTS:
+        default_storage.delete(variant_name(name, variant))
+    default_storage.delete(name)
+
+
+def render_variant(image, size, crop):
+    """Return the JPEG bytes of image scaled to size, cropped to fill it"""
+    if crop:
+        image = ImageOps.fit(image, size, Image.LANCZOS)
+    else:
+        image = image.copy()
+        image.thumbnail(size, Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=settings.IMAGE_VARIANT_QUALITY,
+               optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def render_variants(name):
+    """Render and store every variant of the image, returning their names"""
+    with default_storage.open(name) as original:
+        image = Image.open(original)
+        image = ImageOps.exif_transpose(image).convert('RGB')
+
+    variants = {}
+    for variant, (size, crop) in settings.IMAGE_VARIANTS.items():
+        target = variant_name(name, variant)
+        if default_storage.exists(target):
+            default_storage.delete(target)
+        variants[variant] = default_storage.save(
+            target, ContentFile(render_variant(image, size, crop)))
+    return variants
+
+
+def generate_variants(model, pk, field_name, name):
+    """
+    Render the variants of the image stored in field_name, saving them on
+    the row unless the image was replaced in the meantime
+    """
+    try:
+        variants = render_variants(name)
+        with transaction.atomic():
+            instance = model.objects.select_for_update() \
+                .filter(pk=pk).first()
+            if instance is None or getattr(instance, field_name) != name:
+                return
+            setattr(instance, f'{field_name}_variants', variants)
+            # Saving keeps cached responses and ETags in step
+            instance.save(update_fields=[f'{field_name}_variants'])
+    except Exception:
+        logger.exception('Rendering variants of %s failed', name)
+
+
+def run_in_worker(func, *args):
+    """Run func in a worker thread, with its own database connection"""
+    close_old_connections()
+    try:
+        func(*args)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(instance, field_name):
+    """Render the image's variants in the worker pool once committed"""
+    args = (type(instance), instance.pk, field_name,
+            getattr(instance, field_name).name)
+    if settings.IMAGE_VARIANT_WORKERS:
+        transaction.on_commit(lambda: get_executor().submit(
+            run_in_worker, generate_variants, *args))
+    else:
+        transaction.on_commit(lambda: generate_variants(*args))
+
+
+def release_images(sender, instance, **kwargs):
+    """
+    Release the stored images of a deleted ImageVariantsMixin row
+
+    Connected to post_delete, which is sent for queryset and cascading
+    deletes too, unlike Model.delete().
+    """
+    from core.models import ImageBlob
+
+    stored = getattr(instance, '_stored_images', None)
+    if stored is None:
+        stored = {field: getattr(instance, field).name
+                  for field in instance.IMAGE_VARIANT_FIELDS}
+    ImageBlob.objects.release(name for name in stored.values() if name)
+
+
+class ImageVariantsMixin:
+    """
+    Model mixin rendering thumbnail and medium variants of the image fields
+    in IMAGE_VARIANT_FIELDS whenever a new file is saved in one of them
+
+    Each image field gets a <field>_variants JSON field mapping variant
+    names to storage names, empty until the worker pool has rendered them.
+    Saves also keep the ImageBlob reference counts in step, deletes do so
+    through release_images.
+    """
+    IMAGE_VARIANT_FIELDS = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_images = {
+            field: getattr(instance.__dict__.get(field), 'name',
+                           instance.__dict__.get(field))
+            for field in cls.IMAGE_VARIANT_FIELDS
+        }
+        return instance
+
+    def save(self, *args, **kwargs):
+        from core.models import ImageBlob
+
+        stored = getattr(self, '_stored_images', {})
+        changed = [field for field in self.IMAGE_VARIANT_FIELDS
+                   if getattr(self, field).name != stored.get(field)]
+        for field in changed:
+            setattr(self, f'{field}_variants', {})
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {
+                    f'{field}_variants'}
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            ImageBlob.objects.release(
+                stored[field] for field in changed if stored.get(field))
+            ImageBlob.objects.acquire(
+                getattr(self, field).name for field in changed
+                if getattr(self, field))
+
+        for field in changed:
+            if getattr(self, field):
+                schedule_variants(self, field)
+        self._stored_images = {field: getattr(self, field).name
+                               for field in self.IMAGE_VARIANT_FIELDS}
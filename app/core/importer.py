@@ -0,0 +1,190 @@
+import csv
+import datetime
+import io
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from core.models import Category, ExpenseMonthlyTotal, ExpenseRecord
+from core.versions import bump_versions, record_scopes
+
+
+DEFAULT_COLUMNS = {
+    'date': 'date',
+    'amount': 'amount',
+    'category': 'category',
+    'notes': 'notes',
+}
+
+
+class RecordImporter:
+    """
+    Import expense records from bank statement CSV rows in batches
+
+    Rows are read one at a time, the category names of a batch are
+    resolved with one query and each batch is written with COPY on
+    PostgreSQL, or with bulk_create elsewhere, so memory stays bounded
+    by the batch size whatever the size of the file.
+    """
+
+    def __init__(self, user, family=None, columns=None, batch_size=1000,
+                 date_format='%Y-%m-%d', use_copy=True):
+        self.user = user
+        self.family = family
+        self.columns = dict(DEFAULT_COLUMNS, **(columns or {}))
+        self.batch_size = batch_size
+        self.date_format = date_format
+        self.use_copy = use_copy and connection.vendor == 'postgresql'
+        self.amount_field = ExpenseRecord._meta.get_field('amount')
+        self.notes_field = ExpenseRecord._meta.get_field('notes')
+
+        self.rows = 0
+        self.imported = 0
+        self.errors = []
+
+    def run(self, csvfile):
+        """
+        Import every row of a text mode CSV file, returning the report
+
+        A line that cannot be decoded or parsed as CSV ends the import,
+        it is reported as the last error and the rows before it are kept.
+        """
+        started = time.monotonic()
+        reader = csv.DictReader(csvfile)
+
+        batch = []
+        try:
+            missing = [header for field, header in self.columns.items()
+                       if field != 'notes' and header not in
+                       (reader.fieldnames or [])]
+            if missing:
+                self.errors.append({'line': 1,
+                                    'error': 'Missing columns: ' +
+                                    ', '.join(missing)})
+                return self.report(started)
+
+            for row in reader:
+                self.rows += 1
+                batch.append((reader.line_num, row))
+                if len(batch) >= self.batch_size:
+                    self.import_batch(batch)
+                    batch = []
+        except UnicodeDecodeError as e:
+            # Raised before the line is counted
+            self.errors.append({
+                'line': reader.line_num + 1,
+                'error': f'Not {e.encoding} text, give the file encoding'})
+        except csv.Error as e:
+            self.errors.append({'line': reader.line_num,
+                                'error': f'Malformed CSV: {e}'})
+        if batch:
+            self.import_batch(batch)
+
+        return self.report(started)
+
+    def report(self, started):
+        seconds = time.monotonic() - started
+        return {
+            'rows': self.rows,
+            'imported': self.imported,
+            'errors': self.errors,
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(self.imported / seconds, 1)
+            if seconds else None,
+        }
+
+    def import_batch(self, batch):
+        """Parse, resolve and insert one batch of (line, row) pairs"""
+        names = {(row.get(self.columns['category']) or '').strip()
+                 for line, row in batch}
+        categories = self.resolve_categories(names)
+
+        records = []
+        for line, row in batch:
+            try:
+                records.append(self.parse_row(row, categories))
+            except ValueError as e:
+                self.errors.append({'line': line, 'error': str(e)})
+
+        if not records:
+            return
+        with transaction.atomic():
+            if self.use_copy:
+                self.copy_records(records)
+            else:
+                ExpenseRecord.objects.bulk_create(records)
+            deltas = [record.rollup_key() for record in records]
+            ExpenseMonthlyTotal.objects.apply(deltas)
+            bump_versions('records', record_scopes(deltas))
+        self.imported += len(records)
+
+    def resolve_categories(self, names):
+        """
+        Return category ids by name among the categories the user sees,
+        preferring the user's own over the family's over public ones
+        """
+        rank = {}
+        for pk, name, user_id, family_id in Category.objects.visible(
+                self.user.pk, self.family and self.family.pk).filter(
+                name__in=names).values_list(
+                'pk', 'name', 'user_id', 'family_id'):
+            if user_id == self.user.pk:
+                priority = 0
+            elif self.family and family_id == self.family.pk:
+                priority = 1
+            else:
+                priority = 2
+            if name not in rank or priority < rank[name][0]:
+                rank[name] = (priority, pk)
+        return {name: pk for name, (priority, pk) in rank.items()}
+
+    def parse_row(self, row, categories):
+        """Return an unsaved record for a CSV row, ValueError if invalid"""
+        if any('\x00' in value for value in row.values()
+               if isinstance(value, str)):
+            # Older csv modules refuse these lines, newer pass them on
+            raise ValueError('Line contains NUL')
+        name = (row.get(self.columns['category']) or '').strip()
+        if name not in categories:
+            raise ValueError(f'Unknown category "{name}"')
+
+        try:
+            date = datetime.datetime.strptime(
+                (row.get(self.columns['date']) or '').strip(),
+                self.date_format).date()
+        except ValueError:
+            raise ValueError('Invalid date, expected format ' +
+                             self.date_format)
+
+        try:
+            amount = Decimal((row.get(self.columns['amount']) or '').strip())
+            amount = self.amount_field.clean(amount, None)
+        except (InvalidOperation, ValidationError):
+            raise ValueError('Invalid amount')
+
+        notes = (row.get(self.columns['notes']) or '').strip()
+        return ExpenseRecord(user=self.user, family=self.family,
+                             category_id=categories[name], date=date,
+                             amount=amount,
+                             notes=notes[:self.notes_field.max_length])
+
+    def copy_records(self, records):
+        """Write records with a single PostgreSQL COPY"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for record in records:
+            writer.writerow([record.user_id, record.family_id or '',
+                             record.category_id, record.date.isoformat(),
+                             record.amount, record.notes, '{}'])
+        buffer.seek(0)
+
+        table = ExpenseRecord._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY "{table}" (user_id, family_id, category_id, date, '
+                f'amount, notes, image_variants) FROM STDIN '
+                f'WITH (FORMAT csv, FORCE_NOT_NULL (notes))',
+                buffer
+            )
@@ -0,0 +1,83 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from core.models import Category, Family, UserProfile
+from core.versions import category_scopes
+
+
+class Command(BaseCommand):
+    # Django command to compare category visibility lookups at scale
+    help = ('Time the category list lookup with the scopes index against '
+            'the isPublic/user/family OR on generated families, '
+            'rolling the data back afterwards')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--families', type=int, default=5000)
+        parser.add_argument('--categories', type=int, default=10,
+                            help='Custom categories per family')
+        parser.add_argument('--repeat', type=int, default=200,
+                            help='Lookups timed per query')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            users = self.seed(options['families'], options['categories'])
+            self.report(users, options['repeat'])
+            transaction.set_rollback(True)
+
+    def seed(self, family_count, category_count):
+        """Bulk insert one user per family and its custom categories"""
+        self.stdout.write(f'Seeding {family_count} families ...')
+        families = Family.objects.bulk_create(
+            Family(name=f'Benchmark family {i}') for i in range(family_count))
+        users = get_user_model().objects.bulk_create(
+            get_user_model()(email=f'benchmark{i}@example.com',
+                             password='!')
+            for i in range(family_count))
+        UserProfile.objects.bulk_create(
+            UserProfile(user=user, family=family)
+            for user, family in zip(users, families))
+
+        categories = []
+        for user, family in zip(users, families):
+            for i in range(category_count):
+                # Alternate family wide and personal categories
+                family_id = family.pk if i % 2 else None
+                categories.append(Category(
+                    name=f'Category {i}', user=user, family_id=family_id,
+                    scopes=sorted(category_scopes(
+                        [(False, user.pk, family_id)]))))
+        Category.objects.bulk_create(categories, batch_size=5000)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE core_category')
+        return list(zip(users, families))
+
+    def report(self, users, repeat):
+        step = max(len(users) // repeat, 1)
+        samples = users[::step][:repeat]
+        queries = {
+            'OR of isPublic/user/family': lambda user, family: (
+                Category.objects.filter(Q(isPublic=True) | Q(user=user) |
+                                        Q(family=family))),
+            'scopes index': lambda user, family: (
+                Category.objects.visible(user.pk, family.pk)),
+        }
+
+        for label, query in queries.items():
+            started = time.monotonic()
+            for user, family in samples:
+                list(query(user, family).values_list('pk', flat=True))
+            elapsed = (time.monotonic() - started) / len(samples)
+
+            user, family = samples[0]
+            sql, params = query(user, family).query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN ' + sql, params)
+                plan = cursor.fetchall()[0][0]
+            self.stdout.write(
+                f'{label}: {elapsed * 1000:.3f} ms per lookup, '
+                f'plan: {plan.strip()}')
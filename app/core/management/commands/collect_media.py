@@ -0,0 +1,164 @@
+import datetime
+import os
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import ExpenseRecord, Family, ImageBlob, ImageUpload, \
+    UserProfile
+
+MEDIA_DIRECTORY = 'uploads'
+
+
+def stored_files(root, directory):
+    """
+    Yield the (name, stat) of every file under directory, ordered like
+    the byte order of their names
+
+    Entries are sorted one directory at a time, a directory by its name
+    followed by '/', so 'a.jpg' comes before the files in 'a/'.
+    """
+    try:
+        with os.scandir(os.path.join(root, directory)) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name + '/'
+                             if entry.is_dir() else entry.name)
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        name = f'{directory}/{entry.name}'
+        if entry.is_dir():
+            yield from stored_files(root, name)
+        else:
+            yield name, entry.stat()
+
+
+def referenced_names():
+    """
+    Yield every stored name referenced by an image field, its variants
+    or a spooled upload, in byte order, read through a server side
+    cursor
+    """
+    quote = connection.ops.quote_name
+    queries = []
+    for model in (ExpenseRecord, UserProfile, Family):
+        table = quote(model._meta.db_table)
+        for field in model.IMAGE_VARIANT_FIELDS:
+            column = quote(model._meta.get_field(field).column)
+            variants = quote(
+                model._meta.get_field(f'{field}_variants').column)
+            queries.append(f"SELECT {column} AS name FROM {table} "
+                           f"WHERE {column} <> ''")
+            queries.append(f'SELECT variant.value FROM {table}, '
+                           f'jsonb_each_text({table}.{variants}) variant')
+    column = quote(ImageUpload._meta.get_field('upload').column)
+    queries.append(f"SELECT {column} FROM "
+                   f"{quote(ImageUpload._meta.db_table)} "
+                   f"WHERE {column} <> ''")
+
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(f'SELECT name FROM ({" UNION ".join(queries)}) '
+                       f'referenced ORDER BY name COLLATE "C"')
+        for row in cursor:
+            yield row[0]
+
+
+class Command(BaseCommand):
+    # Django command to delete media no row references
+    help = ('Delete the files under MEDIA_ROOT that no image field, '
+            'variant or upload references, and unreferenced images')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report what would be deleted'
+        )
+        parser.add_argument(
+            '--grace-hours', type=float,
+            default=settings.MEDIA_GC_GRACE_HOURS,
+            help='Leave files and images changed more recently alone'
+        )
+        parser.add_argument(
+            '--rate', type=float, default=0,
+            help='Most deletions per second, 0 for no limit'
+        )
+        parser.add_argument(
+            '--recount', action='store_true',
+            help='Recompute the image reference counts first, run it '
+                 'while no images are uploaded'
+        )
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.delay = 1 / options['rate'] if options['rate'] else 0
+        cutoff = timezone.now() - datetime.timedelta(
+            hours=options['grace_hours'])
+        if options['recount'] and not self.dry_run:
+            # Repairs counts left behind by deletes that skipped them
+            ImageBlob.objects.recount()
+
+        files, freed, recent = self.collect_files(cutoff.timestamp())
+        images = self.collect_images(cutoff)
+
+        verb = 'Would delete' if self.dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {files} orphaned files ({freed} bytes) and {images} '
+            f'unreferenced images, {recent} recent files left alone'))
+
+    def collect_files(self, cutoff):
+        """
+        Merge the sorted files on disk with the sorted referenced names,
+        deleting the files missing from the latter
+        """
+        files = freed = recent = 0
+        referenced = referenced_names()
+        current = next(referenced, None)
+        for name, stat in stored_files(settings.MEDIA_ROOT,
+                                       MEDIA_DIRECTORY):
+            while current is not None and current < name:
+                current = next(referenced, None)
+            if current == name:
+                continue
+            if stat.st_mtime > cutoff:
+                recent += 1
+                continue
+            if self.dry_run or self.delete_file(name):
+                files += 1
+                freed += stat.st_size
+        return files, freed, recent
+
+    def delete_file(self, name):
+        """Delete an orphaned file unless an upload is reusing it"""
+        with transaction.atomic():
+            blob = ImageBlob.objects.select_for_update() \
+                .filter(name=name).first()
+            if blob is not None and blob.refs > 0:
+                return False
+            default_storage.delete(name)
+            if blob is not None:
+                blob.delete()
+        self.throttle()
+        return True
+
+    def collect_images(self, cutoff):
+        """Delete the images whose reference count has been 0 for long"""
+        unreferenced = ImageBlob.objects.filter(
+            refs__lte=0, updated_at__lt=cutoff
+        ).values_list('name', flat=True)
+        if self.dry_run:
+            return unreferenced.count()
+
+        collected = 0
+        for name in unreferenced.iterator():
+            if ImageBlob.objects.collect([name]):
+                collected += 1
+                self.throttle()
+        return collected
+
+    def throttle(self):
+        """Keep deletions within the requested rate"""
+        if self.delay:
+            time.sleep(self.delay)
@@ -0,0 +1,75 @@
+import os
+from collections import defaultdict
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from core.models import ExpenseRecord, Family, ImageBlob, UserProfile
+from core.storage import content_storage
+
+
+class Command(BaseCommand):
+    # Django command to move stored images to content addressed names
+    help = ('Rename the images under MEDIA_ROOT to the hash of their '
+            'content, merging identical files into one')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report what would be renamed and merged'
+        )
+
+    def handle(self, *args, **options):
+        users = defaultdict(list)
+        for model in (ExpenseRecord, UserProfile, Family):
+            for field in model.IMAGE_VARIANT_FIELDS:
+                rows = model.objects.exclude(**{f'{field}__isnull': True}) \
+                    .exclude(**{field: ''}).values_list('pk', field)
+                for pk, name in rows.iterator():
+                    users[name].append((model, pk, field))
+
+        renamed = merged = saved_bytes = 0
+        for name, rows in users.items():
+            if not content_storage.exists(name):
+                self.stdout.write(f'Missing file {name}, skipped')
+                continue
+            model, pk, field = rows[0]
+            upload_to = model._meta.get_field(field).upload_to
+            with content_storage.open(name) as content:
+                target = content_storage.content_name(
+                    upload_to(None, name), content)
+            if target == name:
+                continue
+
+            if content_storage.exists(target):
+                merged += 1
+                saved_bytes += content_storage.size(name)
+            else:
+                renamed += 1
+            if options['dry_run']:
+                continue
+
+            if content_storage.exists(target):
+                content_storage.delete(name)
+            else:
+                path = content_storage.path(target)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(content_storage.path(name), path)
+            for model, pk, field in rows:
+                self.repoint(model, pk, field, name, target)
+
+        if not options['dry_run']:
+            ImageBlob.objects.recount()
+        self.stdout.write(self.style.SUCCESS(
+            f'Renamed {renamed} and merged {merged} images, '
+            f'{saved_bytes} bytes saved'))
+
+    def repoint(self, model, pk, field, name, target):
+        """Point a row's image at target, rendering its variants again"""
+        instance = model.objects.filter(pk=pk, **{field: name}).first()
+        if instance is None:
+            return
+        for variant in getattr(instance, f'{field}_variants').values():
+            default_storage.delete(variant)
+        setattr(instance, field, target)
+        instance.save()
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from core.images import generate_variants
+from core.models import ExpenseRecord, Family, UserProfile
+
+
+class Command(BaseCommand):
+    # Django command to render the missing variants of stored images
+    help = 'Render thumbnail and medium variants of images without them'
+
+    def handle(self, *args, **options):
+        for model in (ExpenseRecord, UserProfile, Family):
+            for field in model.IMAGE_VARIANT_FIELDS:
+                missing = model.objects.exclude(**{f'{field}__isnull': True}) \
+                    .exclude(**{field: ''}) \
+                    .filter(**{f'{field}_variants': {}}) \
+                    .values_list('pk', field)
+                count = 0
+                for pk, name in missing.iterator():
+                    generate_variants(model, pk, field, name)
+                    count += 1
+                self.stdout.write(
+                    f'Rendered {model.__name__}.{field} variants of '
+                    f'{count} images')
+
+        self.stdout.write(self.style.SUCCESS('Image variants generated!'))
@@ -0,0 +1,63 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importer import RecordImporter, DEFAULT_COLUMNS
+from core.models import UserProfile
+
+
+class Command(BaseCommand):
+    # Django command to import expense records from a bank statement CSV
+    help = 'Import expense records for a user from a CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path')
+        parser.add_argument('--user', required=True,
+                            help='Email of the user owning the records')
+        parser.add_argument('--family', action='store_true',
+                            help="Attach the records to the user's family")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--date-format', default='%Y-%m-%d')
+        parser.add_argument('--encoding', default='utf-8-sig',
+                            help='Text encoding of the file')
+        parser.add_argument('--no-copy', action='store_true',
+                            help='Insert with bulk_create instead of COPY')
+        parser.add_argument(
+            '--column', action='append', default=[], metavar='FIELD=HEADER',
+            help='CSV header of a field (' + ', '.join(DEFAULT_COLUMNS) +
+                 '), may be repeated'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'User {options["user"]} does not exist')
+
+        family = None
+        if options['family']:
+            family = UserProfile.objects.select_related('family') \
+                .get(user=user).family
+
+        columns = {}
+        for mapping in options['column']:
+            field, _, header = mapping.partition('=')
+            if field not in DEFAULT_COLUMNS or not header:
+                raise CommandError(f'Invalid column mapping "{mapping}"')
+            columns[field] = header
+
+        importer = RecordImporter(
+            user, family=family, columns=columns,
+            batch_size=options['batch_size'],
+            date_format=options['date_format'],
+            use_copy=not options['no_copy']
+        )
+        with open(options['csv_path'], newline='',
+                  encoding=options['encoding']) as csvfile:
+            report = importer.run(csvfile)
+
+        for error in report['errors']:
+            self.stdout.write(f'Line {error["line"]}: {error["error"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {report["imported"]} of {report["rows"]} rows in '
+            f'{report["seconds"]}s ({report["rows_per_second"]} rows/sec)'
+        ))
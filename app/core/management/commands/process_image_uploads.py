@@ -0,0 +1,46 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import ImageUpload
+from core.uploads import expire_sessions, process_upload
+
+
+class Command(BaseCommand):
+    # Django command to finish uploads the worker pool did not get to
+    help = ('Process image uploads left pending, or stuck processing, by '
+            'a stopped worker and delete abandoned chunked uploads')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stale-minutes', type=int, default=10,
+            help='Minutes after which a processing upload is retried'
+        )
+        parser.add_argument(
+            '--session-hours', type=int,
+            default=settings.IMAGE_UPLOAD_SESSION_HOURS,
+            help='Hours after which an unfinished chunked upload is deleted'
+        )
+
+    def handle(self, *args, **options):
+        stale = timezone.now() - datetime.timedelta(
+            minutes=options['stale_minutes'])
+        retried = ImageUpload.objects.filter(
+            status=ImageUpload.PROCESSING, updated_at__lt=stale
+        ).update(status=ImageUpload.PENDING, updated_at=timezone.now())
+
+        pending = ImageUpload.objects.filter(status=ImageUpload.PENDING) \
+            .order_by('created_at').values_list('pk', flat=True)
+        count = 0
+        for pk in pending.iterator():
+            process_upload(pk)
+            count += 1
+
+        expired = expire_sessions(timezone.now() - datetime.timedelta(
+            hours=options['session_hours']))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {count} uploads, {retried} of them retried, and '
+            f'deleted {expired} abandoned chunked uploads'))
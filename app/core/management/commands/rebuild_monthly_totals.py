@@ -0,0 +1,40 @@
+from django.db import connection, transaction
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import ExpenseMonthlyTotal, ExpenseRecord
+
+
+class Command(BaseCommand):
+    # Django command to rebuild and verify the monthly expense totals
+    help = 'Rebuild the monthly expense totals from the expense records'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify-only', action='store_true',
+            help='Only compare the stored totals against the records'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # Hold off record writes so the rebuild sees a stable set
+                table = ExpenseRecord._meta.db_table
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LOCK TABLE "{table}" IN SHARE MODE')
+
+            if not options['verify_only']:
+                self.stdout.write('Rebuilding monthly totals ...')
+                ExpenseMonthlyTotal.objects.rebuild()
+
+            mismatches = ExpenseMonthlyTotal.objects.mismatches()
+
+        for key, stored, expected in mismatches:
+            self.stdout.write(
+                f'Mismatch for (user, family, category, month) {key}: '
+                f'stored {stored}, expected {expected}'
+            )
+        if mismatches:
+            raise CommandError(
+                f'{len(mismatches)} monthly totals do not match the records')
+
+        self.stdout.write(self.style.SUCCESS('Monthly totals verified!'))
@@ -0,0 +1,132 @@
+import os
+import shutil
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.images import variant_name
+from core.models import ExpenseRecord, Family, ImageBlob, UserProfile
+from core.storage import content_storage, sharded_name_regex
+from core.versions import bump_versions, record_scopes
+
+
+class Command(BaseCommand):
+    # Django command to move stored images into the sharded layout
+    help = ('Move the images stored in the flat uploads/record/ directory '
+            'into the hash sharded record, family and user directories')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Rows moved and committed together'
+        )
+
+    def handle(self, *args, **options):
+        moved = 0
+        for model in (ExpenseRecord, UserProfile, Family):
+            for field in model.IMAGE_VARIANT_FIELDS:
+                moved += self.shard_field(model, field,
+                                          options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Moved {moved} images'))
+
+    def shard_field(self, model, field, batch_size):
+        """
+        Move the images of field in batches of rows, each committed on
+        its own so an interrupted run picks up where it stopped
+        """
+        upload_to = model._meta.get_field(field).upload_to
+        directory = os.path.dirname(upload_to(None, 'image'))
+        pending = model.objects.exclude(**{f'{field}__isnull': True}) \
+            .exclude(**{field: ''}) \
+            .exclude(**{f'{field}__regex': sharded_name_regex(directory)}) \
+            .order_by('pk').values_list('pk', field)
+
+        moved = last = 0
+        while True:
+            batch = list(pending.filter(pk__gt=last)[:batch_size])
+            if not batch:
+                break
+            last = batch[-1][0]
+            moved += self.move_batch(model, field, directory, batch)
+            self.stdout.write(f'{model.__name__}.{field}: moved {moved}')
+        return moved
+
+    def move_batch(self, model, field, directory, batch):
+        """Point a batch of rows at the sharded copies of their images"""
+        targets = {}
+        for pk, name in batch:
+            if name not in targets:
+                targets[name] = self.place(directory, name)
+
+        moved = []
+        with transaction.atomic():
+            for pk, name in batch:
+                target = targets[name]
+                if target is None:
+                    continue
+                variants = {
+                    variant: variant_name(target, variant)
+                    for variant in settings.IMAGE_VARIANTS
+                    if content_storage.exists(variant_name(target, variant))
+                }
+                # Queryset updates keep the rendered variants
+                if model.objects.filter(pk=pk, **{field: name}).update(**{
+                        field: target, f'{field}_variants': variants}):
+                    moved.append((pk, name, target))
+
+            # The old files go once the commit leaves them unreferenced
+            ImageBlob.objects.release(name for pk, name, target in moved)
+            ImageBlob.objects.acquire(target for pk, name, target in moved)
+            self.bump(model, [pk for pk, name, target in moved])
+        return len(moved)
+
+    def place(self, directory, name):
+        """
+        Link the image and its variants at their sharded names, returning
+        the new name of the image
+
+        The old files stay until no row references them, rows of other
+        kinds or later batches may still use them.
+        """
+        if not content_storage.exists(name):
+            self.stdout.write(f'Missing file {name}, skipped')
+            return None
+        with content_storage.open(name) as content:
+            target = content_storage.content_name(
+                os.path.join(directory, os.path.basename(name)), content)
+
+        self.link(name, target)
+        for variant in settings.IMAGE_VARIANTS:
+            if content_storage.exists(variant_name(name, variant)):
+                self.link(variant_name(name, variant),
+                          variant_name(target, variant))
+        return target
+
+    def link(self, name, target):
+        """Hard link name at target, copying across file systems"""
+        if content_storage.exists(target):
+            return
+        source = content_storage.path(name)
+        path = content_storage.path(target)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.link(source, path)
+        except OSError:
+            shutil.copy2(source, path)
+
+    def bump(self, model, pks):
+        """Invalidate the cached responses showing the moved images"""
+        if model is ExpenseRecord:
+            rows = ExpenseRecord.objects.filter(pk__in=pks) \
+                .values_list('user_id', 'family_id')
+            bump_versions('records', record_scopes(rows))
+            return
+        if model is Family:
+            rows = UserProfile.objects.filter(family_id__in=pks) \
+                .values_list('user_id', 'family_id')
+            bump_versions('profile', [f'family:{pk}' for pk in pks])
+        else:
+            rows = UserProfile.objects.filter(pk__in=pks) \
+                .values_list('user_id', 'family_id')
+        bump_versions('profile', record_scopes(rows))
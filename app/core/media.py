@@ -0,0 +1,182 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse, \
+    HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.static import was_modified_since
+from rest_framework import permissions, status
+from rest_framework.views import APIView
+
+from core.authentication import CachedTokenAuthentication, \
+    get_user_profile
+from core.storage import content_storage
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+RANGE_CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    """The requested byte range starts past the end of the file"""
+
+
+def image_prefix(name):
+    """Return the name prefix an image shares with its variants"""
+    directory, filename = os.path.split(name)
+    return os.path.join(directory, filename.split('.')[0]) + '.'
+
+
+def can_view(request, name):
+    """
+    Return whether the requester sees a record, family or profile whose
+    image is name or has name as a variant
+    """
+    from core.models import ExpenseRecord, Family, UserProfile
+
+    prefix = image_prefix(name)
+    family_id = get_user_profile(request).family_id
+    visible = Q(user=request.user) | Q(family_id=family_id)
+    return ExpenseRecord.objects \
+        .filter(visible, image__startswith=prefix).exists() or \
+        Family.objects \
+        .filter(pk=family_id, avatar__startswith=prefix).exists() or \
+        UserProfile.objects \
+        .filter(visible, avatar__startswith=prefix).exists()
+
+
+def byte_range(request, size, mtime):
+    """
+    Return the (first, last) byte of the single range requested, or None
+    to send the whole file
+
+    Malformed and multiple ranges are ignored, as is a range whose
+    If-Range date does not match the file's.
+    """
+    header = request.META.get('HTTP_RANGE')
+    if not header:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and parse_http_date_safe(if_range) != int(mtime):
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+
+    first, last = match.groups()
+    if not first:
+        # Suffix range, the last n bytes
+        if not int(last):
+            raise RangeNotSatisfiable
+        return max(size - int(last), 0), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first >= size:
+        raise RangeNotSatisfiable
+    if last < first:
+        return None
+    return first, last
+
+
+def read_range(path, first, last):
+    """Yield the bytes first through last of the file in chunks"""
+    with open(path, 'rb') as f:
+        f.seek(first)
+        remaining = last - first + 1
+        while remaining > 0:
+            chunk = f.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def sendfile_response(name, content_type):
+    """Return an empty response telling the front server to send name"""
+    response = HttpResponse(content_type=content_type)
+    header = settings.MEDIA_SENDFILE_HEADER
+    if header.lower() == 'x-accel-redirect':
+        response[header] = quote(settings.MEDIA_ACCEL_REDIRECT_PREFIX + name)
+    else:
+        response[header] = content_storage.path(name)
+    return response
+
+
+def file_response(request, name, content_type):
+    """
+    Return the file, or the requested byte range of it, answering
+    If-Modified-Since with 304
+    """
+    path = content_storage.path(name)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise Http404
+
+    headers = {
+        'Last-Modified': http_date(stat.st_mtime),
+        'Accept-Ranges': 'bytes',
+    }
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                              stat.st_mtime, stat.st_size):
+        response = HttpResponseNotModified()
+    else:
+        try:
+            requested = byte_range(request, stat.st_size, stat.st_mtime)
+        except RangeNotSatisfiable:
+            response = HttpResponse(
+                status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+
+        if requested is None:
+            response = FileResponse(open(path, 'rb'),
+                                    content_type=content_type)
+        else:
+            first, last = requested
+            response = StreamingHttpResponse(
+                read_range(path, first, last),
+                status=status.HTTP_206_PARTIAL_CONTENT,
+                content_type=content_type
+            )
+            response['Content-Range'] = f'bytes {first}-{last}/' \
+                                        f'{stat.st_size}'
+            response['Content-Length'] = last - first + 1
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+class MediaView(APIView):
+    """
+    Serve an image under MEDIA_ROOT to users who can see the record,
+    family or profile it belongs to
+
+    With MEDIA_SENDFILE_HEADER set the front server sends the file, and
+    handles ranges and conditional requests, so the worker is free again
+    as soon as the access check is done.
+    """
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def perform_content_negotiation(self, request, force=False):
+        # Files are sent whatever the Accept header asks for
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, name):
+        if os.path.normpath(name) != name or name.startswith('/') or \
+                not can_view(request, name):
+            raise Http404
+
+        content_type = mimetypes.guess_type(name)[0] or \
+            'application/octet-stream'
+        if settings.MEDIA_SENDFILE_HEADER:
+            response = sendfile_response(name, content_type)
+        else:
+            response = file_response(request, name, content_type)
+        response['Cache-Control'] = \
+            f'private, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+        return response
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.25 on 2026-10-17 17:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_family_avatar'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='expenserecord',
+            name='family',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.family'),
+        ),
+        migrations.AlterField(
+            model_name='expenserecord',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='expenserecord',
+            index=models.Index(fields=['user', '-date', '-id'], name='record_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenserecord',
+            index=models.Index(fields=['family', '-date', '-id'], name='record_family_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenserecord',
+            index=models.Index(condition=models.Q(('family__isnull', True)), fields=['user', '-date', '-id'], name='record_personal_date_idx'),
+        ),
+    ]
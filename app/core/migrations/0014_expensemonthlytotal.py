@@ -0,0 +1,54 @@
+# Generated by Django 3.2.25 on 2026-10-17 17:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models.functions import TruncMonth
+
+
+def populate_monthly_totals(apps, schema_editor):
+    ExpenseRecord = apps.get_model('core', 'ExpenseRecord')
+    ExpenseMonthlyTotal = apps.get_model('core', 'ExpenseMonthlyTotal')
+    rows = ExpenseRecord.objects.annotate(month=TruncMonth('date')).values(
+        'user_id', 'family_id', 'category_id', 'month').annotate(
+        total=models.Sum('amount'), count=models.Count('id')).order_by()
+    ExpenseMonthlyTotal.objects.bulk_create(
+        (ExpenseMonthlyTotal(**row) for row in rows.iterator()),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_expenserecord_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseMonthlyTotal',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.category')),
+                ('family', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.family')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='expensemonthlytotal',
+            index=models.Index(fields=['family', 'month'], name='monthly_total_family_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='expensemonthlytotal',
+            constraint=models.UniqueConstraint(condition=models.Q(('family__isnull', False)), fields=('user', 'family', 'category', 'month'), name='monthly_total_family_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='expensemonthlytotal',
+            constraint=models.UniqueConstraint(condition=models.Q(('family__isnull', True)), fields=('user', 'category', 'month'), name='monthly_total_personal_uniq'),
+        ),
+        migrations.RunPython(populate_monthly_totals,
+                             migrations.RunPython.noop),
+    ]
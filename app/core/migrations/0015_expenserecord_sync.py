@@ -0,0 +1,106 @@
+# Generated by Django 3.2.25 on 2026-10-17 17:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Every insert and update stamps the writing transaction id, every delete
+# and every move out of a user/family scope leaves a tombstone
+TRACK_CHANGES_SQL = '''
+CREATE FUNCTION core_expenserecord_stamp() RETURNS trigger AS $$
+BEGIN
+    NEW.change_txid := txid_current();
+    NEW.updated_at := now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION core_expenserecord_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO core_expenserecordtombstone
+        (record_id, user_id, family_id, change_txid, deleted_at)
+    VALUES (OLD.id, OLD.user_id, OLD.family_id, txid_current(), now());
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_expenserecord_stamp
+    BEFORE INSERT OR UPDATE ON core_expenserecord
+    FOR EACH ROW EXECUTE PROCEDURE core_expenserecord_stamp();
+
+CREATE TRIGGER core_expenserecord_delete
+    AFTER DELETE ON core_expenserecord
+    FOR EACH ROW EXECUTE PROCEDURE core_expenserecord_tombstone();
+
+CREATE TRIGGER core_expenserecord_move
+    AFTER UPDATE ON core_expenserecord
+    FOR EACH ROW
+    WHEN (OLD.user_id IS DISTINCT FROM NEW.user_id OR
+          OLD.family_id IS DISTINCT FROM NEW.family_id)
+    EXECUTE PROCEDURE core_expenserecord_tombstone();
+'''
+
+UNTRACK_CHANGES_SQL = '''
+DROP TRIGGER core_expenserecord_move ON core_expenserecord;
+DROP TRIGGER core_expenserecord_delete ON core_expenserecord;
+DROP TRIGGER core_expenserecord_stamp ON core_expenserecord;
+DROP FUNCTION core_expenserecord_tombstone();
+DROP FUNCTION core_expenserecord_stamp();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_expensemonthlytotal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseRecordTombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('record_id', models.IntegerField()),
+                ('change_txid', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='expenserecord',
+            name='change_txid',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='expenserecord',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='expenserecord',
+            index=models.Index(fields=['user', 'change_txid', 'id'], name='record_user_change_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenserecord',
+            index=models.Index(fields=['family', 'change_txid', 'id'], name='record_family_change_idx'),
+        ),
+        migrations.AddField(
+            model_name='expenserecordtombstone',
+            name='family',
+            field=models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.family'),
+        ),
+        migrations.AddField(
+            model_name='expenserecordtombstone',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='expenserecordtombstone',
+            index=models.Index(fields=['user', 'change_txid', 'id'], name='tombstone_user_change_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenserecordtombstone',
+            index=models.Index(fields=['family', 'change_txid', 'id'], name='tombstone_family_change_idx'),
+        ),
+        migrations.RunSQL(TRACK_CHANGES_SQL, UNTRACK_CHANGES_SQL),
+    ]
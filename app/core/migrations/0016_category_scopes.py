@@ -0,0 +1,35 @@
+# Generated by Django 3.2.25 on 2026-10-17 17:59
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+# Same scopes as Category.save derives with core.versions.category_scopes
+POPULATE_SCOPES_SQL = '''
+UPDATE core_category SET scopes = array_remove(ARRAY[
+    CASE WHEN family_id IS NOT NULL THEN 'family:' || family_id END,
+    CASE WHEN "isPublic" THEN 'public' END,
+    CASE WHEN user_id IS NOT NULL THEN 'user:' || user_id END
+]::varchar(32)[], NULL)
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_expenserecord_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='scopes',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=32), default=list, editable=False, size=None),
+        ),
+        migrations.RunSQL(POPULATE_SCOPES_SQL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='category',
+            index=django.contrib.postgres.indexes.GinIndex(fastupdate=False, fields=['scopes'], name='category_scopes_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-17 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_category_scopes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expenserecord',
+            name='image_variants',
+            field=models.JSONField(default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='family',
+            name='avatar_variants',
+            field=models.JSONField(default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_variants',
+            field=models.JSONField(default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 3.2.25 on 2026-10-17 18:09
+
+import core.models
+import core.storage
+from django.db import migrations, models
+
+
+def count_image_references(apps, schema_editor):
+    ImageBlob = apps.get_model('core', 'ImageBlob')
+    counts = {}
+    for model, field in (('ExpenseRecord', 'image'),
+                         ('UserProfile', 'avatar'), ('Family', 'avatar')):
+        rows = apps.get_model('core', model).objects \
+            .exclude(**{f'{field}__isnull': True}).exclude(**{field: ''}) \
+            .values(field).annotate(refs=models.Count('pk')).order_by()
+        for row in rows:
+            counts[row[field]] = counts.get(row[field], 0) + row['refs']
+    ImageBlob.objects.bulk_create(
+        ImageBlob(name=name, refs=refs) for name, refs in counts.items())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('refs', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='expenserecord',
+            name='image',
+            field=models.ImageField(null=True, storage=core.storage.ContentAddressedStorage(), upload_to=core.models.record_image_file_path),
+        ),
+        migrations.AlterField(
+            model_name='family',
+            name='avatar',
+            field=models.ImageField(null=True, storage=core.storage.ContentAddressedStorage(), upload_to=core.models.record_image_file_path),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='avatar',
+            field=models.ImageField(null=True, storage=core.storage.ContentAddressedStorage(), upload_to=core.models.record_image_file_path),
+        ),
+        migrations.RunPython(count_image_references,
+                             migrations.RunPython.noop),
+    ]
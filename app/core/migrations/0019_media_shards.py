@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-17 18:12
+
+import core.models
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_image_blobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='family',
+            name='avatar',
+            field=models.ImageField(null=True, storage=core.storage.ContentAddressedStorage(), upload_to=core.models.family_avatar_file_path),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='avatar',
+            field=models.ImageField(null=True, storage=core.storage.ContentAddressedStorage(), upload_to=core.models.user_avatar_file_path),
+        ),
+    ]
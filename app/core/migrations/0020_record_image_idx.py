@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-17 18:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_media_shards'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expenserecord',
+            index=models.Index(fields=['image'], name='record_image_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_imageupload_chunks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageblob',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
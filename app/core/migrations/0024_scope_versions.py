@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-17 18:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_imageblob_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScopeVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=16)),
+                ('scope', models.CharField(max_length=32)),
+                ('version', models.CharField(max_length=32)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='scopeversion',
+            constraint=models.UniqueConstraint(fields=('kind', 'scope'), name='scope_version_uniq'),
+        ),
+    ]
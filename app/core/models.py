@@ -1,18 +1,52 @@
 import uuid
 import os
-from django.db import models
+from collections import defaultdict
+from decimal import Decimal
+from django.db import models, transaction, IntegrityError
+from django.db.models.functions import TruncMonth
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
                                             PermissionsMixin
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.utils import timezone
 
+from core.authentication import token_cache
+from core.images import ImageVariantsMixin, delete_image
+from core.storage import content_storage
+from core.versions import bump_versions, category_scopes, record_scopes
 
-def record_image_file_path(instance, filename):
-    """Generate file path for new record image"""
+
+def image_file_path(directory, filename):
+    """
+    Generate file path for a new image in directory, the content storage
+    then renames it to its hash under the directory's shards
+    """
     ext = filename.split('.')[-1]
     filename = f'{uuid.uuid4()}.{ext}'
 
-    return os.path.join('uploads/record/', filename)
+    return os.path.join(directory, filename)
+
+
+def record_image_file_path(instance, filename):
+    """Generate file path for new record image"""
+    return image_file_path('uploads/record/', filename)
+
+
+def family_avatar_file_path(instance, filename):
+    """Generate file path for new family avatar"""
+    return image_file_path('uploads/family/', filename)
+
+
+def user_avatar_file_path(instance, filename):
+    """Generate file path for new user avatar"""
+    return image_file_path('uploads/user/', filename)
+
+
+def spooled_upload_file_path(instance, filename):
+    """Generate file path for an upload waiting to be processed"""
+    return image_file_path('uploads/spool/', filename)
 
 
 class UserManager(BaseUserManager):
@@ -48,26 +82,76 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     USERNAME_FIELD = 'email'
 
+    def save(self, *args, **kwargs):
+        super(User, self).save(*args, **kwargs)
+        # Deactivation and password changes must not outlive cached auth
+        token_cache.delete_users([self.pk])
+        # Names are nested in the family's record lists as well
+        family_ids = UserProfile.objects.filter(user_id=self.pk) \
+            .values_list('family_id', flat=True)
+        bump_versions('profile', [f'user:{self.pk}'] +
+                      [f'family:{family_id}' for family_id in family_ids])
+
 
-class Family(models.Model):
+class Family(ImageVariantsMixin, models.Model):
     """Family of users"""
     name = models.CharField(max_length=255)
-    avatar = models.ImageField(null=True, upload_to=record_image_file_path)
+    avatar = models.ImageField(null=True, upload_to=family_avatar_file_path,
+                               storage=content_storage)
+    avatar_variants = models.JSONField(default=dict, editable=False)
+
+    IMAGE_VARIANT_FIELDS = ('avatar',)
+
+    def save(self, *args, **kwargs):
+        super(Family, self).save(*args, **kwargs)
+        member_ids = UserProfile.objects.filter(family_id=self.pk) \
+            .values_list('user_id', flat=True)
+        # Members are authenticated together with their family
+        token_cache.delete_users(member_ids)
+        bump_versions('profile', [f'family:{self.pk}'] +
+                      [f'user:{user_id}' for user_id in member_ids])
 
     def __str__(self):
         return self.name
 
 
-class UserProfile(models.Model):
+class UserProfile(ImageVariantsMixin, models.Model):
     """Extending user model with a user profile model"""
     user = models.OneToOneField(get_user_model(), on_delete=models.CASCADE)
     family = models.ForeignKey(Family, on_delete=models.CASCADE)
-    avatar = models.ImageField(null=True, upload_to=record_image_file_path)
+    avatar = models.ImageField(null=True, upload_to=user_avatar_file_path,
+                               storage=content_storage)
+    avatar_variants = models.JSONField(default=dict, editable=False)
+
+    IMAGE_VARIANT_FIELDS = ('avatar',)
+
+    def save(self, *args, **kwargs):
+        # Read before saving, the old family has to be bumped as well
+        stored = list(UserProfile.objects.filter(pk=self.pk)
+                      .values_list('user_id', 'family_id')) \
+            if self.pk else []
+        super(UserProfile, self).save(*args, **kwargs)
+        scopes = stored + [(self.user_id, self.family_id)]
+        token_cache.delete_users(user_id for user_id, family_id in scopes)
+        bump_versions('profile', record_scopes(scopes))
 
     def __str__(self):
         return self.user.name
 
 
+class CategoryManager(models.Manager):
+
+    def visible(self, user_id, family_id):
+        """
+        Return the categories that are public or belong to the user or
+        the family, one lookup on the scopes index
+        """
+        scopes = ['public', f'user:{user_id}']
+        if family_id:
+            scopes.append(f'family:{family_id}')
+        return self.filter(scopes__overlap=scopes)
+
+
 class Category(models.Model):
     """Category for expenses"""
     name = models.CharField(max_length=255)
@@ -79,29 +163,554 @@ class Category(models.Model):
     )
     family = models.ForeignKey(Family, on_delete=models.CASCADE,
                                blank=True, null=True)
+    # 'public', 'user:<id>' and/or 'family:<id>', derived on save
+    scopes = ArrayField(models.CharField(max_length=32), default=list,
+                        editable=False)
+
+    objects = CategoryManager()
+
+    VERSION_FIELDS = ('isPublic', 'user_id', 'family_id')
+
+    class Meta:
+        indexes = [
+            # Categories are written rarely, keep lookups off the GIN
+            # pending list
+            GinIndex(fields=['scopes'], name='category_scopes_idx',
+                     fastupdate=False),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.user:
             self.user = None
         if not self.family:
             self.family = None
+        stored = Category.objects.filter(pk=self.pk) \
+            .values_list('name', *self.VERSION_FIELDS) if self.pk else []
+        self.scopes = sorted(category_scopes(
+            [(self.isPublic, self.user_id, self.family_id)]))
+        scopes = category_scopes([row[1:] for row in stored] + [
+            (self.isPublic, self.user_id, self.family_id)])
+        renamed = any(row[0] != self.name for row in stored)
         super(Category, self).save(*args, **kwargs)
+        bump_versions('categories', scopes)
+        if renamed:
+            # Records show the name, also those of users outside the
+            # category's scopes, such as other members of its family
+            owners = ExpenseRecord.objects.filter(category=self) \
+                .values_list('user_id', 'family_id').distinct()
+            bump_versions('records', record_scopes(owners))
+
+    def delete(self, *args, **kwargs):
+        # Records in the category are deleted with it by the cascade
+        owners = ExpenseRecord.objects.filter(category=self) \
+            .values_list('user_id', 'family_id').distinct()
+        scopes = record_scopes(owners)
+        result = super(Category, self).delete(*args, **kwargs)
+        bump_versions('records', scopes)
+        bump_versions('categories', category_scopes([
+            (self.isPublic, self.user_id, self.family_id)]))
+        return result
 
     def __str__(self):
         return self.name
 
 
-class ExpenseRecord(models.Model):
+class ExpenseRecordManager(models.Manager):
+
+    def create_many(self, records, batch_size=None):
+        """Bulk insert records, keeping the monthly totals in sync"""
+        with transaction.atomic():
+            records = self.bulk_create(records, batch_size=batch_size)
+            deltas = [record.rollup_key() for record in records]
+            ExpenseMonthlyTotal.objects.apply(deltas)
+            bump_versions('records', record_scopes(deltas))
+        return records
+
+    def update_many(self, records, **changes):
+        """
+        Apply changes to a record queryset with one UPDATE, keeping the
+        monthly totals in sync
+        """
+        with transaction.atomic():
+            records = self.locked(records)
+            before = ExpenseMonthlyTotal.objects.deltas(records, sign=-1)
+            count = records.update(**changes)
+            after = ExpenseMonthlyTotal.objects.deltas(records)
+            ExpenseMonthlyTotal.objects.apply(before + after)
+            bump_versions('records', record_scopes(before + after))
+        return count
+
+    def delete_many(self, records):
+        """
+        Delete a record queryset with one DELETE, keeping the monthly
+        totals in sync
+        """
+        with transaction.atomic():
+            records = self.locked(records)
+            before = ExpenseMonthlyTotal.objects.deltas(records, sign=-1)
+            # Their images are released by the post_delete handler
+            count, _ = records.delete()
+            ExpenseMonthlyTotal.objects.apply(before)
+            bump_versions('records', record_scopes(before))
+        return count
+
+    def locked(self, records):
+        """Lock the rows of records, returning a queryset of just them"""
+        pks = list(records.select_for_update().order_by('pk')
+                   .values_list('pk', flat=True))
+        return self.filter(pk__in=pks)
+
+
+class ExpenseRecord(ImageVariantsMixin, models.Model):
     """record for each expense"""
+    # user and family lookups are served by the composite indexes below
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_index=False
     )
     family = models.ForeignKey(Family, on_delete=models.CASCADE,
-                               blank=True, null=True)
+                               blank=True, null=True, db_index=False)
     category = models.ForeignKey(Category, on_delete=models.CASCADE,
                                  blank=False, null=False)
     date = models.DateField(blank=False)
     amount = models.DecimalField(max_digits=6, decimal_places=2)
     notes = models.CharField(max_length=255, blank=True)
-    image = models.ImageField(null=True, upload_to=record_image_file_path)
+    image = models.ImageField(null=True, upload_to=record_image_file_path,
+                              storage=content_storage)
+    image_variants = models.JSONField(default=dict, editable=False)
+    # Both are also set by a database trigger on every insert and update,
+    # so set-based updates and COPY imports are tracked as well
+    updated_at = models.DateTimeField(auto_now=True)
+    change_txid = models.BigIntegerField(default=0, editable=False)
+
+    objects = ExpenseRecordManager()
+
+    IMAGE_VARIANT_FIELDS = ('image',)
+    ROLLUP_FIELDS = ('user_id', 'family_id', 'category_id', 'date', 'amount')
+
+    class Meta:
+        # One index per record scope, each matching the (-date, -id)
+        # listing order so scope + date range + sort is one range scan
+        indexes = [
+            models.Index(fields=['user', '-date', '-id'],
+                         name='record_user_date_idx'),
+            models.Index(fields=['family', '-date', '-id'],
+                         name='record_family_date_idx'),
+            models.Index(fields=['user', '-date', '-id'],
+                         name='record_personal_date_idx',
+                         condition=models.Q(family__isnull=True)),
+            models.Index(fields=['user', 'change_txid', 'id'],
+                         name='record_user_change_idx'),
+            models.Index(fields=['family', 'change_txid', 'id'],
+                         name='record_family_change_idx'),
+            # Prefix lookups of an image and its variants by media access
+            models.Index(fields=['image'], name='record_image_idx',
+                         opclasses=['varchar_pattern_ops']),
+        ]
+
+    def rollup_key(self):
+        """Return the monthly total delta this record contributes"""
+        date = self._meta.get_field('date').to_python(self.date)
+        amount = self._meta.get_field('amount').to_python(self.amount)
+        return (self.user_id, self.family_id, self.category_id,
+                date, amount, 1)
+
+    def locked_rollup_key(self):
+        """Return the stored record's monthly total delta, locking the row"""
+        stored = ExpenseRecord.objects.select_for_update() \
+            .filter(pk=self.pk).values_list(*self.ROLLUP_FIELDS).first()
+        return stored and stored + (1,)
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            deltas = []
+            if self.pk:
+                stored = self.locked_rollup_key()
+                if stored:
+                    deltas.append(negate_rollup_key(stored))
+            super(ExpenseRecord, self).save(*args, **kwargs)
+            deltas.append(self.rollup_key())
+            ExpenseMonthlyTotal.objects.apply(deltas)
+            bump_versions('records', record_scopes(deltas))
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            stored = self.locked_rollup_key()
+            result = super(ExpenseRecord, self).delete(*args, **kwargs)
+            if stored:
+                ExpenseMonthlyTotal.objects.apply(
+                    [negate_rollup_key(stored)])
+                bump_versions('records', record_scopes([stored]))
+        return result
+
+
+class ExpenseRecordTombstone(models.Model):
+    """
+    Deleted record, or record moved out of a user/family scope, written
+    by a database trigger so delta syncs can report it
+    """
+    record_id = models.IntegerField()
+    # No constraints, tombstones outlive the users and families they name
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name='+'
+    )
+    family = models.ForeignKey(Family, on_delete=models.DO_NOTHING,
+                               db_constraint=False, db_index=False,
+                               blank=True, null=True, related_name='+')
+    change_txid = models.BigIntegerField()
+    deleted_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'change_txid', 'id'],
+                         name='tombstone_user_change_idx'),
+            models.Index(fields=['family', 'change_txid', 'id'],
+                         name='tombstone_family_change_idx'),
+        ]
+
+
+def negate_rollup_key(key):
+    """Return the delta that undoes a record's monthly total delta"""
+    user_id, family_id, category_id, date, amount, count = key
+    return (user_id, family_id, category_id, date, -amount, -count)
+
+
+class ExpenseMonthlyTotalManager(models.Manager):
+
+    def from_records(self, records):
+        """Return monthly total values computed from a record queryset"""
+        return records.annotate(month=TruncMonth('date')).values(
+            'user_id', 'family_id', 'category_id', 'month').annotate(
+            total=models.Sum('amount'),
+            count=models.Count('id')).order_by()
+
+    def deltas(self, records, sign=1):
+        """Return the monthly total deltas of a record queryset"""
+        return [(row['user_id'], row['family_id'], row['category_id'],
+                 row['month'], sign * row['total'], sign * row['count'])
+                for row in self.from_records(records)]
+
+    def rebuild(self):
+        """Replace every monthly total with one computed from records"""
+        with transaction.atomic():
+            self.all().delete()
+            rows = self.from_records(ExpenseRecord.objects.all())
+            self.bulk_create(
+                (self.model(**row) for row in rows.iterator()),
+                batch_size=1000
+            )
+
+    def mismatches(self):
+        """Return the (key, stored, expected) totals that disagree"""
+        def keyed(rows):
+            return {(row['user_id'], row['family_id'], row['category_id'],
+                     row['month']): (row['total'], row['count'])
+                    for row in rows}
+
+        expected = keyed(self.from_records(ExpenseRecord.objects.all()))
+        stored = keyed(self.filter(count__gt=0).values(
+            'user_id', 'family_id', 'category_id', 'month',
+            'total', 'count'))
+
+        return [(key, stored.get(key), expected.get(key))
+                for key in set(expected) | set(stored)
+                if stored.get(key) != expected.get(key)]
+
+    def apply(self, deltas):
+        """
+        Add (user_id, family_id, category_id, date, amount, count) deltas
+        to the matching monthly totals, creating missing rows
+        """
+        combined = defaultdict(lambda: [Decimal('0'), 0])
+        for user_id, family_id, category_id, date, amount, count in deltas:
+            key = (user_id, family_id, category_id, date.replace(day=1))
+            combined[key][0] += amount
+            combined[key][1] += count
+
+        # Fixed lock order so concurrent writers cannot deadlock
+        for key in sorted(combined, key=lambda k: (k[0], k[1] or 0,
+                                                   k[2], k[3])):
+            amount, count = combined[key]
+            if amount or count:
+                self._add(key, amount, count)
+
+    def _add(self, key, amount, count):
+        user_id, family_id, category_id, month = key
+        lookup = {'user_id': user_id, 'family_id': family_id,
+                  'category_id': category_id, 'month': month}
+        changes = {'total': models.F('total') + amount,
+                   'count': models.F('count') + count}
+
+        if self.filter(**lookup).update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                self.create(total=amount, count=count, **lookup)
+        except IntegrityError:
+            # Created by a concurrent writer since the update above
+            self.filter(**lookup).update(**changes)
+
+
+class ExpenseMonthlyTotal(models.Model):
+    """
+    Rollup of expense records per user, family, category and month
+
+    Kept in sync by ExpenseRecord.save and ExpenseRecord.delete. The
+    all/personal/family record scopes are unions of these rows, so one
+    rollup serves every summary scope.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    family = models.ForeignKey(Family, on_delete=models.CASCADE,
+                               blank=True, null=True)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    month = models.DateField()
+    total = models.DecimalField(max_digits=14, decimal_places=2,
+                                default=0)
+    count = models.IntegerField(default=0)
+
+    objects = ExpenseMonthlyTotalManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'family', 'category', 'month'],
+                condition=models.Q(family__isnull=False),
+                name='monthly_total_family_uniq'),
+            models.UniqueConstraint(
+                fields=['user', 'category', 'month'],
+                condition=models.Q(family__isnull=True),
+                name='monthly_total_personal_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['family', 'month'],
+                         name='monthly_total_family_idx'),
+        ]
+
+
+class ImageBlobManager(models.Manager):
+
+    def acquire(self, names):
+        """Count one more reference to each stored image name"""
+        for name in sorted(names):
+            if self.filter(name=name).update(refs=models.F('refs') + 1,
+                                             updated_at=timezone.now()):
+                continue
+            try:
+                with transaction.atomic():
+                    self.create(name=name, refs=1)
+            except IntegrityError:
+                # Created by a concurrent writer since the update above
+                self.filter(name=name).update(refs=models.F('refs') + 1,
+                                              updated_at=timezone.now())
+
+    def hold(self, name):
+        """
+        Lock the blob of an already stored file until the transaction
+        ends, so collect() waits for the reference about to be acquired
+        """
+        if self.filter(name=name).update(updated_at=timezone.now()):
+            return
+        try:
+            with transaction.atomic():
+                self.create(name=name, refs=0)
+        except IntegrityError:
+            self.filter(name=name).update(updated_at=timezone.now())
+
+    def release(self, names):
+        """
+        Count one reference less to each stored image name, collecting
+        the files left unreferenced once the transaction commits
+        """
+        counts = defaultdict(int)
+        for name in names:
+            counts[name] += 1
+        for name in sorted(counts):
+            self.filter(name=name).update(
+                refs=models.F('refs') - counts[name],
+                updated_at=timezone.now())
+        if counts:
+            transaction.on_commit(lambda: self.collect(sorted(counts)))
+
+    def collect(self, names):
+        """
+        Delete the files, and their variants, of the names no row
+        references, returning how many were deleted
+
+        Each blob is locked first: an upload of the same bytes holds it
+        from storing until its reference is counted, and is then either
+        waited for or finds the file gone and writes it again.
+        """
+        collected = 0
+        for name in names:
+            with transaction.atomic():
+                blob = self.select_for_update() \
+                    .filter(name=name, refs__lte=0).first()
+                if blob is None:
+                    continue
+                delete_image(name)
+                blob.delete()
+                collected += 1
+        return collected
+
+    def references(self):
+        """Return the reference count of every image name in use"""
+        counts = defaultdict(int)
+        for model in (ExpenseRecord, UserProfile, Family):
+            for field in model.IMAGE_VARIANT_FIELDS:
+                rows = model.objects.exclude(**{f'{field}__isnull': True}) \
+                    .exclude(**{field: ''}).values(field) \
+                    .annotate(refs=models.Count('pk')).order_by()
+                for row in rows:
+                    counts[row[field]] += row['refs']
+        return counts
+
+    def recount(self):
+        """Recompute every reference count from the image fields"""
+        with transaction.atomic():
+            counts = self.references()
+            self.exclude(name__in=counts).update(refs=0)
+            for name, refs in counts.items():
+                self.update_or_create(name=name, defaults={'refs': refs})
+
+
+class ImageBlob(models.Model):
+    """
+    Reference count of a content addressed image file
+
+    Kept in sync by ImageVariantsMixin when image fields change and by
+    release_images when rows are deleted, the variants of the image share
+    its lifetime.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    refs = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set by every count change, set-based updates skip auto_now
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ImageBlobManager()
+
+    def __str__(self):
+        return self.name
+
+
+class ImageUpload(models.Model):
+    """
+    Image upload acknowledged before it is processed
+
+    The file is spooled to disk as sent, in one request or in chunks
+    while receiving. Validating, re-encoding and storing it on the record
+    is left to core.uploads in the image worker pool, clients poll the
+    status.
+    """
+    RECEIVING = 'receiving'
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (RECEIVING, 'Receiving'),
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4,
+                          editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE)
+    record = models.ForeignKey(ExpenseRecord, on_delete=models.CASCADE)
+    upload = models.FileField(upload_to=spooled_upload_file_path, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=PENDING)
+    # Chunked uploads: declared total and bytes received so far
+    size = models.BigIntegerField(null=True, editable=False)
+    offset = models.BigIntegerField(default=0, editable=False)
+    error = models.CharField(max_length=255, blank=True)
+    report = models.JSONField(null=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Pending, stuck and abandoned uploads are looked up by status
+        indexes = [
+            models.Index(fields=['status', 'updated_at'],
+                         name='imageupload_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.record_id}: {self.status}'
+
+
+class ScopeVersionManager(models.Manager):
+
+    def current(self, keys):
+        """
+        Return the version of each (kind, scope), in one query, giving
+        those without one a new version
+        """
+        if not keys:
+            return []
+        lookup = models.Q()
+        for kind, scope in keys:
+            lookup |= models.Q(kind=kind, scope=scope)
+        versions = {(kind, scope): version for kind, scope, version in
+                    self.filter(lookup).values_list('kind', 'scope',
+                                                    'version')}
+        missing = [key for key in keys if key not in versions]
+        if missing:
+            # A concurrent reader may create them first, theirs is kept
+            self.bulk_create(
+                [self.model(kind=kind, scope=scope,
+                            version=uuid.uuid4().hex)
+                 for kind, scope in set(missing)],
+                ignore_conflicts=True)
+            return self.current(keys)
+        return [versions[key] for key in keys]
+
+    def bump(self, kind, scopes):
+        """Give the scopes one new version, in the current transaction"""
+        scopes = sorted(scopes)
+        version = uuid.uuid4().hex
+        bumped = self.filter(kind=kind, scope__in=scopes) \
+            .update(version=version)
+        if bumped < len(scopes):
+            self.bulk_create(
+                [self.model(kind=kind, scope=scope, version=version)
+                 for scope in scopes],
+                ignore_conflicts=True)
+            # Rows a concurrent reader created meanwhile were kept
+            self.filter(kind=kind, scope__in=scopes) \
+                .update(version=version)
+
+
+class ScopeVersion(models.Model):
+    """
+    Version of the records, categories or profile data a scope sees
+
+    Bumped in the transaction of every write, so the version a reader
+    sees always matches the data it reads, whichever process wrote it.
+    """
+    kind = models.CharField(max_length=16)
+    # 'public', 'user:<id>' or 'family:<id>'
+    scope = models.CharField(max_length=32)
+    version = models.CharField(max_length=32)
+
+    objects = ScopeVersionManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'scope'],
+                                    name='scope_version_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind}:{self.scope}'
@@ -0,0 +1,70 @@
+import hashlib
+import os
+import re
+
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# Hash prefix directories: ab/cd/abcd....jpg
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage naming files by the SHA-256 of their content
+
+    upload_to only decides the directory and the extension. Files are
+    spread over two levels of hash prefix directories under it, so no
+    directory holds more than a few thousand of them. Saving bytes
+    that are already stored writes nothing and returns the existing
+    name, so identical uploads share one file. Which rows use a file is
+    counted by core.models.ImageBlob, whose row is held from here until
+    the saving transaction ends.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        name = self.content_name(name, content)
+        if self.exists(name):
+            from core.models import ImageBlob
+
+            # Not collected before the reference is counted, or gone
+            # already and written again below
+            ImageBlob.objects.hold(name)
+            if self.exists(name):
+                return name
+        return super().save(name, content, max_length)
+
+    def content_name(self, name, content):
+        """Return the content addressed name for content saved as name"""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+
+        digest = digest.hexdigest()
+        ext = os.path.splitext(name)[1].lower()
+        return os.path.join(os.path.dirname(name), *sharded(digest),
+                            digest + ext)
+
+
+def sharded(digest):
+    """Return the nested directories holding the file of digest"""
+    return [digest[start:start + SHARD_WIDTH]
+            for start in range(0, SHARD_LEVELS * SHARD_WIDTH, SHARD_WIDTH)]
+
+
+def sharded_name_regex(directory):
+    """Return a regex matching the content addressed names in directory"""
+    shards = rf'[0-9a-f]{{{SHARD_WIDTH}}}/' * SHARD_LEVELS
+    return rf'^{re.escape(directory.rstrip("/"))}/{shards}[0-9a-f]{{64}}\.'
+
+
+content_storage = ContentAddressedStorage()
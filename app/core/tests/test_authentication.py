@@ -0,0 +1,140 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.authentication import TokenCache, token_cache
+from core.models import Family, UserProfile
+
+PROFILE_URL = reverse('user:profile')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test token authentication served from the token cache"""
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        UserProfile.objects.create(user=self.user,
+                                   family=Family.objects.create(name='Test'))
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_repeated_key_skips_token_query(self):
+        """Test a cached key authenticates without the token lookup"""
+        with CaptureQueriesContext(connection) as first:
+            res = self.client.get(PROFILE_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with CaptureQueriesContext(connection) as second:
+            res = self.client.get(PROFILE_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['user']['email'], self.user.email)
+        self.assertEqual(len(second), len(first) - 1)
+        self.assertFalse([query for query in second.captured_queries
+                          if 'authtoken_token' in query['sql']])
+
+        stats = token_cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_profile_loaded_with_user(self):
+        """Test views reuse the profile loaded by authentication"""
+        for i in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.get(reverse('expense:summary-list'),
+                                      {'type': 'family'})
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertFalse([query for query in queries.captured_queries
+                              if 'FROM "core_userprofile"' in query['sql']])
+
+    def test_profile_change_evicts(self):
+        """Test moving to another family drops the cached profile"""
+        self.client.get(PROFILE_URL)
+        family = Family.objects.create(name='Other')
+
+        profile = self.user.userprofile
+        profile.family = family
+        profile.save()
+        res = self.client.get(PROFILE_URL)
+
+        self.assertEqual(res.data['family']['id'], family.id)
+
+    def test_token_deletion_evicts(self):
+        """Test a deleted token is rejected right away"""
+        self.client.get(PROFILE_URL)
+
+        self.token.delete()
+        res = self.client.get(PROFILE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_deactivation_evicts(self):
+        """Test a deactivated user's token is rejected right away"""
+        self.client.get(PROFILE_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(PROFILE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_evicts(self):
+        """Test changing the password drops the cached user"""
+        self.client.get(PROFILE_URL)
+
+        res = self.client.patch(reverse('user:me'),
+                                {'password': 'newpassword'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(token_cache.stats()['size'], 0)
+
+
+class TokenCacheTests(TestCase):
+    """Test the bounded LRU with TTL"""
+
+    def setUp(self):
+        self.cache = TokenCache(max_size=2, ttl=60)
+
+    def test_least_recently_used_evicted(self):
+        """Test the least recently used key is evicted when full"""
+        user = get_user_model()(pk=1)
+        self.cache.set('a', user, None)
+        self.cache.set('b', user, None)
+        self.cache.get('a')
+        self.cache.set('c', user, None)
+
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    @patch('core.authentication.time.monotonic')
+    def test_expired_entry_is_a_miss(self, monotonic):
+        """Test an entry past its TTL is not served"""
+        monotonic.return_value = 100
+        self.cache.set('a', get_user_model()(pk=1), None)
+
+        monotonic.return_value = 161
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    def test_copies_are_served(self):
+        """Test each hit gets its own user instance"""
+        user = get_user_model()(pk=1, name='Test')
+        self.cache.set('a', user, None)
+
+        cached, token = self.cache.get('a')
+        cached.name = 'Changed'
+
+        self.assertEqual(self.cache.get('a')[0].name, 'Test')
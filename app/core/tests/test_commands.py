@@ -1,7 +1,26 @@
+import datetime
+import io
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
 from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from core.images import variant_name
+from core.models import Category, ExpenseMonthlyTotal, ExpenseRecord, \
+    Family, ImageBlob, ImageUpload, UserProfile
+from core.storage import sharded_name_regex
+from core.uploads import process_upload, start_session
 
 
 class CommandTests(TestCase):
@@ -20,3 +39,313 @@ class CommandTests(TestCase):
             gi.side_effect = [OperationalError] * 5 + [True]
             call_command('wait_for_db')
             self.assertEqual(gi.call_count, 6)
+
+    def test_rebuild_monthly_totals(self):
+        # Test rebuilding monthly totals that drifted from the records
+        user = get_user_model().objects.create_user('test@test.com', 'pass')
+        category = Category.objects.create(name='Food')
+        ExpenseRecord.objects.bulk_create([
+            ExpenseRecord(user=user, category=category,
+                          date='2021-10-01', amount='10.00'),
+            ExpenseRecord(user=user, category=category,
+                          date='2021-10-02', amount='5.00'),
+        ])
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_monthly_totals', '--verify-only',
+                         stdout=StringIO())
+
+        call_command('rebuild_monthly_totals', stdout=StringIO())
+
+        total = ExpenseMonthlyTotal.objects.get()
+        self.assertEqual(str(total.total), '15.00')
+        self.assertEqual(total.count, 2)
+
+    def write_csv(self, content):
+        # Write a temporary CSV file removed after the test
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as csvfile:
+            csvfile.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_import_expense_records(self):
+        # Test importing a CSV with COPY and with bulk_create
+        user = get_user_model().objects.create_user('test@test.com', 'pass')
+        family = Family.objects.create(name='Test family')
+        UserProfile.objects.create(user=user, family=family)
+        Category.objects.create(name='Food', isPublic=True)
+        own = Category.objects.create(name='Food', user=user)
+        path = self.write_csv(
+            'Posted,Value,Type,Description\n'
+            '05/10/2021,12.50,Food,Lunch\n'
+            '06/10/2021,abc,Food,Broken amount\n'
+            '07/10/2021,3.00,Unknown,Broken category\n'
+            '31/10/2021,7.50,Food,\n'
+        )
+
+        for extra in ([], ['--no-copy']):
+            out = StringIO()
+            call_command(
+                'import_expense_records', path, '--user', 'test@test.com',
+                '--family', '--batch-size', '2', '--date-format', '%d/%m/%Y',
+                '--column', 'date=Posted', '--column', 'amount=Value',
+                '--column', 'category=Type', '--column', 'notes=Description',
+                *extra, stdout=out
+            )
+            self.assertIn('Line 3: Invalid amount', out.getvalue())
+            self.assertIn('Line 4: Unknown category', out.getvalue())
+            self.assertIn('Imported 2 of 4 rows', out.getvalue())
+
+        records = ExpenseRecord.objects.order_by('date', 'id')
+        self.assertEqual(records.count(), 4)
+        self.assertEqual({record.category for record in records}, {own})
+        self.assertEqual({record.family for record in records}, {family})
+        self.assertEqual(records[0].notes, 'Lunch')
+        self.assertEqual(records[3].notes, '')
+        self.assertEqual(ExpenseMonthlyTotal.objects.mismatches(), [])
+
+    def test_benchmark_category_visibility(self):
+        # Test the benchmark reports both lookups and leaves no data
+        out = StringIO()
+        call_command('benchmark_category_visibility', '--families', '20',
+                     '--categories', '2', '--repeat', '5', stdout=out)
+
+        self.assertIn('OR of isPublic/user/family', out.getvalue())
+        self.assertIn('scopes index', out.getvalue())
+        self.assertFalse(Family.objects.exists())
+        self.assertFalse(Category.objects.exists())
+
+    def test_generate_image_variants(self):
+        # Test the variants of images stored without them are rendered
+        buffer = io.BytesIO()
+        Image.new('RGB', (300, 200)).save(buffer, format='JPEG')
+        name = default_storage.save('uploads/record/test.jpg',
+                                    ContentFile(buffer.getvalue()))
+        family = Family.objects.create(name='Test family')
+        Family.objects.filter(pk=family.pk).update(avatar=name)
+
+        call_command('generate_image_variants', stdout=StringIO())
+
+        family.refresh_from_db()
+        self.assertEqual(set(family.avatar_variants),
+                         {'thumbnail', 'medium'})
+        for stored in [name] + list(family.avatar_variants.values()):
+            default_storage.delete(stored)
+
+    def test_dedupe_media(self):
+        # Test identical legacy files are merged under their content hash
+        buffer = io.BytesIO()
+        Image.new('RGB', (30, 20)).save(buffer, format='JPEG')
+        names = [default_storage.save(f'uploads/record/{stem}.JPG',
+                                      ContentFile(buffer.getvalue()))
+                 for stem in ('first', 'second')]
+        families = [Family.objects.create(name=name) for name in names]
+        for family, name in zip(families, names):
+            Family.objects.filter(pk=family.pk).update(avatar=name)
+
+        out = StringIO()
+        call_command('dedupe_media', stdout=out)
+
+        self.assertIn('Renamed 1 and merged 1 images', out.getvalue())
+        stored = {Family.objects.get(pk=family.pk).avatar.name
+                  for family in families}
+        self.assertEqual(len(stored), 1)
+        target = stored.pop()
+        self.assertRegex(target, sharded_name_regex('uploads/family/'))
+        self.assertTrue(default_storage.exists(target))
+        for name in names:
+            self.assertFalse(default_storage.exists(name))
+        self.assertEqual(ImageBlob.objects.get(name=target).refs, 2)
+        default_storage.delete(target)
+
+    def test_shard_media(self):
+        # Test flat images move into the sharded directories of each kind
+        buffer = io.BytesIO()
+        Image.new('RGB', (30, 20)).save(buffer, format='JPEG')
+        name = default_storage.save('uploads/record/legacy.jpg',
+                                    ContentFile(buffer.getvalue()))
+        thumbnail = default_storage.save(
+            variant_name(name, 'thumbnail'), ContentFile(b'thumbnail'))
+        user = get_user_model().objects.create_user('test@test.com',
+                                                    'password')
+        records = [ExpenseRecord.objects.create(
+            user=user, category=Category.objects.create(name='Food'),
+            date='2021-01-01', amount=1
+        ) for i in range(3)]
+        family = Family.objects.create(name='Test family')
+        ExpenseRecord.objects.update(image=name)
+        Family.objects.update(avatar=name)
+        ImageBlob.objects.recount()
+
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('shard_media', '--batch-size', '2', stdout=out)
+
+        self.assertIn('Moved 4 images', out.getvalue())
+        record_names = {record.image.name for record in
+                        ExpenseRecord.objects.filter(pk__in=[
+                            record.pk for record in records])}
+        self.assertEqual(len(record_names), 1)
+        record_name = record_names.pop()
+        self.assertRegex(record_name, sharded_name_regex('uploads/record'))
+        family.refresh_from_db()
+        self.assertRegex(family.avatar.name,
+                         sharded_name_regex('uploads/family'))
+        self.assertEqual(family.avatar_variants, {
+            'thumbnail': variant_name(family.avatar.name, 'thumbnail')})
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(default_storage.exists(thumbnail))
+        self.assertFalse(ImageBlob.objects.filter(name=name).exists())
+        self.assertEqual(ImageBlob.objects.get(name=record_name).refs, 3)
+
+        out = StringIO()
+        call_command('shard_media', stdout=out)
+        self.assertIn('Moved 0 images', out.getvalue())
+
+        for stored in (record_name, family.avatar.name):
+            default_storage.delete(stored)
+            default_storage.delete(variant_name(stored, 'thumbnail'))
+
+    @override_settings(IMAGE_VARIANT_WORKERS=0)
+    def test_process_image_uploads(self):
+        # Test pending and stuck uploads are processed
+        buffer = io.BytesIO()
+        Image.new('RGB', (30, 20)).save(buffer, format='JPEG')
+        user = get_user_model().objects.create_user('test@test.com',
+                                                    'password')
+        category = Category.objects.create(name='Food')
+        uploads = []
+        for upload_status in (ImageUpload.PENDING, ImageUpload.PROCESSING):
+            record = ExpenseRecord.objects.create(
+                user=user, category=category, date='2021-01-01', amount=1)
+            upload = ImageUpload(user=user, record=record,
+                                 status=upload_status)
+            upload.upload.save('spooled.jpg',
+                               ContentFile(buffer.getvalue()))
+            uploads.append(upload)
+        ImageUpload.objects.update(
+            updated_at=timezone.now() - datetime.timedelta(hours=1))
+
+        out = StringIO()
+        call_command('process_image_uploads', stdout=out)
+
+        self.assertIn('Processed 2 uploads, 1 of them retried',
+                      out.getvalue())
+        for upload in uploads:
+            upload.refresh_from_db()
+            self.assertEqual(upload.status, ImageUpload.DONE)
+            self.assertFalse(upload.upload)
+            self.assertTrue(upload.record.image)
+        uploads[0].record.image.delete(save=False)
+
+    def test_process_upload_claim_is_not_stale(self):
+        # Test an upload that waited in the queue is not retried once
+        # claimed
+        user = get_user_model().objects.create_user('test@test.com',
+                                                    'password')
+        record = ExpenseRecord.objects.create(
+            user=user, category=Category.objects.create(name='Food'),
+            date='2021-01-01', amount=1)
+        upload = ImageUpload(user=user, record=record,
+                             status=ImageUpload.PENDING)
+        upload.upload.save('spooled.jpg', ContentFile(b'spooled'))
+        ImageUpload.objects.update(
+            updated_at=timezone.now() - datetime.timedelta(hours=1))
+
+        stuck = []
+
+        def claimed_upload(spooled):
+            stuck.extend(ImageUpload.objects.filter(
+                status=ImageUpload.PROCESSING,
+                updated_at__lt=timezone.now() - datetime.timedelta(
+                    minutes=10)))
+            raise ValueError
+        with patch('core.uploads.ingest_image', side_effect=claimed_upload):
+            process_upload(upload.pk)
+
+        self.assertEqual(stuck, [])
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, ImageUpload.FAILED)
+
+    def test_process_image_uploads_expires_sessions(self):
+        # Test chunked uploads abandoned for too long are deleted
+        user = get_user_model().objects.create_user('test@test.com',
+                                                    'password')
+        record = ExpenseRecord.objects.create(
+            user=user, category=Category.objects.create(name='Food'),
+            date='2021-01-01', amount=1)
+        abandoned = start_session(user, record, 10, 'a.jpg')
+        active = start_session(user, record, 10, 'b.jpg')
+        ImageUpload.objects.filter(pk=abandoned.pk).update(
+            updated_at=timezone.now() - datetime.timedelta(hours=25))
+
+        out = StringIO()
+        call_command('process_image_uploads', stdout=out)
+
+        self.assertIn('deleted 1 abandoned chunked uploads', out.getvalue())
+        self.assertFalse(default_storage.exists(abandoned.upload.name))
+        self.assertEqual(list(ImageUpload.objects.all()), [active])
+        active.upload.delete()
+
+    def test_collect_media(self):
+        # Test only old files no row references are deleted
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with self.settings(MEDIA_ROOT=media_root):
+            user = get_user_model().objects.create_user('test@test.com',
+                                                        'password')
+            record = ExpenseRecord.objects.create(
+                user=user, category=Category.objects.create(name='Food'),
+                date='2021-01-01', amount=1)
+            names = {}
+            for key in ('image', 'thumbnail', 'orphan', 'orphan_variant',
+                        'recent', 'unreferenced'):
+                names[key] = default_storage.save(
+                    f'uploads/record/ab/{key}.jpg', ContentFile(key.encode()))
+            ExpenseRecord.objects.filter(pk=record.pk).update(
+                image=names['image'],
+                image_variants={'thumbnail': names['thumbnail']})
+            ImageBlob.objects.create(name=names['unreferenced'], refs=0)
+            ImageBlob.objects.update(
+                updated_at=timezone.now() - datetime.timedelta(days=2))
+            old = time.time() - 2 * 24 * 3600
+            for key in ('image', 'thumbnail', 'orphan', 'orphan_variant'):
+                os.utime(default_storage.path(names[key]), (old, old))
+
+            out = StringIO()
+            call_command('collect_media', '--dry-run', stdout=out)
+            self.assertIn('Would delete 2 orphaned files (20 bytes) and 1 '
+                          'unreferenced images', out.getvalue())
+            self.assertTrue(all(default_storage.exists(name)
+                                for name in names.values()))
+
+            out = StringIO()
+            call_command('collect_media', '--rate', '1000', stdout=out)
+            self.assertIn('Deleted 2 orphaned files', out.getvalue())
+            self.assertIn('2 recent files left alone', out.getvalue())
+            self.assertEqual(
+                {key for key, name in names.items()
+                 if default_storage.exists(name)},
+                {'image', 'thumbnail', 'recent'})
+            self.assertFalse(ImageBlob.objects.exists())
+
+    def test_collect_media_recount(self):
+        # Test drifted reference counts no longer keep files around
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with self.settings(MEDIA_ROOT=media_root):
+            name = default_storage.save('uploads/record/ab/drifted.jpg',
+                                        ContentFile(b'drifted'))
+            ImageBlob.objects.create(name=name, refs=2)
+            ImageBlob.objects.update(
+                updated_at=timezone.now() - datetime.timedelta(days=2))
+            old = time.time() - 2 * 24 * 3600
+            os.utime(default_storage.path(name), (old, old))
+
+            call_command('collect_media', stdout=StringIO())
+            self.assertTrue(default_storage.exists(name))
+
+            call_command('collect_media', '--recount', stdout=StringIO())
+            self.assertFalse(default_storage.exists(name))
+            self.assertFalse(ImageBlob.objects.exists())
@@ -0,0 +1,93 @@
+import io
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from core.images import variant_name
+from core.models import Family, UserProfile
+
+
+def image_file(size=(400, 300)):
+    """Return an in-memory JPEG upload"""
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, format='JPEG')
+    return ContentFile(buffer.getvalue(), name='avatar.jpg')
+
+
+def render_callbacks(callbacks):
+    """Return the on_commit callbacks that render image variants"""
+    return [callback for callback in callbacks
+            if callback.__qualname__.startswith('schedule_variants')]
+
+
+class ImageVariantsTests(TestCase):
+
+    def setUp(self):
+        self.family = Family.objects.create(name='Test family')
+        self.profile = UserProfile.objects.create(
+            user=get_user_model().objects.create_user('test@test.com',
+                                                      'password'),
+            family=self.family
+        )
+
+    def tearDown(self):
+        for instance in (self.family, self.profile):
+            instance.refresh_from_db()
+            for name in instance.avatar_variants.values():
+                default_storage.delete(name)
+            if instance.avatar:
+                instance.avatar.delete(save=False)
+
+    def test_variant_name(self):
+        # Test variants are stored next to the original as JPEG
+        self.assertEqual(variant_name('uploads/record/a.png', 'thumbnail'),
+                         'uploads/record/a.thumbnail.jpg')
+
+    @override_settings(IMAGE_VARIANT_WORKERS=0)
+    def test_avatar_change_renders_variants(self):
+        # Test saving a new avatar renders and records its variants
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.avatar.save('avatar.jpg', image_file())
+
+        self.profile.refresh_from_db()
+        self.assertEqual(set(self.profile.avatar_variants),
+                         {'thumbnail', 'medium'})
+        for name in self.profile.avatar_variants.values():
+            self.assertTrue(default_storage.exists(name))
+
+    @override_settings(IMAGE_VARIANT_WORKERS=0)
+    def test_replaced_avatar_resets_variants(self):
+        # Test replacing an avatar drops the variants of the old one
+        with self.captureOnCommitCallbacks(execute=True):
+            self.family.avatar.save('avatar.jpg', image_file())
+        family = Family.objects.get(pk=self.family.pk)
+        old = family.avatar
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            family.avatar.save('other.jpg', image_file((300, 400)))
+        old.delete(save=False)
+
+        family.refresh_from_db()
+        self.assertEqual(family.avatar_variants, {})
+        self.assertEqual(len(render_callbacks(callbacks)), 1)
+
+    def test_unchanged_image_is_not_rendered_again(self):
+        # Test saving without touching the image schedules nothing
+        profile = UserProfile.objects.get(pk=self.profile.pk)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            profile.save()
+
+        self.assertEqual(render_callbacks(callbacks), [])
+
+    @patch('core.images.get_executor')
+    def test_variants_rendered_in_worker_pool(self, get_executor):
+        # Test the rendering is handed to the worker pool on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.avatar.save('avatar.jpg', image_file())
+
+        get_executor.return_value.submit.assert_called_once()
@@ -0,0 +1,160 @@
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.http import http_date
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.images import variant_name
+from core.models import Category, ExpenseRecord, Family, UserProfile
+
+CONTENT = b'0123456789'
+
+
+def create_user(email, family):
+    """Create a user with a profile in family"""
+    user = get_user_model().objects.create_user(email, 'password')
+    UserProfile.objects.create(user=user, family=family)
+    return user
+
+
+@override_settings(MEDIA_SENDFILE_HEADER=None)
+class MediaViewTests(TestCase):
+
+    def setUp(self):
+        self.family = Family.objects.create(name='Test family')
+        self.user = create_user('test@test.com', self.family)
+        self.name = default_storage.save('uploads/record/ab/cd/abcd.jpg',
+                                         ContentFile(CONTENT))
+        self.thumbnail = default_storage.save(
+            variant_name(self.name, 'thumbnail'), ContentFile(b'thumb'))
+        ExpenseRecord.objects.create(
+            user=self.user, category=Category.objects.create(name='Food'),
+            date='2021-01-01', amount=1, image=self.name
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        default_storage.delete(self.name)
+        default_storage.delete(self.thumbnail)
+
+    def get(self, name, **headers):
+        return self.client.get(reverse('media', args=[name]), **headers)
+
+    def test_owner_gets_file(self):
+        # Test the record's owner downloads the whole image
+        res = self.get(self.name)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(res.streaming_content), CONTENT)
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+        self.assertIn('private', res['Cache-Control'])
+        self.assertIn('Last-Modified', res)
+
+    def test_family_member_gets_variant(self):
+        # Test family members see the variants of family records
+        ExpenseRecord.objects.update(family=self.family)
+        self.client.force_authenticate(
+            create_user('member@test.com', self.family))
+
+        res = self.get(self.thumbnail)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(res.streaming_content), b'thumb')
+
+    def test_other_user_not_found(self):
+        # Test images of records the user cannot see are not served
+        self.client.force_authenticate(create_user(
+            'other@test.com', Family.objects.create(name='Other family')))
+
+        self.assertEqual(self.get(self.name).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    def test_family_avatar(self):
+        # Test family avatars are served to their members only
+        Family.objects.filter(pk=self.family.pk).update(avatar=self.name)
+        ExpenseRecord.objects.update(image=None)
+
+        self.assertEqual(self.get(self.name).status_code,
+                         status.HTTP_200_OK)
+        self.client.force_authenticate(create_user(
+            'other@test.com', Family.objects.create(name='Other family')))
+        self.assertEqual(self.get(self.name).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    def test_login_required(self):
+        # Test anonymous requests are rejected
+        self.client.force_authenticate(None)
+
+        self.assertEqual(self.get(self.name).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+
+    def test_path_traversal_not_found(self):
+        # Test names leaving their directory are rejected
+        res = self.get('uploads/record/ab/cd/abcd.x/../abcd.jpg')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_byte_range(self):
+        # Test a byte range is sent as partial content
+        res = self.get(self.name, HTTP_RANGE='bytes=2-5')
+
+        self.assertEqual(res.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(res.streaming_content), b'2345')
+        self.assertEqual(res['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(res['Content-Length'], '4')
+
+    def test_open_and_suffix_byte_ranges(self):
+        # Test ranges open at the end and counted from the end
+        res = self.get(self.name, HTTP_RANGE='bytes=7-')
+        self.assertEqual(b''.join(res.streaming_content), b'789')
+
+        res = self.get(self.name, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(res.streaming_content), b'789')
+        self.assertEqual(res['Content-Range'], 'bytes 7-9/10')
+
+    def test_unsatisfiable_byte_range(self):
+        # Test a range past the end of the file is refused
+        res = self.get(self.name, HTTP_RANGE='bytes=10-20')
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(res['Content-Range'], 'bytes */10')
+
+    def test_stale_if_range_sends_whole_file(self):
+        # Test a range for another version of the file is ignored
+        res = self.get(self.name, HTTP_RANGE='bytes=2-5',
+                       HTTP_IF_RANGE=http_date(0))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(res.streaming_content), CONTENT)
+
+    def test_if_modified_since(self):
+        # Test an unchanged file is answered with 304
+        last_modified = self.get(self.name)['Last-Modified']
+
+        res = self.get(self.name, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(MEDIA_SENDFILE_HEADER='X-Accel-Redirect')
+    def test_accel_redirect(self):
+        # Test nginx is handed the internal location of the file
+        res = self.get(self.name)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['X-Accel-Redirect'],
+                         f'/protected-media/{self.name}')
+        self.assertEqual(res.content, b'')
+
+    @override_settings(MEDIA_SENDFILE_HEADER='X-Sendfile')
+    def test_sendfile(self):
+        # Test the front server is handed the file's path
+        res = self.get(self.name)
+
+        self.assertEqual(res['X-Sendfile'], default_storage.path(self.name))
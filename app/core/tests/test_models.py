@@ -3,6 +3,7 @@ from unittest.mock import patch
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from core import models
+from core.versions import get_versions
 
 
 def sample_user(email='test@londonappdev.com', password='testpass'):
@@ -71,3 +72,149 @@ class ModelTests(TestCase):
 
         exp_path = f'uploads/record/{uuid}.jpg'
         self.assertEqual(file_path, exp_path)
+
+    @patch('uuid.uuid4')
+    def test_avatar_file_names_split_by_kind(self, mock_uuid):
+        """Test that avatars are saved apart from record images"""
+        mock_uuid.return_value = 'test-uuid'
+
+        self.assertEqual(models.family_avatar_file_path(None, 'a.png'),
+                         'uploads/family/test-uuid.png')
+        self.assertEqual(models.user_avatar_file_path(None, 'a.png'),
+                         'uploads/user/test-uuid.png')
+
+    def test_profile_move_bumps_both_families(self):
+        # Test moving a profile changes the old family's version too
+        old = models.Family.objects.create(name='Old')
+        new = models.Family.objects.create(name='New')
+        profile = models.UserProfile.objects.create(user=sample_user(),
+                                                    family=old)
+        versions = get_versions('profile', [f'family:{old.pk}',
+                                            f'family:{new.pk}'])
+
+        profile.family = new
+        profile.save()
+
+        moved = get_versions('profile', [f'family:{old.pk}',
+                                         f'family:{new.pk}'])
+        self.assertNotEqual(moved[0], versions[0])
+        self.assertNotEqual(moved[1], versions[1])
+
+
+class CategoryScopeTests(TestCase):
+
+    def test_visible_matches_public_user_family(self):
+        # Test the scopes lookup finds public, own and family categories
+        user = sample_user()
+        other = sample_user('other@londonappdev.com')
+        family = models.Family.objects.create(name='Test family')
+        other_family = models.Family.objects.create(name='Other family')
+        visible = [
+            models.Category.objects.create(name='Public', isPublic=True),
+            models.Category.objects.create(name='Own', user=user),
+            models.Category.objects.create(name='Family', user=other,
+                                           family=family),
+        ]
+        models.Category.objects.create(name='Other', user=other)
+        models.Category.objects.create(name='Other family', user=other,
+                                       family=other_family)
+
+        self.assertCountEqual(
+            models.Category.objects.visible(user.pk, family.pk), visible)
+
+    def test_scopes_follow_category_changes(self):
+        # Test saving a category rederives its scopes
+        user = sample_user()
+        family = models.Family.objects.create(name='Test family')
+        category = models.Category.objects.create(name='Food', user=user)
+        self.assertEqual(category.scopes, [f'user:{user.pk}'])
+
+        category.family = family
+        category.isPublic = True
+        category.save()
+
+        category.refresh_from_db()
+        self.assertEqual(category.scopes, [f'family:{family.pk}', 'public',
+                                           f'user:{user.pk}'])
+
+
+class ExpenseMonthlyTotalTests(TestCase):
+
+    def setUp(self):
+        self.user = sample_user()
+        self.family = models.Family.objects.create(name='Test Family')
+        self.food = models.Category.objects.create(name='Food')
+        self.car = models.Category.objects.create(name='Car')
+
+    def create_record(self, **params):
+        defaults = {
+            'user': self.user,
+            'category': self.food,
+            'date': '2021-10-05',
+            'amount': '10.50',
+        }
+        defaults.update(params)
+        return models.ExpenseRecord.objects.create(**defaults)
+
+    def assertTotalsMatchRecords(self):
+        self.assertEqual(models.ExpenseMonthlyTotal.objects.mismatches(), [])
+
+    def test_record_create_adds_to_monthly_total(self):
+        # Test creating records adds them to their month's total
+        self.create_record()
+        self.create_record(date='2021-10-31', amount='4.50')
+
+        total = models.ExpenseMonthlyTotal.objects.get()
+        self.assertEqual(str(total.total), '15.00')
+        self.assertEqual(total.count, 2)
+        self.assertEqual(total.month.isoformat(), '2021-10-01')
+        self.assertTotalsMatchRecords()
+
+    def test_record_update_moves_monthly_total(self):
+        # Test moving a record between category, month and family
+        record = self.create_record()
+        self.create_record()
+
+        record.category = self.car
+        record.save()
+        self.assertTotalsMatchRecords()
+
+        record.date = '2021-11-01'
+        record.amount = '99.99'
+        record.save()
+        self.assertTotalsMatchRecords()
+
+        record.family = self.family
+        record.save()
+        self.assertTotalsMatchRecords()
+
+        stale = models.ExpenseRecord.objects.get(pk=record.pk)
+        record.family = None
+        record.save()
+        stale.amount = '1.00'
+        stale.save()
+        self.assertTotalsMatchRecords()
+
+    def test_record_delete_removes_from_monthly_total(self):
+        # Test deleting a record subtracts it from the monthly total
+        record = self.create_record(family=self.family)
+        self.create_record(family=self.family, amount='2.00')
+
+        record.delete()
+
+        total = models.ExpenseMonthlyTotal.objects.get()
+        self.assertEqual(str(total.total), '2.00')
+        self.assertEqual(total.count, 1)
+        self.assertTotalsMatchRecords()
+
+    def test_rebuild_monthly_totals(self):
+        # Test rebuilding the totals from records after drift
+        self.create_record()
+        self.create_record(family=self.family, date='2020-01-01')
+        models.ExpenseMonthlyTotal.objects.update(total=0)
+        self.assertEqual(
+            len(models.ExpenseMonthlyTotal.objects.mismatches()), 2)
+
+        models.ExpenseMonthlyTotal.objects.rebuild()
+
+        self.assertTotalsMatchRecords()
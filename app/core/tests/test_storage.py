@@ -0,0 +1,159 @@
+import io
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from core.images import variant_name
+from core.models import Category, ExpenseRecord, Family, ImageBlob, \
+    UserProfile
+from core.storage import content_storage, sharded_name_regex
+
+
+def image_bytes(color='red'):
+    """Return the bytes of a small JPEG"""
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), color).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+class ContentAddressedStorageTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('test@test.com',
+                                                         'password')
+        self.category = Category.objects.create(name='Food', user=self.user)
+        self.saved = set()
+
+    def tearDown(self):
+        for name in self.saved:
+            content_storage.delete(name)
+
+    def create_record(self, content, name='receipt.JPG', **params):
+        record = ExpenseRecord.objects.create(
+            user=self.user, category=self.category, date='2021-01-01',
+            amount=1, **params
+        )
+        record.image.save(name, ContentFile(content))
+        self.saved.add(record.image.name)
+        return record
+
+    def test_name_is_sharded_content_hash(self):
+        # Test files are named after the hash of their bytes, sharded
+        name = content_storage.save('uploads/record/a.PNG',
+                                    ContentFile(image_bytes()))
+        self.saved.add(name)
+
+        digest = name.split('/')[-1].split('.')[0]
+        self.assertEqual(
+            name, f'uploads/record/{digest[:2]}/{digest[2:4]}/{digest}.png')
+        self.assertRegex(name, sharded_name_regex('uploads/record/'))
+
+    def test_identical_bytes_stored_once(self):
+        # Test saving the same bytes twice reuses the stored file
+        first = content_storage.save('uploads/record/a.jpg',
+                                     ContentFile(image_bytes()))
+        second = content_storage.save('uploads/record/b.jpg',
+                                      ContentFile(image_bytes()))
+        third = content_storage.save('uploads/record/c.jpg',
+                                     ContentFile(image_bytes('blue')))
+        self.saved.update({first, second, third})
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, third)
+
+    def test_shared_image_counts_references(self):
+        # Test records sharing an image hold one reference each
+        first = self.create_record(image_bytes())
+        second = self.create_record(image_bytes(), name='copy.jpg')
+
+        self.assertEqual(first.image.name, second.image.name)
+        blob = ImageBlob.objects.get(name=first.image.name)
+        self.assertEqual(blob.refs, 2)
+
+        second.image.save('other.jpg', ContentFile(image_bytes('blue')))
+        self.saved.add(second.image.name)
+        blob.refresh_from_db()
+        self.assertEqual(blob.refs, 1)
+        self.assertTrue(content_storage.exists(blob.name))
+
+    def test_deleted_records_release_references(self):
+        # Test the file goes with the last record referencing it
+        record = self.create_record(image_bytes())
+        other = self.create_record(image_bytes())
+        name = record.image.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            record.delete()
+        self.assertEqual(ImageBlob.objects.get(name=name).refs, 1)
+        self.assertTrue(content_storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ExpenseRecord.objects.delete_many(
+                ExpenseRecord.objects.filter(pk=other.pk))
+        self.assertFalse(ImageBlob.objects.filter(name=name).exists())
+        self.assertFalse(content_storage.exists(name))
+
+    def test_cascade_deletes_release_references(self):
+        # Test deleting a family deletes the images of its rows
+        family = Family.objects.create(name='Family')
+        profile = UserProfile.objects.create(user=self.user, family=family)
+        profile.avatar.save('me.jpg', ContentFile(image_bytes('green')))
+        family.avatar.save('us.jpg', ContentFile(image_bytes('blue')))
+        records = [self.create_record(image_bytes(), family=family),
+                   self.create_record(image_bytes('white'), family=family)]
+        names = [profile.avatar.name, family.avatar.name] + \
+            [record.image.name for record in records]
+        self.saved.update(names)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            family.delete()
+
+        self.assertFalse(ImageBlob.objects.filter(name__in=names).exists())
+        self.assertFalse(any(content_storage.exists(name)
+                             for name in names))
+
+    @override_settings(IMAGE_VARIANT_WORKERS=0)
+    def test_replaced_image_is_deleted(self):
+        # Test replacing an image deletes the old file and its variants
+        record = self.create_record(image_bytes())
+        name = record.image.name
+        thumbnail = default_storage.save(variant_name(name, 'thumbnail'),
+                                         ContentFile(b'thumbnail'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            record.image.save('other.jpg', ContentFile(image_bytes('blue')))
+        record.refresh_from_db()
+        self.saved.update([record.image.name] +
+                          list(record.image_variants.values()))
+
+        self.assertFalse(content_storage.exists(name))
+        self.assertFalse(content_storage.exists(thumbnail))
+
+    def test_held_blob_is_not_collected(self):
+        # Test an upload reusing a stored file keeps it from collection
+        record = self.create_record(image_bytes())
+        name = record.image.name
+        ImageBlob.objects.filter(name=name).update(refs=0)
+
+        # Storing the same bytes again holds the blob until the commit,
+        # by which time the new reference is counted
+        self.create_record(image_bytes())
+        ImageBlob.objects.collect([name])
+
+        self.assertTrue(content_storage.exists(name))
+
+    def test_recount(self):
+        # Test recount repairs drifted reference counts
+        record = self.create_record(image_bytes())
+        ImageBlob.objects.filter(name=record.image.name).update(refs=5)
+        ImageBlob.objects.create(name='uploads/record/gone.jpg', refs=3)
+
+        ImageBlob.objects.recount()
+
+        self.assertEqual(ImageBlob.objects.get(name=record.image.name).refs,
+                         1)
+        self.assertEqual(
+            ImageBlob.objects.get(name='uploads/record/gone.jpg').refs, 0)
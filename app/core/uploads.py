@@ -0,0 +1,136 @@
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from core.images import get_executor, ingest_image, run_in_worker
+
+logger = logging.getLogger(__name__)
+
+CHUNK_READ_SIZE = 64 * 1024
+
+
+def process_upload(pk):
+    """
+    Validate and re-encode a spooled upload and store it on its record
+
+    Only a pending upload is claimed, so an upload queued twice is
+    processed once. Any failure is recorded on the upload rather than
+    left for the client to wait on.
+    """
+    from core.models import ExpenseRecord, ImageUpload
+
+    # Queryset updates skip auto_now, a stale updated_at would have the
+    # upload retried as stuck while it is processed
+    claimed = ImageUpload.objects.filter(pk=pk, status=ImageUpload.PENDING) \
+        .update(status=ImageUpload.PROCESSING, updated_at=timezone.now())
+    if not claimed:
+        return
+    upload = ImageUpload.objects.get(pk=pk)
+
+    try:
+        try:
+            with upload.upload.open('rb'):
+                image, upload.report = ingest_image(upload.upload)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            upload.status = ImageUpload.FAILED
+            upload.error = 'Upload a valid image.'
+        else:
+            with transaction.atomic():
+                record = ExpenseRecord.objects.select_for_update() \
+                    .filter(pk=upload.record_id).first()
+                if record is None:
+                    # Deleted along with the record
+                    image.close()
+                    upload.upload.delete(save=False)
+                    return
+                with image:
+                    record.image.save(image.name, image)
+                upload.status = ImageUpload.DONE
+                upload.save(update_fields=['status', 'report', 'updated_at'])
+    except Exception:
+        logger.exception('Processing upload %s failed', pk)
+        upload.status = ImageUpload.FAILED
+        upload.error = 'Processing the image failed.'
+
+    upload.upload.delete(save=False)
+    upload.save()
+
+
+def schedule_upload(upload):
+    """Process the spooled upload in the worker pool once committed"""
+    if settings.IMAGE_VARIANT_WORKERS:
+        transaction.on_commit(lambda: get_executor().submit(
+            run_in_worker, process_upload, upload.pk))
+    else:
+        transaction.on_commit(lambda: process_upload(upload.pk))
+
+
+def start_session(user, record, size, filename):
+    """Return a new chunked upload of size bytes, with an empty spool"""
+    from core.models import ImageUpload, spooled_upload_file_path
+
+    upload = ImageUpload(user=user, record=record, size=size,
+                         status=ImageUpload.RECEIVING)
+    upload.upload.name = default_storage.save(
+        spooled_upload_file_path(upload, filename), ContentFile(b''))
+    upload.save()
+    return upload
+
+
+def receive_chunk(upload, offset, stream, length):
+    """
+    Write length bytes read from stream at offset of the spooled file,
+    returning whether all of them arrived and were recorded
+
+    The chunk is copied in small reads, never held whole in memory. It
+    only counts once complete, a chunk cut off by a dropped connection
+    is overwritten when the client sends it again from the same offset.
+    """
+    from core.models import ImageUpload
+
+    received = 0
+    with open(default_storage.path(upload.upload.name), 'r+b') as spool:
+        spool.seek(offset)
+        while received < length:
+            chunk = stream.read(min(CHUNK_READ_SIZE, length - received))
+            if not chunk:
+                return False
+            spool.write(chunk)
+            received += len(chunk)
+
+    # Only one of two clients racing from the same offset moves it on
+    return bool(ImageUpload.objects.filter(
+        pk=upload.pk, status=ImageUpload.RECEIVING, offset=offset
+    ).update(offset=offset + length, updated_at=timezone.now()))
+
+
+def finish_session(upload):
+    """Queue a completely received upload, returning whether it was"""
+    from core.models import ImageUpload
+
+    finished = ImageUpload.objects.filter(
+        pk=upload.pk, status=ImageUpload.RECEIVING, offset=upload.size
+    ).update(status=ImageUpload.PENDING, updated_at=timezone.now())
+    if finished:
+        upload.refresh_from_db()
+        schedule_upload(upload)
+    return bool(finished)
+
+
+def expire_sessions(before):
+    """Delete the chunked uploads not written to since before"""
+    from core.models import ImageUpload
+
+    expired = ImageUpload.objects.filter(status=ImageUpload.RECEIVING,
+                                         updated_at__lt=before)
+    count = 0
+    for upload in expired.iterator():
+        upload.upload.delete(save=False)
+        upload.delete()
+        count += 1
+    return count
@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.cache import caches
+
+
+def get_cache():
+    """Return the cache holding the cached responses"""
+    return caches[settings.EXPENSE_CACHE_ALIAS]
+
+
+def get_versions(kind, scopes, **more):
+    """
+    Return the current version token of each scope
+
+    A scope is 'public', 'user:<id>' or 'family:<id>' and a kind one of
+    'records', 'categories' or 'profile'; more kinds can be passed as
+    kind=scopes and are read in the same query, their versions following
+    in order. Versions are kept in the database rather than the cache, so
+    every process sees a bump as soon as the write commits, whatever the
+    cache backend.
+    """
+    from core.models import ScopeVersion
+
+    kinds = [(kind, scopes)] + list(more.items())
+    return ScopeVersion.objects.current(
+        [(kind, scope) for kind, scopes in kinds for scope in scopes])
+
+
+def bump_versions(kind, scopes):
+    """
+    Give each scope a new version, invalidating everything cached with
+    the old one
+
+    Versions are random tokens rather than counters, so a version is
+    never reused, even by a restored database or a cache that outlived
+    it. The bump is part of the writing transaction: readers see the old
+    version with the old data until it commits, then both change at once.
+    """
+    from core.models import ScopeVersion
+
+    ScopeVersion.objects.bump(kind, set(scopes))
+
+
+def record_scopes(records):
+    """Return the scopes that see the (user_id, family_id, ...)s"""
+    scopes = set()
+    for user_id, family_id, *rest in records:
+        scopes.add(f'user:{user_id}')
+        if family_id:
+            scopes.add(f'family:{family_id}')
+    return scopes
+
+
+def category_scopes(categories):
+    """Return the scopes that see the (is_public, user_id, family_id)s"""
+    scopes = set()
+    for is_public, user_id, family_id in categories:
+        if is_public:
+            scopes.add('public')
+        if user_id:
+            scopes.add(f'user:{user_id}')
+        if family_id:
+            scopes.add(f'family:{family_id}')
+    return scopes
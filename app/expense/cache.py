@@ -0,0 +1,63 @@
+import hashlib
+import time
+
+from django.conf import settings
+
+from core.versions import get_cache
+
+
+def cache_key(name, scope, versions, request):
+    """
+    Return the response cache key of the scope for the versions and query
+    params, shared by every user requesting the same scope
+    """
+    params = sorted(request.query_params.lists())
+    digest = hashlib.md5(repr((versions, params)).encode()).hexdigest()
+    return f'response:{name}:{scope}:{digest}'
+
+
+def get_or_compute(key, compute):
+    """
+    Return the cached value of key, computing it on a miss
+
+    Values are stored with their own expiry time and kept in the cache a
+    little longer than that. When a value expires a single worker takes
+    the recompute lock, the others keep serving the expired value until
+    it is replaced, or wait for the lock holder when there is none.
+    """
+    cache = get_cache()
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None and entry[0] > now:
+        return entry[1]
+
+    lock_key = f'lock:{key}'
+    if cache.add(lock_key, 1, settings.EXPENSE_CACHE_LOCK_TIMEOUT):
+        try:
+            value = compute()
+            cache.set(key, (time.time() + settings.EXPENSE_CACHE_TTL, value),
+                      settings.EXPENSE_CACHE_TTL +
+                      settings.EXPENSE_CACHE_STALE_TTL)
+        finally:
+            cache.delete(lock_key)
+        return value
+
+    if entry is not None:
+        return entry[1]
+
+    deadline = now + settings.EXPENSE_CACHE_LOCK_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[1]
+    return compute()
+
+
+def cached_data(name, scope, request, versions, compute):
+    """
+    Return compute() for the request in scope, cached until one of the
+    scope versions changes or the TTL passes
+    """
+    return get_or_compute(cache_key(name, scope, versions, request),
+                          compute)
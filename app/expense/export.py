@@ -0,0 +1,36 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+EXPORT_FIELDS = ('id', 'date', 'amount', 'category__name', 'user__email',
+                 'family__name', 'notes')
+EXPORT_HEADER = ('id', 'date', 'amount', 'category', 'user', 'family',
+                 'notes')
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """File-like object that returns each written line instead of storing"""
+
+    def write(self, value):
+        return value
+
+
+def export_csv(rows):
+    """Yield a CSV line for the header and for each exported row"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_HEADER)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def export_ndjson(rows):
+    """Yield a JSON object line for each exported row"""
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_HEADER, row)),
+                         cls=DjangoJSONEncoder) + '\n'
@@ -0,0 +1,136 @@
+import datetime
+
+from django.db.models import Q
+
+from core.authentication import get_user_profile
+from expense.serializers import RecordFilterSerializer
+
+
+def day_after(date):
+    """Return the day after date, None past the last representable day"""
+    if date == datetime.date.max:
+        return None
+    return date + datetime.timedelta(days=1)
+
+
+def month_after(date):
+    """
+    Return the first day of the month after date's, None past the last
+    representable month
+    """
+    if (date.year, date.month) == (datetime.MAXYEAR, 12):
+        return None
+    return datetime.date(date.year + date.month // 12, date.month % 12 + 1,
+                         1)
+
+
+class RecordFilter:
+    """
+    Compile expense record query params into indexable predicates
+
+    The type param becomes a user/family scope and every date param
+    (date_range, year, month, day) is folded into one half-open
+    [start, end) range on date, so the query can range scan the
+    (scope, date) indexes instead of evaluating EXTRACT on every row.
+    """
+
+    def __init__(self, request):
+        # Blank params are treated as absent, as they were before
+        data = {key: value for key, value in request.query_params.items()
+                if value != ''}
+        serializer = RecordFilterSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        self.request = request
+        self.type = params['type']
+        self.start, self.end = self.get_date_range(params)
+        self.categories = params.get('category')
+
+    @staticmethod
+    def get_date_range(params):
+        """
+        Return the [start, end) dates selected by params, end is None when
+        the range runs to the last representable day
+        """
+        start = end = None
+
+        year, month, day = (params.get('year'), params.get('month'),
+                            params.get('day'))
+        if day:
+            start = datetime.date(year, month, day)
+            end = day_after(start)
+        elif month:
+            start = datetime.date(year, month, 1)
+            end = month_after(start)
+        elif year:
+            start = datetime.date(year, 1, 1)
+            end = month_after(datetime.date(year, 12, 1))
+
+        date_range = params.get('date_range')
+        if date_range:
+            range_start = date_range[0]
+            range_end = day_after(date_range[1])
+            start = max(start, range_start) if start else range_start
+            if range_end:
+                end = min(end, range_end) if end else range_end
+
+        return start, end
+
+    def get_family_id(self):
+        """Return the id of the requesting user's family"""
+        return get_user_profile(self.request).family_id
+
+    def get_scope(self):
+        """Return the Q object selecting records in the requested scope"""
+        user = self.request.user
+        if self.type == 'personal':
+            return Q(user=user, family__isnull=True)
+        elif self.type == 'family':
+            return Q(family_id=self.get_family_id())
+        return Q(user=user)
+
+    def get_scope_name(self):
+        """Return the cache version scope of the requested records"""
+        if self.type == 'family':
+            return f'family:{self.get_family_id()}'
+        return f'user:{self.request.user.pk}'
+
+    def get_whole_months(self):
+        """
+        Return the [first, last) month starts covered whole by the range
+
+        Either bound is None when the range is open on that side, None is
+        returned when the range does not cover a whole calendar month.
+        """
+        first = self.start
+        if first and first.day != 1:
+            first = month_after(first)
+            if first is None:
+                return None
+        last = self.end.replace(day=1) if self.end else None
+
+        if first and last and first >= last:
+            return None
+        return first, last
+
+    def filter(self, queryset, field='date'):
+        """Apply the scope, date range and category predicates"""
+        queryset = self.filter_scope(queryset)
+        return self.filter_dates(queryset, self.start, self.end, field)
+
+    def filter_scope(self, queryset):
+        """Apply the scope and category predicates"""
+        queryset = queryset.filter(self.get_scope())
+        if self.categories:
+            queryset = queryset.filter(category__in=self.categories)
+        return queryset
+
+    @staticmethod
+    def filter_dates(queryset, start, end, field='date'):
+        """Restrict field to the half-open [start, end) range"""
+        if start:
+            queryset = queryset.filter(**{f'{field}__gte': start})
+        if end:
+            queryset = queryset.filter(**{f'{field}__lt': end})
+        return queryset
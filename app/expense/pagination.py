@@ -0,0 +1,332 @@
+import datetime
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from urllib import parse
+
+from django.conf import settings
+from django.db import connection
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from core.models import ExpenseRecordTombstone
+
+
+class RecordCursorPagination(BasePagination):
+    """
+    Keyset pagination for expense records ordered by (-date, -id)
+
+    The cursor holds the (date, id) of the last row of the previous page,
+    so every page is a single range scan on the (date, id) index instead
+    of an OFFSET that gets slower the deeper the client pages.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = _('Invalid cursor')
+
+    def __init__(self):
+        self.page_size = settings.RECORD_PAGE_SIZE
+        self.max_page_size = settings.RECORD_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+
+        if self.cursor is None:
+            reverse = False
+        else:
+            reverse, date, pk = self.cursor
+            queryset = self.filter_after(queryset, date, pk, reverse)
+
+        if reverse:
+            queryset = queryset.order_by('date', 'id')
+        else:
+            queryset = queryset.order_by('-date', '-id')
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+
+        return self.page
+
+    def filter_after(self, queryset, date, pk, reverse):
+        """
+        Restrict queryset to the rows after (date, id) in paging direction
+
+        A row value comparison is used because PostgreSQL turns it into
+        a single index condition, the equivalent OR of two predicates is
+        only applied as a filter while walking the index.
+        """
+        table = connection.ops.quote_name(queryset.model._meta.db_table)
+        operator = '>' if reverse else '<'
+        return queryset.extra(
+            where=[f'({table}."date", {table}."id") {operator} (%s, %s)'],
+            params=[date, pk]
+        )
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        """Return (reverse, date, id) from the request cursor or None"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            date = datetime.date.fromisoformat(tokens['d'][0])
+            pk = int(tokens['i'][0])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return reverse, date, pk
+
+    def encode_cursor(self, reverse, record):
+        """Return the page URL for a cursor positioned at record"""
+        tokens = OrderedDict()
+        tokens['d'] = record.date.isoformat()
+        tokens['i'] = str(record.pk)
+        if reverse:
+            tokens['r'] = '1'
+
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url,
+                                   self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            # Paged backwards past the first row, restart from the top
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(False, self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(True, self.page[0])
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'previous': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'results': schema,
+            },
+        }
+
+
+class RecordSyncPagination(RecordCursorPagination):
+    """
+    Delta sync pages of the records changed and deleted since a token
+
+    Every record carries the id of the transaction that last wrote it and
+    every deletion leaves a tombstone with the id of the deleting one. A
+    sync pass walks both in (change_txid, id) order from the token, and
+    its last page hands out a token holding the oldest transaction still
+    running when the pass started. Every transaction before that one has
+    finished, so no change can later appear behind the token, the few
+    changes at or after it are just sent again by the next sync.
+
+    The sync scope is the view's record filter scope. A token of another
+    scope, e.g. after the user switched family, restarts from scratch
+    with reset set so the client drops what it has.
+    """
+    token_query_param = 'token'
+    invalid_token_message = _('Invalid sync token')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = remove_query_param(request.build_absolute_uri(),
+                                           self.token_query_param)
+        self.page_size = self.get_page_size(request)
+        record_filter = view.get_record_filter()
+        scope = record_filter.get_scope()
+        self.state = self.get_state(request, '%s:%s' % (
+            record_filter.type, record_filter.get_scope_name()))
+
+        records = self.filter_changed(queryset.filter(scope),
+                                      self.state.get('r'))
+        tombstones = self.filter_changed(
+            ExpenseRecordTombstone.objects.filter(scope),
+            self.state.get('t'))
+        rows = sorted(
+            list(records[:self.page_size + 1]) +
+            list(tombstones[:self.page_size + 1]),
+            key=lambda row: (row.change_txid,
+                             isinstance(row, ExpenseRecordTombstone),
+                             row.pk)
+        )
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        self.page = []
+        deleted = []
+        for row in rows:
+            if isinstance(row, ExpenseRecordTombstone):
+                deleted.append(row.record_id)
+                self.state['t'] = (row.change_txid, row.pk)
+            else:
+                self.page.append(row)
+                self.state['r'] = (row.change_txid, row.pk)
+
+        # A record moved out of and back into the scope is still there
+        visible = set(queryset.filter(scope, pk__in=deleted)
+                      .values_list('pk', flat=True))
+        self.deleted = list(dict.fromkeys(
+            pk for pk in deleted if pk not in visible))
+
+        return self.page
+
+    def get_state(self, request, scope_name):
+        """
+        Return the sync pass state of the request's cursor, or of a new
+        pass starting from the request's token
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is not None:
+            state = self.decode_state(encoded, self.invalid_cursor_message)
+            if state['s'] == scope_name and 'n' in state:
+                self.reset = False
+                return state
+
+        encoded = request.query_params.get(self.token_query_param)
+        token = None
+        if encoded is not None:
+            token = self.decode_state(encoded, self.invalid_token_message)
+        self.reset = token is None or token['s'] != scope_name
+        return {
+            's': scope_name,
+            'x': 0 if self.reset else token['x'],
+            'n': self.get_oldest_running_txid(),
+        }
+
+    def get_oldest_running_txid(self):
+        """Return the id below which every transaction has finished"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT txid_snapshot_xmin(txid_current_snapshot())')
+            return cursor.fetchone()[0]
+
+    def filter_changed(self, queryset, after):
+        """
+        Restrict queryset to the rows changed since the pass' start
+        transaction id and after the (change_txid, id) position
+        """
+        queryset = queryset.filter(change_txid__gte=self.state['x'])
+        if after is not None:
+            table = connection.ops.quote_name(queryset.model._meta.db_table)
+            queryset = queryset.extra(
+                where=[f'({table}."change_txid", {table}."id") > (%s, %s)'],
+                params=list(after)
+            )
+        return queryset.order_by('change_txid', 'id')
+
+    def decode_state(self, encoded, message):
+        """Return the state dict of a token or cursor"""
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            state = {'s': tokens['s'][0], 'x': int(tokens['x'][0])}
+            if 'n' in tokens:
+                state['n'] = int(tokens['n'][0])
+            for key in ('r', 't'):
+                if key in tokens:
+                    txid, pk = tokens[key][0].split(',')
+                    state[key] = (int(txid), int(pk))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(message)
+
+        return state
+
+    def encode_state(self, state):
+        """Return the base64 encoding of a token or cursor state dict"""
+        tokens = OrderedDict()
+        for key, value in state.items():
+            if isinstance(value, tuple):
+                value = '%d,%d' % value
+            tokens[key] = str(value)
+
+        querystring = parse.urlencode(tokens, doseq=True)
+        return b64encode(querystring.encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   self.encode_state(self.state))
+
+    def get_token(self):
+        """Return the token of the next sync once the pass is complete"""
+        if self.has_next:
+            return None
+        return self.encode_state({'s': self.state['s'],
+                                  'x': self.state['n']})
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('reset', self.reset),
+            ('next', self.get_next_link()),
+            ('token', self.get_token()),
+            ('changed', data),
+            ('deleted', self.deleted)
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'reset': {
+                    'type': 'boolean',
+                },
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'token': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'changed': schema,
+                'deleted': {
+                    'type': 'array',
+                    'items': {'type': 'integer'},
+                },
+            },
+        }
@@ -1,7 +1,13 @@
+import codecs
+import datetime
+
+from django.conf import settings
 from rest_framework import serializers
 
-from core.models import Category, ExpenseRecord
-from user.serializers import UserSerializer, FamilySerializer
+from core.images import ingest_image
+from core.models import Category, ExpenseRecord, ImageUpload
+from user.serializers import UserSerializer, FamilySerializer, \
+    ImageVariantsField
 
 
 class CateogryCreateSerializer(serializers.ModelSerializer):
@@ -32,14 +38,105 @@ class CateogryBasicSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', )
 
 
-class ExpenseRecordDetailsSerializer(serializers.ModelSerializer):
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key field that can resolve a whole list's ids up front"""
+
+    def prefetch(self, pks):
+        """Load the objects of pks with one query for later lookups"""
+        ids = set()
+        for pk in pks:
+            try:
+                ids.add(int(pk))
+            except (TypeError, ValueError):
+                pass
+        self.prefetched = self.get_queryset().in_bulk(ids)
+
+    def to_internal_value(self, data):
+        prefetched = getattr(self, 'prefetched', {})
+        try:
+            return prefetched[int(data)]
+        except (KeyError, TypeError, ValueError):
+            return super().to_internal_value(data)
+
+
+class BulkRecordListSerializer(serializers.ListSerializer):
+    """Serializer for validating a list of records in bulk"""
+
+    def to_internal_value(self, data):
+        """Resolve each related field's ids with one query per field"""
+        if isinstance(data, list):
+            for name, field in self.child.fields.items():
+                if isinstance(field, PrefetchedPrimaryKeyRelatedField):
+                    field.prefetch(item.get(name) for item in data
+                                   if isinstance(item, dict))
+        return super().to_internal_value(data)
+
+
+class IngestImageMixin:
+    """Serializer mixin re-encoding an uploaded image with ingest_image"""
+
+    def validate_image(self, value):
+        """Re-encode the image within the configured size"""
+        if value is None:
+            return value
+        try:
+            image, self.ingest_report = ingest_image(value)
+        except (OSError, ValueError):
+            raise serializers.ValidationError('Upload a valid image.')
+        return image
+
+
+class ExpenseRecordDetailsSerializer(IngestImageMixin,
+                                     serializers.ModelSerializer):
     """Serializer for expense record details"""
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+
     class Meta:
         model = ExpenseRecord
         fields = (
             'id', 'user', 'family', 'category', 'date', 'amount', 'notes', 'image'
             )
         read_only_fields = ('id', )
+        list_serializer_class = BulkRecordListSerializer
+
+
+class RecordBulkChangeSerializer(serializers.Serializer):
+    """Serializer for selecting and changing records in bulk"""
+    ids = serializers.ListField(child=serializers.IntegerField(),
+                                required=False, allow_empty=False)
+    changes = serializers.DictField(required=False)
+
+    def validate_changes(self, value):
+        """Validate the changes as a partial record update"""
+        unknown = set(value) - {'family', 'category', 'date',
+                                'amount', 'notes'}
+        if unknown:
+            raise serializers.ValidationError(
+                'Cannot change ' + ', '.join(sorted(unknown)) + '.')
+
+        serializer = ExpenseRecordDetailsSerializer(data=value, partial=True)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+
+class RecordImportSerializer(serializers.Serializer):
+    """Serializer for bank statement CSV imports"""
+    file = serializers.FileField()
+    family = serializers.BooleanField(default=False)
+    date_format = serializers.CharField(default='%Y-%m-%d')
+    encoding = serializers.CharField(default='utf-8-sig')
+    date_column = serializers.CharField(required=False)
+    amount_column = serializers.CharField(required=False)
+    category_column = serializers.CharField(required=False)
+    notes_column = serializers.CharField(required=False)
+
+    def validate_encoding(self, value):
+        """Check the encoding is one Python can decode"""
+        try:
+            codecs.lookup(value)
+        except LookupError:
+            raise serializers.ValidationError('Unknown encoding.')
+        return value
 
 
 class ExpenseRecordListSerializer(serializers.ModelSerializer):
@@ -47,27 +144,57 @@ class ExpenseRecordListSerializer(serializers.ModelSerializer):
     user = UserSerializer()
     family = FamilySerializer()
     category = CateogryBasicSerializer()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = ExpenseRecord
         fields = (
-            'id', 'user', 'family', 'category', 'date', 'amount', 'notes', 'image'
+            'id', 'user', 'family', 'category', 'date', 'amount', 'notes',
+            'image', 'image_variants', 'updated_at'
             )
-        read_only_fields = ('id', )
+        read_only_fields = ('id', 'updated_at')
 
 
-class RecordImageSerializer(serializers.ModelSerializer):
+class RecordImageSerializer(IngestImageMixin, serializers.ModelSerializer):
     """Serializer for uploading images to record"""
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = ExpenseRecord
-        fields = ('id', 'image')
+        fields = ('id', 'image', 'image_variants')
         read_only_fields = ('id',)
 
 
+class ImageUploadSerializer(serializers.ModelSerializer):
+    """Serializer for images uploaded to a record for later processing"""
+    url = serializers.HyperlinkedIdentityField(
+        view_name='expense:image-upload-detail')
+    image = serializers.FileField(source='upload', write_only=True)
+    record = RecordImageSerializer(read_only=True)
+
+    class Meta:
+        model = ImageUpload
+        fields = ('id', 'url', 'image', 'status', 'error', 'report',
+                  'size', 'offset', 'record')
+        read_only_fields = ('id', 'status', 'error')
+
+
+class UploadSessionSerializer(serializers.Serializer):
+    """Serializer for starting a chunked image upload"""
+    size = serializers.IntegerField(min_value=1)
+    filename = serializers.CharField(max_length=100, default='upload.bin')
+
+    def validate_size(self, value):
+        if value > settings.IMAGE_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f'Ensure this value is less than or equal to '
+                f'{settings.IMAGE_UPLOAD_MAX_SIZE}.')
+        return value
+
+
 class ExpenseRecordSummarySerializer(serializers.ModelSerializer):
     """Serializer for record summary"""
-    total_amount = serializers.DecimalField(max_digits=6, decimal_places=2)
+    total_amount = serializers.DecimalField(max_digits=14, decimal_places=2)
     cat_id = serializers.SerializerMethodField('get_cat_id')
     cat_name = serializers.SerializerMethodField('get_cat_name')
 
@@ -80,3 +207,59 @@ class ExpenseRecordSummarySerializer(serializers.ModelSerializer):
 
     def get_cat_id(self, obj):
         return obj.get('category__id')
+
+
+class RecordFilterSerializer(serializers.Serializer):
+    """Serializer for validating expense record query params"""
+    type = serializers.ChoiceField(choices=('personal', 'family', 'all'),
+                                   default='all')
+    date_range = serializers.CharField(required=False)
+    year = serializers.IntegerField(required=False,
+                                    min_value=1, max_value=9999)
+    month = serializers.IntegerField(required=False,
+                                     min_value=1, max_value=12)
+    day = serializers.IntegerField(required=False,
+                                   min_value=1, max_value=31)
+    category = serializers.CharField(required=False)
+
+    def validate_date_range(self, value):
+        """Parse start_date,end_date into an inclusive pair of dates"""
+        dates = value.split(',')
+        if len(dates) != 2:
+            raise serializers.ValidationError(
+                'Expected start_date,end_date.')
+        try:
+            start, end = [datetime.datetime.strptime(d.strip(), '%Y-%m-%d')
+                          .date() for d in dates]
+        except ValueError:
+            raise serializers.ValidationError(
+                'Dates must be in yyyy-mm-dd format.')
+        if start > end:
+            raise serializers.ValidationError(
+                'Start date must not be after end date.')
+        return start, end
+
+    def validate_category(self, value):
+        """Parse a comma separated list of category ids"""
+        try:
+            return [int(cat_id) for cat_id in value.split(',')]
+        except ValueError:
+            raise serializers.ValidationError(
+                'Expected comma separated category ids.')
+
+    def validate(self, attrs):
+        """Check the day/month/year combination is a real date"""
+        year, month, day = (attrs.get('year'), attrs.get('month'),
+                            attrs.get('day'))
+        if month and not year:
+            raise serializers.ValidationError(
+                {'month': 'Month filter requires year.'})
+        if day and not month:
+            raise serializers.ValidationError(
+                {'day': 'Day filter requires year and month.'})
+        if day:
+            try:
+                datetime.date(year, month, day)
+            except ValueError:
+                raise serializers.ValidationError({'day': 'Invalid date.'})
+        return attrs
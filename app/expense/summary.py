@@ -0,0 +1,120 @@
+from decimal import Decimal
+
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncMonth, TruncWeek, TruncYear
+
+from core.models import ExpenseMonthlyTotal, ExpenseRecord
+
+
+def category_totals(record_filter):
+    """
+    Return the per category totals of the records selected by the filter
+
+    Whole calendar months are read from the monthly rollup, only the
+    partial months at either edge of the range are summed from the raw
+    records, so the cost does not grow with the length of the history.
+    """
+    records = record_filter.filter_scope(ExpenseRecord.objects.all())
+    months = record_filter.get_whole_months()
+    start, end = record_filter.start, record_filter.end
+
+    if months is None:
+        parts = [
+            record_filter.filter_dates(records, start, end)
+            .values('category__id', 'category__name')
+            .annotate(total_amount=Sum('amount'))
+        ]
+    else:
+        first, last = months
+        rollup = record_filter.filter_scope(
+            ExpenseMonthlyTotal.objects.filter(count__gt=0))
+        rollup = record_filter.filter_dates(rollup, first, last,
+                                            field='month')
+        parts = [
+            rollup.values('category__id', 'category__name')
+            .annotate(total_amount=Sum('total'))
+        ]
+
+        edges = Q()
+        if start and start < first:
+            edges |= Q(date__gte=start, date__lt=first)
+        if end and last < end:
+            edges |= Q(date__gte=last, date__lt=end)
+        if edges:
+            parts.append(
+                records.filter(edges)
+                .values('category__id', 'category__name')
+                .annotate(total_amount=Sum('amount'))
+            )
+
+    totals = {}
+    for part in parts:
+        for row in part.order_by():
+            total = totals.setdefault(row['category__id'], {
+                'category__id': row['category__id'],
+                'category__name': row['category__name'],
+                'total_amount': Decimal('0'),
+            })
+            total['total_amount'] += row['total_amount']
+
+    return [totals[cat_id] for cat_id in sorted(totals)]
+
+
+PIVOT_PERIODS = {
+    'day': lambda field: F(field),
+    'week': TruncWeek,
+    'month': TruncMonth,
+    'year': TruncYear,
+}
+
+
+def category_pivot(record_filter, group_by):
+    """
+    Return the category x period totals of the records selected by filter
+
+    The matrix is computed with one aggregate query. Month and year
+    pivots over whole months are read from the monthly rollup, anything
+    else is truncated from the raw records. Labels are sent once and each
+    category row holds one total per period, periods without any record
+    are left out.
+    """
+    months = record_filter.get_whole_months()
+    start, end = record_filter.start, record_filter.end
+    use_rollup = (
+        group_by in ('month', 'year') and months is not None and
+        (start is None or months[0] == start) and
+        (end is None or months[1] == end)
+    )
+
+    if use_rollup:
+        queryset = record_filter.filter(
+            ExpenseMonthlyTotal.objects.filter(count__gt=0), field='month')
+        period = PIVOT_PERIODS[group_by]('month')
+        amount = Sum('total')
+    else:
+        queryset = record_filter.filter(ExpenseRecord.objects.all())
+        period = PIVOT_PERIODS[group_by]('date')
+        amount = Sum('amount')
+
+    rows = list(queryset.annotate(period=period)
+                .values('period', 'category__id', 'category__name')
+                .annotate(total_amount=amount).order_by())
+
+    periods = sorted({row['period'] for row in rows})
+    categories = sorted({(row['category__id'], row['category__name'])
+                         for row in rows})
+    column = {period: i for i, period in enumerate(periods)}
+    matrix = {cat_id: [Decimal('0')] * len(periods)
+              for cat_id, _ in categories}
+    for row in rows:
+        matrix[row['category__id']][column[row['period']]] = \
+            row['total_amount']
+
+    return {
+        'group_by': group_by,
+        'periods': [period.isoformat() for period in periods],
+        'categories': [{'id': cat_id, 'name': name}
+                       for cat_id, name in categories],
+        'totals': [['{:.2f}'.format(total) for total in matrix[cat_id]]
+                   for cat_id, _ in categories],
+    }
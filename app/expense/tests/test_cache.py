@@ -0,0 +1,230 @@
+import tempfile
+import time
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Category, Family, UserProfile, ExpenseRecord
+from core.versions import bump_versions, get_versions
+from expense.cache import get_or_compute
+
+SUMMARY_URL = reverse('expense:summary-list')
+CAT_URL = reverse('expense:category-list')
+
+
+class CachedResponseTests(TestCase):
+    """Test summary and category responses are cached per scope version"""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        self.family = Family.objects.create(name='Test family')
+        UserProfile.objects.create(user=self.user, family=self.family)
+        self.category = Category.objects.create(name='Food', isPublic=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_record(self, **params):
+        defaults = {
+            'user': self.user,
+            'category': self.category,
+            'date': '2021-10-01',
+            'amount': '10.00',
+        }
+        defaults.update(params)
+        return ExpenseRecord.objects.create(**defaults)
+
+    def test_summary_served_from_cache(self):
+        """Test a repeated summary request only reads the versions"""
+        self.create_record()
+        res = self.client.get(SUMMARY_URL)
+
+        with self.assertNumQueries(1):
+            cached = self.client.get(SUMMARY_URL)
+
+        self.assertEqual(cached.status_code, status.HTTP_200_OK)
+        self.assertEqual(cached.data, res.data)
+
+    def test_summary_invalidated_by_record_write(self):
+        """Test writing a record in the scope refreshes the summary"""
+        record = self.create_record(family=self.family)
+        self.client.get(SUMMARY_URL, {'type': 'family'})
+
+        record.amount = '25.00'
+        record.save()
+        res = self.client.get(SUMMARY_URL, {'type': 'family'})
+        self.assertEqual(res.data[0]['total_amount'], '25.00')
+
+        record.delete()
+        res = self.client.get(SUMMARY_URL, {'type': 'family'})
+        self.assertEqual(res.data, [])
+
+    def test_summary_invalidated_by_family_member_write(self):
+        """Test another family member's record refreshes the family scope"""
+        user2 = get_user_model().objects.create_user(
+            'test2@test.com',
+            'password'
+        )
+        UserProfile.objects.create(user=user2, family=self.family)
+        self.client.get(SUMMARY_URL, {'type': 'family'})
+
+        self.create_record(user=user2, family=self.family)
+        res = self.client.get(SUMMARY_URL, {'type': 'family'})
+
+        self.assertEqual(res.data[0]['total_amount'], '10.00')
+
+    def test_summary_invalidated_by_shared_category_rename(self):
+        """
+        Test renaming another member's family category refreshes the
+        summaries naming it
+        """
+        member = get_user_model().objects.create_user(
+            'member@test.com',
+            'password'
+        )
+        UserProfile.objects.create(user=member, family=self.family)
+        category = Category.objects.create(name='Car', user=member,
+                                           family=self.family)
+        self.create_record(category=category)
+        self.client.get(SUMMARY_URL)
+
+        category.name = 'Transport'
+        category.save()
+        res = self.client.get(SUMMARY_URL)
+
+        self.assertEqual(res.data[0]['cat_name'], 'Transport')
+
+    def test_family_summary_shared_by_members(self):
+        """Test members requesting the family summary share one entry"""
+        member = get_user_model().objects.create_user(
+            'member@test.com',
+            'password'
+        )
+        UserProfile.objects.create(user=member, family=self.family)
+        self.create_record(family=self.family)
+        res = self.client.get(SUMMARY_URL, {'type': 'family'})
+
+        client = APIClient()
+        client.force_authenticate(member)
+        with CaptureQueriesContext(connection) as queries:
+            cached = client.get(SUMMARY_URL, {'type': 'family'})
+
+        self.assertEqual(cached.data, res.data)
+        self.assertFalse([query for query in queries
+                          if 'core_expense' in query['sql']])
+
+    def test_category_list_invalidated_by_owner_rename(self):
+        """Test renaming a user or family refreshes the nested names"""
+        Category.objects.create(name='Car', user=self.user,
+                                family=self.family)
+        self.client.get(CAT_URL)
+
+        self.user.name = 'Renamed user'
+        self.user.save()
+        self.family.name = 'Renamed family'
+        self.family.save()
+        res = self.client.get(CAT_URL)
+
+        car = [data for data in res.data if data['name'] == 'Car'][0]
+        self.assertEqual(car['user']['name'], 'Renamed user')
+        self.assertEqual(car['family']['name'], 'Renamed family')
+
+    def test_category_list_invalidated_by_category_write(self):
+        """Test writing a category refreshes the category list"""
+        res = self.client.get(CAT_URL)
+        self.assertEqual(len(res.data), 1)
+
+        Category.objects.create(name='Car', family=self.family)
+        res = self.client.get(CAT_URL)
+        self.assertEqual(len(res.data), 2)
+
+        self.category.name = 'Groceries'
+        self.category.save()
+        res = self.client.get(CAT_URL)
+        self.assertIn('Groceries', [data['name'] for data in res.data])
+
+
+class GetOrComputeTests(TestCase):
+    """Test the stampede protected cache lookup"""
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_compute_once(self):
+        """Test the value is computed once and then served from cache"""
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return 'value'
+
+        self.assertEqual(get_or_compute('key', compute), 'value')
+        self.assertEqual(get_or_compute('key', compute), 'value')
+        self.assertEqual(len(calls), 1)
+
+    def test_serve_stale_while_locked(self):
+        """Test an expired value is served while another worker computes"""
+        cache = caches['default']
+        cache.set('key', (time.time() - 1, 'stale'))
+        cache.add('lock:key', 1)
+
+        value = get_or_compute('key', lambda: 'fresh')
+
+        self.assertEqual(value, 'stale')
+
+    @patch('time.sleep')
+    def test_wait_for_lock_holder(self, sleep):
+        """Test a miss waits for the worker holding the lock"""
+        cache = caches['default']
+        cache.add('lock:key', 1)
+
+        def lock_holder_finishes(seconds):
+            cache.set('key', (time.time() + 60, 'computed'))
+        sleep.side_effect = lock_holder_finishes
+
+        value = get_or_compute('key', lambda: 'duplicate')
+
+        self.assertEqual(value, 'computed')
+
+    def test_versions_outlive_cache(self):
+        """Test versions are kept in the database, not in the cache"""
+        version = get_versions('records', ['user:1'])
+
+        caches['default'].clear()
+        self.assertEqual(get_versions('records', ['user:1']), version)
+
+        bump_versions('records', ['user:1'])
+        caches['default'].clear()
+        self.assertNotEqual(get_versions('records', ['user:1']), version)
+
+    def test_file_based_cache_backend(self):
+        """Test versions and values work with a shared file cache"""
+        with tempfile.TemporaryDirectory() as location:
+            file_cache = {
+                'default': {
+                    'BACKEND':
+                        'django.core.cache.backends.filebased.FileBasedCache',
+                    'LOCATION': location,
+                }
+            }
+            with override_settings(CACHES=file_cache):
+                version = get_versions('records', ['user:1'])
+                self.assertEqual(get_versions('records', ['user:1']),
+                                 version)
+                self.assertEqual(get_or_compute('key', lambda: 1), 1)
+                self.assertEqual(get_or_compute('key', lambda: 2), 1)
+
+                bump_versions('records', ['user:1'])
+                self.assertNotEqual(get_versions('records', ['user:1']),
+                                    version)
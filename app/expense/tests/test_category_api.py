@@ -1,6 +1,9 @@
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.core.cache import caches
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 
 from rest_framework import status
 from rest_framework.test import APIClient
@@ -59,6 +62,7 @@ class PrivateCatApiTests(TestCase):
     """Test the category API after login"""
 
     def setUp(self):
+        caches['default'].clear()
         self.user = get_user_model().objects.create_user(
             'test@test.com',
             'password'
@@ -91,6 +95,26 @@ class PrivateCatApiTests(TestCase):
         # 2 - public, 2 - user, 1 - family
         self.assertEqual(len(res.data), 5)
 
+    def test_retrieve_category_query_count(self):
+        """Test that listing categories does not query once per row"""
+        create_sample_user_category_data(user=self.user, family=self.family)
+        # Create the scope versions, then drop the cached list
+        self.client.get(CAT_URL)
+        caches['default'].clear()
+
+        with CaptureQueriesContext(connection) as single:
+            self.client.get(CAT_URL)
+
+        for _ in range(5):
+            create_sample_user_category_data(user=self.user,
+                                             family=self.family)
+
+        with CaptureQueriesContext(connection) as many:
+            res = self.client.get(CAT_URL)
+
+        self.assertEqual(len(res.data), 6)
+        self.assertEqual(len(single), len(many))
+
     def test_create_category_successful(self):
         """Test creating a new category"""
         payload = {'name': 'Test Cat', 'isPublic': False,
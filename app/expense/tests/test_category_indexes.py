@@ -0,0 +1,47 @@
+import unittest
+from io import StringIO
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.management.commands.benchmark_category_visibility import Command
+from core.models import Category
+
+CAT_URL = reverse('expense:category-list')
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql',
+                     'EXPLAIN checks need PostgreSQL')
+class CategoryIndexExplainTests(TestCase):
+    """Test the category list is served by the category scopes index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Category.objects.create(name='Food', isPublic=True)
+        benchmark = Command(stdout=StringIO())
+        cls.user, family = benchmark.seed(500, 4)[0]
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE core_category')
+
+    def test_category_list_uses_scopes_index(self):
+        """Test listing categories is one lookup on the scopes index"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            res = client.get(CAT_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 5)
+
+        sql = next(query['sql'] for query in queries
+                   if 'FROM "core_category"' in query['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + sql)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+        self.assertIn('category_scopes_idx', plan)
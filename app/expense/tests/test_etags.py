@@ -0,0 +1,113 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Category, Family, UserProfile, ExpenseRecord
+
+RECORD_URL = reverse('expense:expenserecord-list')
+SUMMARY_URL = reverse('expense:summary-list')
+
+
+class ConditionalGetTests(TestCase):
+    """Test ETag and If-None-Match on the record list and summary"""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        self.family = Family.objects.create(name='Test family')
+        UserProfile.objects.create(user=self.user, family=self.family)
+        self.category = Category.objects.create(name='Food', isPublic=True)
+        self.record = ExpenseRecord.objects.create(
+            user=self.user, family=self.family, category=self.category,
+            date='2021-10-01', amount='10.00')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_record_list_not_modified(self):
+        """Test an unchanged record list answers 304 from its versions"""
+        res = self.client.get(RECORD_URL)
+        etag = res['ETag']
+
+        with self.assertNumQueries(1):
+            res = self.client.get(RECORD_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+    def test_record_list_modified_after_write(self):
+        """Test a record write in the scope changes the ETag"""
+        res = self.client.get(RECORD_URL, {'type': 'family'})
+        etag = res['ETag']
+
+        self.record.notes = 'Dinner'
+        self.record.save()
+        res = self.client.get(RECORD_URL, {'type': 'family'},
+                              HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(res.data['results'][0]['notes'], 'Dinner')
+
+    def test_record_list_etag_depends_on_params(self):
+        """Test another page or filter does not match the ETag"""
+        etag = self.client.get(RECORD_URL)['ETag']
+
+        res = self.client.get(RECORD_URL, {'year': '2021'},
+                              HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_record_list_modified_after_family_rename(self):
+        """Test renaming the family changes the family record list"""
+        etag = self.client.get(RECORD_URL, {'type': 'family'})['ETag']
+
+        self.family.name = 'Renamed family'
+        self.family.save()
+        res = self.client.get(RECORD_URL, {'type': 'family'},
+                              HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_record_list_modified_after_shared_category_rename(self):
+        """
+        Test renaming another member's family category changes the record
+        lists showing it
+        """
+        member = get_user_model().objects.create_user(
+            'member@test.com',
+            'password'
+        )
+        UserProfile.objects.create(user=member, family=self.family)
+        category = Category.objects.create(name='Car', user=member,
+                                           family=self.family)
+        ExpenseRecord.objects.create(
+            user=self.user, category=category,
+            date='2021-10-02', amount='20.00')
+        etag = self.client.get(RECORD_URL)['ETag']
+
+        category.name = 'Transport'
+        category.save()
+        res = self.client.get(RECORD_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('Transport', [record['category']['name']
+                                    for record in res.data['results']])
+
+    def test_summary_not_modified(self):
+        """Test an unchanged summary answers 304 until a record changes"""
+        etag = self.client.get(SUMMARY_URL)['ETag']
+
+        res = self.client.get(SUMMARY_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.record.delete()
+        res = self.client.get(SUMMARY_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [])
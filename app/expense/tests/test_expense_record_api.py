@@ -3,15 +3,24 @@ import os
 from PIL import Image
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from django.test import TestCase
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 import datetime
+import json
+from unittest.mock import patch
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Category, Family, UserProfile, ExpenseRecord
+from core.models import Category, Family, UserProfile, ExpenseRecord, \
+    ExpenseMonthlyTotal, ImageUpload
 
 RECORD_URL = reverse('expense:expenserecord-list')
+BULK_URL = reverse('expense:expenserecord-bulk-create')
+EXPORT_URL = reverse('expense:expenserecord-export')
+IMPORT_URL = reverse('expense:expenserecord-import-csv')
 
 
 def image_upload_url(record_id):
@@ -101,7 +110,7 @@ class PrivateExpenseRecordApiTests(TestCase):
         res = self.client.get(RECORD_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 2)
+        self.assertEqual(len(res.data['results']), 2)
 
     def test_retrieve_personal_expense_record(self):
         """
@@ -125,8 +134,8 @@ class PrivateExpenseRecordApiTests(TestCase):
         res = self.client.get(RECORD_URL, {'type': 'personal'})
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        for data in res.data:
+        self.assertEqual(len(res.data['results']), 1)
+        for data in res.data['results']:
             self.assertTrue(data['user']['email'] == self.user.email and
                             not data['family'])
 
@@ -152,7 +161,7 @@ class PrivateExpenseRecordApiTests(TestCase):
         res = self.client.get(RECORD_URL, {'type': 'family'})
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        for data in res.data:
+        for data in res.data['results']:
             self.assertEqual(data['family']['id'], self.family.id)
 
     def test_retrieve_all_expense_record_by_day(self):
@@ -184,7 +193,7 @@ class PrivateExpenseRecordApiTests(TestCase):
         res = self.client.get(RECORD_URL, params)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        for data in res.data:
+        for data in res.data['results']:
             self.assertEqual(data['date'], '2021-10-05')
 
     def test_retrieve_all_expense_record_by_month(self):
@@ -215,7 +224,7 @@ class PrivateExpenseRecordApiTests(TestCase):
         res = self.client.get(RECORD_URL, params)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        for data in res.data:
+        for data in res.data['results']:
             self.assertIn('2021-10-', data['date'])
 
     def test_retrieve_all_expense_record_by_year(self):
@@ -245,7 +254,7 @@ class PrivateExpenseRecordApiTests(TestCase):
         res = self.client.get(RECORD_URL, params)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        for data in res.data:
+        for data in res.data['results']:
             self.assertIn('2021-', data['date'])
 
     def test_retrieve_all_expense_record_by_date_range(self):
@@ -281,7 +290,7 @@ class PrivateExpenseRecordApiTests(TestCase):
         res = self.client.get(RECORD_URL, params)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        for data in res.data:
+        for data in res.data['results']:
             data_date = datetime.datetime.strptime(data['date'],
                                                    "%Y-%m-%d").date()
             self.assertTrue(data_date >= date1 and
@@ -316,7 +325,7 @@ class PrivateExpenseRecordApiTests(TestCase):
         res = self.client.get(RECORD_URL, params)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        for data in res.data:
+        for data in res.data['results']:
             self.assertEqual(data['category']['id'], cat_sport.id)
 
     def test_retrieve_expense_record_by_mutliple_query_fields(self):
@@ -367,11 +376,147 @@ class PrivateExpenseRecordApiTests(TestCase):
         res = self.client.get(RECORD_URL, params)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        for data in res.data:
+        for data in res.data['results']:
             self.assertEqual(data['category']['id'], cat_sport.id)
             self.assertIn('2021-10-', data['date'])
             self.assertEqual(data['user']['email'], self.user.email)
 
+    def test_retrieve_expense_record_by_multiple_categories(self):
+        """Test retrieving expense records in any of several categories"""
+        cat_sport = Category.objects.create(name='Sport', isPublic=True)
+        cat_car = Category.objects.create(name='Car', isPublic=True)
+        cat_food = Category.objects.create(name='Food', isPublic=True)
+
+        create_sample_expense_record(user=self.user, category=cat_sport)
+        create_sample_expense_record(user=self.user, category=cat_car)
+        create_sample_expense_record(user=self.user, category=cat_food)
+
+        params = {'category': f'{cat_sport.id},{cat_car.id}'}
+        res = self.client.get(RECORD_URL, params)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        cat_ids = {data['category']['id'] for data in res.data['results']}
+        self.assertEqual(cat_ids, {cat_sport.id, cat_car.id})
+
+    def test_retrieve_expense_record_by_december(self):
+        """Test that a December filter stops at the end of the year"""
+        create_sample_expense_record(user=self.user, date='2020-11-30')
+        create_sample_expense_record(user=self.user, date='2020-12-01')
+        create_sample_expense_record(user=self.user, date='2020-12-31')
+        create_sample_expense_record(user=self.user, date='2021-01-01')
+
+        res = self.client.get(RECORD_URL, {'year': '2020', 'month': '12'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        dates = [data['date'] for data in res.data['results']]
+        self.assertEqual(dates, ['2020-12-31', '2020-12-01'])
+
+    def test_retrieve_expense_record_by_date_range_and_month(self):
+        """Test that date_range and month filters are combined"""
+        create_sample_expense_record(user=self.user, date='2021-09-30')
+        create_sample_expense_record(user=self.user, date='2021-10-10')
+        create_sample_expense_record(user=self.user, date='2021-10-20')
+
+        params = {
+            'date_range': '2021-09-01,2021-10-15',
+            'year': '2021',
+            'month': '10'
+        }
+        res = self.client.get(RECORD_URL, params)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        dates = [data['date'] for data in res.data['results']]
+        self.assertEqual(dates, ['2021-10-10'])
+
+    def test_retrieve_expense_record_invalid_params(self):
+        """Test that malformed filter params are rejected"""
+        invalid_params = [
+            {'type': 'everyone'},
+            {'date_range': '2021-10-01'},
+            {'date_range': '2021-10-31,2021-10-01'},
+            {'date_range': 'yesterday,today'},
+            {'month': '10'},
+            {'year': '2021', 'month': '13'},
+            {'year': '2021', 'month': '2', 'day': '30'},
+            {'category': 'food'},
+        ]
+        for params in invalid_params:
+            res = self.client.get(RECORD_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST,
+                             params)
+
+    def test_retrieve_expense_record_pages(self):
+        """Test paging through records with the next and previous cursors"""
+        records = [
+            create_sample_expense_record(user=self.user, date=date)
+            for date in ('2021-10-05', '2021-10-05', '2021-10-05',
+                         '2021-10-04', '2021-10-03')
+        ]
+        expected = sorted(records, key=lambda r: (r.date, r.id),
+                          reverse=True)
+        expected_ids = [record.id for record in expected]
+
+        res = self.client.get(RECORD_URL, {'page_size': 2})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(res.data['previous'])
+
+        ids = [data['id'] for data in res.data['results']]
+        pages = [ids]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            pages.append([data['id'] for data in res.data['results']])
+            ids.extend(pages[-1])
+
+        self.assertEqual(ids, expected_ids)
+        self.assertEqual(len(pages), 3)
+
+        res = self.client.get(res.data['previous'])
+        self.assertEqual([data['id'] for data in res.data['results']],
+                         pages[1])
+
+    def test_retrieve_expense_record_invalid_cursor(self):
+        """Test that a malformed cursor is rejected"""
+        res = self.client.get(RECORD_URL, {'cursor': 'notacursor'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_retrieve_expense_record_query_count(self):
+        """Test that listing records does not query once per row"""
+        user2 = get_user_model().objects.create_user(
+            'test2@test.com',
+            'password'
+        )
+        create_user_profile(user2, self.family)
+        create_sample_expense_record(user=self.user, family=self.family)
+        # Create the scope versions
+        self.client.get(RECORD_URL, {'type': 'family'})
+
+        with CaptureQueriesContext(connection) as single:
+            res = self.client.get(RECORD_URL, {'type': 'family'})
+        self.assertEqual(len(res.data['results']), 1)
+
+        for _ in range(5):
+            create_sample_expense_record(user=self.user, family=self.family)
+            create_sample_expense_record(user=user2, family=self.family)
+
+        with CaptureQueriesContext(connection) as many:
+            res = self.client.get(RECORD_URL, {'type': 'family'})
+        self.assertEqual(len(res.data['results']), 11)
+
+        self.assertEqual(len(single), len(many))
+
+    def test_retrieve_expense_record_detail_query_count(self):
+        """Test that retrieving a record loads its relations in one query"""
+        record = create_sample_expense_record(user=self.user,
+                                              family=self.family)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(detail_url(record.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['category']['id'], record.category.id)
+
     def test_create_expense_record_family(self):
         """Test creating expense record"""
         cat = Category.objects.create(name='Food', isPublic=True)
@@ -418,6 +563,245 @@ class PrivateExpenseRecordApiTests(TestCase):
                          payload['date'])
         self.assertEqual(record.notes, '')
 
+    def test_bulk_create_expense_records(self):
+        """Test creating a list of records in one request"""
+        cat = Category.objects.create(name='Food', isPublic=True)
+        payload = [{
+            'user': self.user.id,
+            'family': self.family.id if i % 2 else None,
+            'category': cat.id,
+            'date': f'2021-10-{i + 1:02d}',
+            'amount': '10.00',
+        } for i in range(20)]
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data), 20)
+        self.assertEqual(ExpenseRecord.objects.filter(user=self.user,
+                                                      category=cat).count(),
+                         20)
+        self.assertLess(len(queries), 20)
+        self.assertEqual(ExpenseMonthlyTotal.objects.mismatches(), [])
+
+    def test_bulk_create_expense_records_item_errors(self):
+        """Test an invalid item reports its error and creates nothing"""
+        cat = Category.objects.create(name='Food', isPublic=True)
+        valid = {
+            'user': self.user.id,
+            'category': cat.id,
+            'date': '2021-10-01',
+            'amount': '10.00',
+        }
+        payload = [valid, dict(valid, category=0), dict(valid, date='')]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('category', res.data[1])
+        self.assertIn('date', res.data[2])
+        self.assertFalse(ExpenseRecord.objects.exists())
+
+    def test_bulk_create_expense_records_limits(self):
+        """Test the bulk create body must be a list within the cap"""
+        res = self.client.post(BULK_URL, {'amount': '1'}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with self.settings(RECORD_BULK_MAX_SIZE=2):
+            res = self.client.post(BULK_URL, [{}, {}, {}], format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_update_expense_records_by_ids(self):
+        """Test recategorizing a list of records in one request"""
+        cat_car = Category.objects.create(name='Car', isPublic=True)
+        records = [create_sample_expense_record(user=self.user,
+                                                family=self.family)
+                   for _ in range(3)]
+        other = get_user_model().objects.create_user('test2@test.com',
+                                                     'password')
+        foreign = create_sample_expense_record(user=other)
+
+        payload = {
+            'ids': [records[0].id, records[1].id, foreign.id],
+            'changes': {'category': cat_car.id, 'date': '2021-11-02'},
+        }
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {'updated': 2})
+        for record in records[:2]:
+            record.refresh_from_db()
+            self.assertEqual(record.category, cat_car)
+            self.assertEqual(record.date.isoformat(), '2021-11-02')
+        foreign.refresh_from_db()
+        self.assertNotEqual(foreign.category, cat_car)
+        self.assertEqual(ExpenseMonthlyTotal.objects.mismatches(), [])
+
+    def test_bulk_update_expense_records_by_filter(self):
+        """Test updating the records matching the list query params"""
+        create_sample_expense_record(user=self.user, date='2021-10-05')
+        create_sample_expense_record(user=self.user, date='2021-09-05')
+
+        res = self.client.patch(BULK_URL + '?year=2021&month=10',
+                                {'changes': {'notes': 'October'}},
+                                format='json')
+
+        self.assertEqual(res.data, {'updated': 1})
+        self.assertEqual(
+            ExpenseRecord.objects.get(notes='October').date.isoformat(),
+            '2021-10-05')
+
+    def test_bulk_update_expense_records_invalid(self):
+        """Test bulk updates need a selection and valid changes"""
+        record = create_sample_expense_record(user=self.user)
+        other = get_user_model().objects.create_user('test2@test.com',
+                                                     'password')
+        invalid_payloads = [
+            {'changes': {'notes': 'All of them'}},
+            {'ids': [record.id]},
+            {'ids': [record.id], 'changes': {'user': other.id}},
+            {'ids': [record.id], 'changes': {'amount': 'lots'}},
+        ]
+        for payload in invalid_payloads:
+            res = self.client.patch(BULK_URL, payload, format='json')
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST,
+                             payload)
+
+        record.refresh_from_db()
+        self.assertEqual(record.user, self.user)
+
+    def test_bulk_delete_expense_records(self):
+        """Test deleting the selected records in one request"""
+        records = [create_sample_expense_record(user=self.user,
+                                                date='2021-10-05')
+                   for _ in range(3)]
+        kept = create_sample_expense_record(user=self.user,
+                                            date='2021-09-05')
+
+        res = self.client.delete(BULK_URL + '?year=2021&month=10',
+                                 {'ids': [records[0].id, records[1].id,
+                                          kept.id]},
+                                 format='json')
+
+        self.assertEqual(res.data, {'deleted': 2})
+        self.assertEqual(
+            set(ExpenseRecord.objects.values_list('id', flat=True)),
+            {records[2].id, kept.id})
+        self.assertEqual(ExpenseMonthlyTotal.objects.mismatches(), [])
+
+    def test_export_expense_records_csv(self):
+        """Test streaming the filtered records as CSV"""
+        create_sample_expense_record(user=self.user, family=self.family,
+                                     date='2021-10-05', notes='Dinner, 2')
+        create_sample_expense_record(user=self.user, date='2021-10-04')
+        create_sample_expense_record(user=self.user, date='2021-09-04')
+
+        res = self.client.get(EXPORT_URL, {'year': '2021', 'month': '10'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res['Content-Type'], 'text/csv')
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0],
+                         'id,date,amount,category,user,family,notes')
+        self.assertEqual(len(lines), 3)
+        self.assertIn('2021-10-05,123.20,Food,test@test.com,Test family,'
+                      '"Dinner, 2"', lines[1])
+
+    def test_export_expense_records_ndjson(self):
+        """Test streaming the records as newline delimited JSON"""
+        record = create_sample_expense_record(user=self.user)
+
+        res = self.client.get(EXPORT_URL, {'export_format': 'ndjson'})
+
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [{
+            'id': record.id,
+            'date': '2021-10-01',
+            'amount': '123.20',
+            'category': 'Food',
+            'user': 'test@test.com',
+            'family': None,
+            'notes': 'Dinner at Restuarant A',
+        }])
+
+    def test_export_expense_records_invalid_format(self):
+        """Test an unknown export format is rejected"""
+        res = self.client.get(EXPORT_URL, {'export_format': 'xlsx'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_import_expense_records_csv(self):
+        """Test importing records from an uploaded CSV"""
+        create_sample_public_category(name='Car')
+        content = (b'date,amount,category,notes\n'
+                   b'2021-10-05,40.00,Car,Fuel\n'
+                   b'2021-13-05,40.00,Car,Bad date\n')
+        with tempfile.NamedTemporaryFile(suffix='.csv') as ntf:
+            ntf.write(content)
+            ntf.seek(0)
+            res = self.client.post(IMPORT_URL, {'file': ntf},
+                                   format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['rows'], 2)
+        self.assertEqual(res.data['imported'], 1)
+        self.assertEqual(res.data['errors'][0]['line'], 3)
+        self.assertIn('rows_per_second', res.data)
+        record = ExpenseRecord.objects.get(user=self.user)
+        self.assertEqual(record.notes, 'Fuel')
+        self.assertIsNone(record.family)
+
+    def test_import_expense_records_encoding(self):
+        """Test a file in another encoding is reported, or decoded"""
+        create_sample_public_category(name='Car')
+        content = ('date,amount,category,notes\n'
+                   '2021-10-05,40.00,Car,Fuel\n'
+                   '2021-10-06,4.50,Car,Caf\xe9\n').encode('cp1252')
+
+        for encoding, imported, errors in (('utf-8-sig', 0, 1),
+                                           ('cp1252', 2, 0)):
+            with tempfile.NamedTemporaryFile(suffix='.csv') as ntf:
+                ntf.write(content)
+                ntf.seek(0)
+                res = self.client.post(IMPORT_URL, {
+                    'file': ntf, 'encoding': encoding}, format='multipart')
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(res.data['imported'], imported)
+            self.assertEqual(len(res.data['errors']), errors)
+        self.assertTrue(ExpenseRecord.objects.filter(notes='Caf\xe9')
+                        .exists())
+
+    def test_import_expense_records_malformed(self):
+        """Test a malformed line is reported instead of failing"""
+        create_sample_public_category(name='Car')
+        content = (b'date,amount,category,notes\n'
+                   b'2021-10-05,40.00,Car,Fuel\n'
+                   b'2021-10-06,4.50,Car,\x00\n')
+        with tempfile.NamedTemporaryFile(suffix='.csv') as ntf:
+            ntf.write(content)
+            ntf.seek(0)
+            res = self.client.post(IMPORT_URL, {'file': ntf},
+                                   format='multipart')
+            ntf.seek(0)
+            unknown = self.client.post(IMPORT_URL, {
+                'file': ntf, 'encoding': 'nope'}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['imported'], 1)
+        self.assertEqual(res.data['errors'][0]['line'], 3)
+        self.assertEqual(unknown.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_import_expense_records_missing_file(self):
+        """Test the import requires a file"""
+        res = self.client.post(IMPORT_URL, {}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_partial_update_expense_record(self):
         """Test updating a record with patch"""
         cat_food = Category.objects.create(name='Food', isPublic=True)
@@ -562,9 +946,422 @@ class RecordImageUploadTests(TestCase):
         self.assertIn('image', res.data)
         self.assertTrue(os.path.exists(self.record.image.path))
 
+    @override_settings(IMAGE_VARIANT_WORKERS=0)
+    def test_upload_image_renders_variants(self):
+        """Test uploading an image renders its thumbnail and medium size"""
+        url = image_upload_url(self.record.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            img = Image.new('RGB', (1600, 1200))
+            img.save(ntf, format='JPEG')
+            ntf.seek(0)
+            with self.captureOnCommitCallbacks(execute=True):
+                res = self.client.post(url, {'image': ntf},
+                                       format='multipart')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.record.refresh_from_db()
+        variants = self.record.image_variants
+        self.addCleanup(lambda: [default_storage.delete(name)
+                                 for name in variants.values()])
+        self.assertEqual(set(variants), {'thumbnail', 'medium'})
+        with Image.open(default_storage.path(variants['thumbnail'])) as img:
+            self.assertEqual(img.size, (160, 160))
+        with Image.open(default_storage.path(variants['medium'])) as img:
+            self.assertEqual(img.size, (800, 600))
+
+        res = self.client.get(RECORD_URL)
+        self.assertTrue(res.data['results'][0]['image_variants']['thumbnail']
+                        .endswith(variants['thumbnail']))
+
+    def test_upload_image_is_capped_and_stripped(self):
+        """Test a large photo is re-encoded within the maximum size"""
+        url = image_upload_url(self.record.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            img = Image.merge('RGB', [Image.effect_noise((4000, 3000), 60)
+                                      for band in range(3)])
+            exif = Image.Exif()
+            exif[0x010F] = 'Test camera'
+            img.save(ntf, format='JPEG', quality=95, exif=exif)
+            original_bytes = ntf.tell()
+            ntf.seek(0)
+            res = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.record.refresh_from_db()
+        self.assertTrue(self.record.image.name.endswith('.webp'))
+        with Image.open(self.record.image.path) as stored:
+            self.assertEqual(stored.format, 'WEBP')
+            self.assertEqual(stored.size, (2048, 1536))
+            self.assertEqual(len(stored.getexif()), 0)
+
+        report = res.data['ingest']
+        self.assertEqual(report['original_bytes'], original_bytes)
+        self.assertEqual(report['stored_bytes'], self.record.image.size)
+        self.assertEqual(report['saved_bytes'],
+                         original_bytes - self.record.image.size)
+        self.assertGreater(report['saved_bytes'], 0)
+
+    def test_update_record_image_is_ingested(self):
+        """Test an image sent with a record update is re-encoded too"""
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            exif = Image.Exif()
+            exif[0x010F] = 'Test camera'
+            Image.new('RGB', (3000, 1500)).save(ntf, format='JPEG',
+                                                exif=exif)
+            ntf.seek(0)
+            res = self.client.patch(detail_url(self.record.id),
+                                    {'image': ntf}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.record.refresh_from_db()
+        with Image.open(self.record.image.path) as stored:
+            self.assertEqual(stored.format, 'WEBP')
+            self.assertEqual(stored.size, (2048, 1024))
+            self.assertEqual(len(stored.getexif()), 0)
+
+        res = self.client.patch(detail_url(self.record.id),
+                                {'image': 'notimage'}, format='multipart')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(IMAGE_INGEST_FORMAT='JPEG', IMAGE_INGEST_QUALITY=70)
+    def test_upload_image_ingest_format(self):
+        """Test the ingest format is configurable"""
+        url = image_upload_url(self.record.id)
+        with tempfile.NamedTemporaryFile(suffix='.png') as ntf:
+            Image.new('RGBA', (20, 10)).save(ntf, format='PNG')
+            ntf.seek(0)
+            res = self.client.post(url, {'image': ntf}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.record.refresh_from_db()
+        with Image.open(self.record.image.path) as stored:
+            self.assertEqual(stored.format, 'JPEG')
+            self.assertEqual(stored.size, (20, 10))
+
     def test_upload_image_bad_request(self):
         """Test uploading an invalid image"""
         url = image_upload_url(self.record.id)
         res = self.client.post(url, {'image': 'notimage'}, format='multipart')
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_upload_image_without_encoder(self):
+        """Test a missing ingest encoder is a bad request, not an error"""
+        url = image_upload_url(self.record.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', (10, 10)).save(ntf, format='JPEG')
+            ntf.seek(0)
+            with patch.dict(Image.SAVE):
+                del Image.SAVE['WEBP']
+                res = self.client.post(url, {'image': ntf},
+                                       format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.record.refresh_from_db()
+        self.assertFalse(self.record.image)
+
+
+@override_settings(IMAGE_VARIANT_WORKERS=0)
+class RecordImageAsyncUploadTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@test.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.record = create_sample_expense_record(user=self.user)
+
+    def tearDown(self):
+        self.record.refresh_from_db()
+        self.record.image.delete()
+        for upload in ImageUpload.objects.all():
+            upload.upload.delete()
+
+    def upload(self, content, suffix='.jpg', execute=True):
+        """Post content with Prefer: respond-async"""
+        with tempfile.NamedTemporaryFile(suffix=suffix) as ntf:
+            ntf.write(content)
+            ntf.seek(0)
+            with self.captureOnCommitCallbacks(execute=execute):
+                return self.client.post(image_upload_url(self.record.id),
+                                        {'image': ntf}, format='multipart',
+                                        HTTP_PREFER='respond-async')
+
+    def jpeg(self):
+        """Return the bytes of a small JPEG"""
+        with tempfile.TemporaryFile() as f:
+            Image.new('RGB', (10, 10)).save(f, format='JPEG')
+            f.seek(0)
+            return f.read()
+
+    def test_upload_is_accepted_before_processing(self):
+        """Test the upload is spooled and answered with 202"""
+        res = self.upload(self.jpeg(), execute=False)
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res['Preference-Applied'], 'respond-async')
+        self.assertEqual(res.data['status'], ImageUpload.PENDING)
+        self.assertTrue(res['Location'].endswith(
+            reverse('expense:image-upload-detail', args=[res.data['id']])))
+        upload = ImageUpload.objects.get(pk=res.data['id'])
+        self.assertTrue(default_storage.exists(upload.upload.name))
+        self.record.refresh_from_db()
+        self.assertFalse(self.record.image)
+
+    def test_processed_upload_sets_record_image(self):
+        """Test the record's image is set once the upload is processed"""
+        res = self.upload(self.jpeg())
+
+        res = self.client.get(res['Location'])
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['status'], ImageUpload.DONE)
+        self.assertEqual(res.data['report']['width'], 10)
+        self.record.refresh_from_db()
+        self.assertTrue(res.data['record']['image'].endswith(
+            self.record.image.name))
+        self.assertTrue(self.record.image.name.endswith('.webp'))
+        upload = ImageUpload.objects.get(pk=res.data['id'])
+        self.assertFalse(upload.upload)
+
+    def test_invalid_image_fails(self):
+        """Test an upload that is not an image ends up failed"""
+        res = self.upload(b'not an image')
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+
+        res = self.client.get(res['Location'])
+        self.assertEqual(res.data['status'], ImageUpload.FAILED)
+        self.assertEqual(res.data['error'], 'Upload a valid image.')
+        self.record.refresh_from_db()
+        self.assertFalse(self.record.image)
+
+    def test_missing_file_bad_request(self):
+        """Test a request without a file is rejected right away"""
+        res = self.client.post(image_upload_url(self.record.id),
+                               {'image': 'notimage'}, format='multipart',
+                               HTTP_PREFER='respond-async')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(ImageUpload.objects.exists())
+
+    def test_status_of_other_users_not_found(self):
+        """Test users only see the status of their own uploads"""
+        res = self.upload(self.jpeg())
+        self.client.force_authenticate(get_user_model().objects.create_user(
+            'other@test.com', 'testpass'))
+
+        res = self.client.get(res['Location'])
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(IMAGE_VARIANT_WORKERS=0)
+class RecordImageChunkedUploadTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@test.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.record = create_sample_expense_record(user=self.user)
+        with tempfile.TemporaryFile() as f:
+            Image.effect_noise((40, 30), 60).save(f, format='PNG')
+            f.seek(0)
+            self.content = f.read()
+
+    def tearDown(self):
+        self.record.refresh_from_db()
+        self.record.image.delete()
+        for upload in ImageUpload.objects.all():
+            upload.upload.delete()
+
+    def start(self, size=None):
+        """Start a session for the test image, returning its URL"""
+        res = self.client.post(
+            reverse('expense:expenserecord-upload-session',
+                    args=[self.record.id]),
+            {'size': size or len(self.content), 'filename': 'receipt.png'}
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return res['Location']
+
+    def put(self, url, offset, chunk):
+        """PUT a chunk at offset"""
+        return self.client.put(url, chunk,
+                               content_type='application/octet-stream',
+                               HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_chunked_upload_sets_record_image(self):
+        """Test an image sent in chunks is attached when finalized"""
+        url = self.start()
+        for offset in range(0, len(self.content), 500):
+            res = self.put(url, offset, self.content[offset:offset + 500])
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(
+                int(res['Upload-Offset']),
+                min(offset + 500, len(self.content)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(url + 'finalize/')
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+
+        res = self.client.get(url)
+        self.assertEqual(res.data['status'], ImageUpload.DONE)
+        self.assertEqual(res.data['report']['original_bytes'],
+                         len(self.content))
+        self.record.refresh_from_db()
+        self.assertTrue(self.record.image)
+
+    def test_resume_from_current_offset(self):
+        """Test a chunk at the wrong offset is refused with the offset"""
+        url = self.start()
+        self.put(url, 0, self.content[:50])
+
+        res = self.put(url, 100, self.content[100:150])
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(res['Upload-Offset'], '50')
+
+        res = self.client.get(url)
+        self.assertEqual(res.data['offset'], 50)
+        res = self.put(url, 50, self.content[50:])
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['offset'], len(self.content))
+
+    def test_resent_chunk_is_refused(self):
+        """Test a chunk sent twice is only written once"""
+        url = self.start()
+        self.put(url, 0, self.content[:50])
+
+        res = self.put(url, 0, self.content[:50])
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(res.data['offset'], 50)
+
+    def test_chunk_past_size_bad_request(self):
+        """Test a chunk may not end past the declared size"""
+        url = self.start(size=10)
+
+        res = self.put(url, 0, self.content[:20])
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_incomplete_upload_not_finalized(self):
+        """Test finalizing before every byte arrived is refused"""
+        url = self.start()
+        self.put(url, 0, self.content[:50])
+
+        res = self.client.post(url + 'finalize/')
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(
+            ImageUpload.objects.get().status, ImageUpload.RECEIVING)
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=100)
+    def test_size_limit(self):
+        """Test sessions larger than the maximum are refused"""
+        res = self.client.post(
+            reverse('expense:expenserecord-upload-session',
+                    args=[self.record.id]),
+            {'size': 101}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecordBatchImageUploadTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@test.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.records = [create_sample_expense_record(user=self.user)
+                        for i in range(3)]
+        self.files = []
+
+    def tearDown(self):
+        for record in ExpenseRecord.objects.all():
+            record.image.delete()
+        for f in self.files:
+            f.close()
+
+    def image(self, size=(10, 10)):
+        """Return an open temporary JPEG"""
+        ntf = tempfile.NamedTemporaryFile(suffix='.jpg')
+        Image.new('RGB', size).save(ntf, format='JPEG')
+        ntf.seek(0)
+        self.files.append(ntf)
+        return ntf
+
+    def upload(self, ids, images):
+        """Post the record ids and images as one batch"""
+        return self.client.post(
+            reverse('expense:expenserecord-upload-images'),
+            {'record': ids, 'image': images}, format='multipart'
+        )
+
+    def test_upload_images_to_records(self):
+        """Test each record gets the image at its position"""
+        res = self.upload([record.id for record in self.records],
+                          [self.image((10 + i, 10)) for i in range(3)])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['status'] for item in res.data],
+                         [200, 200, 200])
+        for i, (record, item) in enumerate(zip(self.records, res.data)):
+            record.refresh_from_db()
+            self.assertEqual(item['id'], record.id)
+            self.assertEqual(item['ingest']['width'], 10 + i)
+            self.assertTrue(item['image'].endswith(record.image.name))
+
+    def test_ownership_checked_in_one_query(self):
+        """Test the records are looked up together, others not found"""
+        other = create_sample_expense_record(
+            user=get_user_model().objects.create_user('other@test.com',
+                                                      'testpass'))
+        ids = [record.id for record in self.records] + [other.id]
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.upload(ids, [self.image() for i in ids])
+
+        # Saving each record locks it for the monthly totals
+        lookups = [query for query in queries.captured_queries
+                   if query['sql'].startswith('SELECT') and
+                   'FROM "core_expenserecord"' in query['sql'] and
+                   not query['sql'].endswith('FOR UPDATE')]
+        self.assertEqual(len(lookups), 1)
+        self.assertEqual(res.data[3]['status'], 404)
+        other.refresh_from_db()
+        self.assertFalse(other.image)
+
+    def test_invalid_item_does_not_fail_batch(self):
+        """Test an invalid image only fails its own item"""
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as bad:
+            bad.write(b'not an image')
+            bad.seek(0)
+            res = self.upload([self.records[0].id, self.records[1].id],
+                              [bad, self.image()])
+
+        self.assertEqual(res.data[0]['status'], 400)
+        self.assertIn('image', res.data[0]['errors'])
+        self.assertEqual(res.data[1]['status'], 200)
+
+    def test_unpaired_fields_bad_request(self):
+        """Test record ids and images must pair up"""
+        res = self.upload([self.records[0].id, self.records[1].id],
+                          [self.image()])
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(IMAGE_BATCH_MAX_SIZE=2)
+    def test_batch_size_limit(self):
+        """Test batches above the maximum size are refused"""
+        res = self.upload([record.id for record in self.records],
+                          [self.image() for record in self.records])
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,122 @@
+import datetime
+import unittest
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Category, Family, UserProfile, ExpenseRecord
+
+RECORD_URL = reverse('expense:expenserecord-list')
+SUMMARY_URL = reverse('expense:summary-list')
+
+
+def seed_expense_records(user, family, category, count):
+    """Bulk insert count personal and family records for user"""
+    start = datetime.date(2015, 1, 1)
+    ExpenseRecord.objects.bulk_create(
+        ExpenseRecord(
+            user=user,
+            family=family if i % 2 else None,
+            category=category,
+            date=start + datetime.timedelta(days=i % 2500),
+            amount='10.00'
+        ) for i in range(count)
+    )
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql',
+                     'EXPLAIN checks need PostgreSQL')
+class RecordIndexExplainTests(TestCase):
+    """Test the record endpoints' queries are served by the record indexes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Food', isPublic=True)
+        families = [Family.objects.create(name=f'Family {i}')
+                    for i in range(10)]
+        cls.users = []
+        for i, family in enumerate(families):
+            user = get_user_model().objects.create_user(
+                f'test{i}@test.com',
+                'password'
+            )
+            UserProfile.objects.create(user=user, family=family)
+            seed_expense_records(user, family, cls.category, 2000)
+            cls.users.append(user)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE core_expenserecord')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def explain_record_query(self, url, params):
+        """Return the EXPLAIN output of the record query behind url"""
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        sql = next(query['sql'] for query in queries
+                   if 'FROM "core_expenserecord"' in query['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + sql)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def test_all_records_list_uses_user_index(self):
+        """Test listing all my records scans the user index"""
+        plan = self.explain_record_query(RECORD_URL, {})
+
+        self.assertIn('record_user_date_idx', plan)
+
+    def test_personal_records_list_uses_partial_index(self):
+        """Test listing personal records scans the partial index"""
+        plan = self.explain_record_query(RECORD_URL, {'type': 'personal'})
+
+        self.assertIn('record_personal_date_idx', plan)
+
+    def test_family_records_list_uses_family_index(self):
+        """Test listing family records scans the family index"""
+        plan = self.explain_record_query(RECORD_URL, {'type': 'family'})
+
+        self.assertIn('record_family_date_idx', plan)
+
+    def test_family_summary_uses_family_index(self):
+        """Test the family summary edge months scan the family index"""
+        params = {'type': 'family', 'date_range': '2016-01-10,2016-03-20'}
+        plan = self.explain_record_query(SUMMARY_URL, params)
+
+        self.assertIn('record_family_date_idx', plan)
+
+    def test_personal_summary_uses_partial_index(self):
+        """Test the personal summary edge months scan the partial index"""
+        params = {'type': 'personal', 'date_range': '2016-01-10,2016-03-20'}
+        plan = self.explain_record_query(SUMMARY_URL, params)
+
+        self.assertIn('record_personal_date_idx', plan)
+
+    def test_whole_year_summary_skips_records(self):
+        """Test a whole year summary is answered from the monthly totals"""
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(SUMMARY_URL, {'type': 'family',
+                                                'year': '2016'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        for query in queries:
+            self.assertNotIn('FROM "core_expenserecord"', query['sql'])
+
+    def test_family_month_list_is_index_range_scan(self):
+        """Test a calendar month filter becomes an index date range"""
+        plan = self.explain_record_query(RECORD_URL, {'type': 'family',
+                                                      'year': '2016',
+                                                      'month': '3'})
+
+        self.assertIn('record_family_date_idx', plan)
+        self.assertRegex(plan, r'Index Cond: .*date >= ')
+        self.assertNotIn('EXTRACT', plan.upper())
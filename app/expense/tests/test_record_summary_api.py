@@ -1,5 +1,6 @@
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.core.cache import caches
 from django.test import TestCase
 
 from rest_framework import status
@@ -57,6 +58,7 @@ class PrivateRecordSummaryApiTests(TestCase):
     """Test the expense record API after login"""
 
     def setUp(self):
+        caches['default'].clear()
         self.user = get_user_model().objects.create_user(
             'test@test.com',
             'password'
@@ -159,6 +161,23 @@ class PrivateRecordSummaryApiTests(TestCase):
             self.assertEqual(str(data['total_amount']),
                              "{:.2f}".format(answer[data['cat_id']]))
 
+    def test_summary_up_to_the_last_date(self):
+        """Test ranges ending on the last representable day are open"""
+        cat_food = Category.objects.create(name='Food', isPublic=True)
+        create_sample_expense_record(user=self.user, category=cat_food,
+                                     date='2021-10-01', amount='10')
+
+        for params in ({'year': '9999'},
+                       {'year': '9999', 'month': '12', 'day': '31'},
+                       {'date_range': '9999-12-15,9999-12-31'},
+                       {'date_range': '2021-09-15,9999-12-31',
+                        'group_by': 'month'},
+                       {'date_range': '2021-09-15,9999-12-31'}):
+            res = self.client.get(RECORD_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_200_OK, params)
+
+        self.assertEqual(res.data[0]['total_amount'], '10.00')
+
     def test_date_range_records_summary_by_category(self):
         """Test all record summary"""
         cat_food = Category.objects.create(name='Food', isPublic=True)
@@ -204,3 +223,115 @@ class PrivateRecordSummaryApiTests(TestCase):
         for data in res.data:
             self.assertEqual(str(data['total_amount']),
                              "{:.2f}".format(answer[data['cat_id']]))
+
+    def test_summary_partial_months_match_records(self):
+        """Test summaries spanning whole and partial months add up"""
+        cat_food = Category.objects.create(name='Food', isPublic=True)
+        cat_car = Category.objects.create(name='Car', isPublic=True)
+
+        for date in ('2021-08-31', '2021-09-10', '2021-09-25', '2021-10-01',
+                     '2021-10-15', '2021-11-03', '2021-11-20', '2021-12-01'):
+            create_sample_expense_record(user=self.user,
+                                         family=self.family,
+                                         category=cat_food,
+                                         date=date,
+                                         amount='10')
+            create_sample_expense_record(user=self.user,
+                                         category=cat_car,
+                                         date=date,
+                                         amount='1')
+
+        cases = [
+            ({'date_range': '2021-09-10,2021-11-19'}, 50, 5),
+            ({'date_range': '2021-09-01,2021-11-30'}, 60, 6),
+            ({'date_range': '2021-10-02,2021-10-31'}, 10, 1),
+            ({'year': '2021', 'month': '10'}, 20, 2),
+            ({'type': 'family', 'year': '2021'}, 80, None),
+            ({'type': 'personal', 'date_range': '2021-09-11,2021-12-01'},
+             None, 6),
+        ]
+        for params, food, car in cases:
+            res = self.client.get(RECORD_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+            totals = {data['cat_id']: data['total_amount']
+                      for data in res.data}
+            expected = {}
+            if food:
+                expected[cat_food.id] = "{:.2f}".format(food)
+            if car:
+                expected[cat_car.id] = "{:.2f}".format(car)
+            self.assertEqual(totals, expected, params)
+
+    def test_summary_follows_record_changes(self):
+        """Test summary reflects updated and deleted records"""
+        cat_food = Category.objects.create(name='Food', isPublic=True)
+        cat_car = Category.objects.create(name='Car', isPublic=True)
+        record = create_sample_expense_record(user=self.user,
+                                              category=cat_food,
+                                              date='2021-10-05',
+                                              amount='100')
+
+        record.category = cat_car
+        record.save()
+        res = self.client.get(RECORD_URL, {'year': '2021'})
+        self.assertEqual([(data['cat_id'], data['total_amount'])
+                          for data in res.data],
+                         [(cat_car.id, '100.00')])
+
+        record.delete()
+        res = self.client.get(RECORD_URL, {'year': '2021'})
+        self.assertEqual(res.data, [])
+
+    def test_summary_pivot_by_month(self):
+        """Test the category x month pivot of a year"""
+        cat_food = Category.objects.create(name='Food', isPublic=True)
+        cat_car = Category.objects.create(name='Car', isPublic=True)
+
+        for date, category, amount in (('2021-01-05', cat_food, '10'),
+                                       ('2021-01-20', cat_food, '5'),
+                                       ('2021-03-01', cat_car, '7'),
+                                       ('2022-01-01', cat_car, '1')):
+            create_sample_expense_record(user=self.user,
+                                         category=category,
+                                         date=date,
+                                         amount=amount)
+        # Create the scope versions, then drop the cached pivot
+        self.client.get(RECORD_URL, {'year': '2021', 'group_by': 'month'})
+        caches['default'].clear()
+
+        # The scope versions and the pivot
+        with self.assertNumQueries(2):
+            res = self.client.get(RECORD_URL, {'year': '2021',
+                                               'group_by': 'month'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {
+            'group_by': 'month',
+            'periods': ['2021-01-01', '2021-03-01'],
+            'categories': [{'id': cat_food.id, 'name': 'Food'},
+                           {'id': cat_car.id, 'name': 'Car'}],
+            'totals': [['15.00', '0.00'], ['0.00', '7.00']],
+        })
+
+    def test_summary_pivot_by_week_partial_range(self):
+        """Test the week pivot of a range that splits months"""
+        cat_food = Category.objects.create(name='Food', isPublic=True)
+        for date in ('2021-10-04', '2021-10-10', '2021-10-11', '2021-10-25'):
+            create_sample_expense_record(user=self.user,
+                                         category=cat_food,
+                                         date=date,
+                                         amount='10')
+
+        params = {'date_range': '2021-10-05,2021-10-20', 'group_by': 'week'}
+        res = self.client.get(RECORD_URL, params)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['periods'], ['2021-10-04', '2021-10-11'])
+        self.assertEqual(res.data['totals'], [['10.00', '10.00']])
+
+    def test_summary_pivot_invalid_group_by(self):
+        """Test an unknown group_by is rejected"""
+        res = self.client.get(RECORD_URL, {'group_by': 'decade'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
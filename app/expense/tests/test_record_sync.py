@@ -0,0 +1,165 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TransactionTestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Category, Family, UserProfile, ExpenseRecord
+
+SYNC_URL = reverse('expense:expenserecord-sync')
+
+
+class RecordSyncTests(TransactionTestCase):
+    """
+    Test the delta sync endpoint
+
+    Changes are tracked per transaction, so these tests commit each write
+    instead of running inside a single test transaction.
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'password'
+        )
+        self.family = Family.objects.create(name='Test family')
+        UserProfile.objects.create(user=self.user, family=self.family)
+        self.category = Category.objects.create(name='Food', isPublic=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_record(self, **params):
+        defaults = {
+            'user': self.user,
+            'category': self.category,
+            'date': '2021-10-01',
+            'amount': '10.00',
+        }
+        defaults.update(params)
+        return ExpenseRecord.objects.create(**defaults)
+
+    def sync(self, **params):
+        """Run a whole sync pass, returning its pages"""
+        res = self.client.get(SYNC_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        pages = [res.data]
+        while res.data['next']:
+            self.assertIsNone(res.data['token'])
+            res = self.client.get(res.data['next'])
+            pages.append(res.data)
+        self.assertIsNotNone(res.data['token'])
+        return pages
+
+    def test_initial_sync_returns_everything(self):
+        """Test a sync without token returns all records in scope"""
+        records = [self.create_record() for i in range(3)]
+        self.create_record(
+            user=get_user_model().objects.create_user('other@test.com',
+                                                      'password'))
+
+        page, = self.sync()
+
+        self.assertTrue(page['reset'])
+        self.assertEqual([data['id'] for data in page['changed']],
+                         [record.id for record in records])
+        self.assertIn('updated_at', page['changed'][0])
+        self.assertEqual(page['deleted'], [])
+
+    def test_sync_returns_only_changes(self):
+        """Test a sync with token returns changes since the last sync"""
+        unchanged = self.create_record()
+        updated = self.create_record()
+        deleted = self.create_record()
+        token = self.sync()[-1]['token']
+
+        page, = self.sync(token=token)
+        self.assertEqual(page['changed'], [])
+        self.assertEqual(page['deleted'], [])
+
+        updated.amount = '20.00'
+        updated.save()
+        created = self.create_record()
+        deleted_id = deleted.id
+        deleted.delete()
+        page, = self.sync(token=token)
+
+        self.assertFalse(page['reset'])
+        ids = [data['id'] for data in page['changed']]
+        self.assertEqual(ids, [updated.id, created.id])
+        self.assertNotIn(unchanged.id, ids)
+        self.assertEqual(page['changed'][0]['amount'], '20.00')
+        self.assertEqual(page['deleted'], [deleted_id])
+
+    def test_set_based_writes_are_tracked(self):
+        """Test bulk updates and deletes show up in the next sync"""
+        records = [self.create_record() for i in range(4)]
+        token = self.sync()[-1]['token']
+
+        ExpenseRecord.objects.update_many(
+            ExpenseRecord.objects.filter(pk__in=[records[0].pk]),
+            notes='Changed')
+        ExpenseRecord.objects.delete_many(
+            ExpenseRecord.objects.filter(pk__in=[records[1].pk]))
+        page, = self.sync(token=token)
+
+        self.assertEqual([data['id'] for data in page['changed']],
+                         [records[0].id])
+        self.assertEqual(page['deleted'], [records[1].id])
+
+    def test_sync_pages(self):
+        """Test a sync pass is paged and covers every change once"""
+        records = [self.create_record() for i in range(5)]
+        token = self.sync()[-1]['token']
+        deleted = [record.id for record in records[:3]]
+        for record in records[:3]:
+            record.delete()
+        created = [self.create_record() for i in range(2)]
+
+        pages = self.sync(token=token, page_size=2)
+
+        self.assertEqual(len(pages), 3)
+        changed = [data['id'] for page in pages for data in page['changed']]
+        self.assertEqual(changed, [record.id for record in created])
+        self.assertEqual([pk for page in pages for pk in page['deleted']],
+                         deleted)
+
+    def test_record_moved_out_of_family(self):
+        """Test a record leaving the family scope is deleted there only"""
+        record = self.create_record(family=self.family)
+        family_token = self.sync(type='family')[-1]['token']
+        all_token = self.sync()[-1]['token']
+
+        record.family = None
+        record.save()
+
+        page, = self.sync(type='family', token=family_token)
+        self.assertEqual(page['changed'], [])
+        self.assertEqual(page['deleted'], [record.id])
+
+        page, = self.sync(token=all_token)
+        self.assertEqual([data['id'] for data in page['changed']],
+                         [record.id])
+        self.assertEqual(page['deleted'], [])
+
+    def test_token_of_other_scope_resets(self):
+        """Test a token of another scope restarts the sync from scratch"""
+        record = self.create_record(family=self.family)
+        token = self.sync(type='personal')[-1]['token']
+
+        page, = self.sync(type='family', token=token)
+
+        self.assertTrue(page['reset'])
+        self.assertEqual([data['id'] for data in page['changed']],
+                         [record.id])
+
+        page, = self.sync(token=token)
+        self.assertTrue(page['reset'])
+
+    def test_invalid_token(self):
+        """Test an invalid token is rejected"""
+        res = self.client.get(SYNC_URL, {'token': 'invalid'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
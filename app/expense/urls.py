@@ -8,6 +8,8 @@ router = DefaultRouter()
 router.register('category', views.CategoryViewSet)
 router.register('record', views.RecordViewSet)
 router.register('summary', views.RecordSummaryViewSet, basename='summary')
+router.register('image-upload', views.ImageUploadViewSet,
+                basename='image-upload')
 
 app_name = 'expense'
 
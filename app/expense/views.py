@@ -1,17 +1,35 @@
+import io
+
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework import viewsets, mixins, status,\
-                           authentication, permissions
-from django.db.models import Q
-from django.db.models import Sum
+from rest_framework import viewsets, mixins, status, permissions
+from django.conf import settings
+from django.http import StreamingHttpResponse
 
-from core.models import Category, UserProfile, ExpenseRecord
+from core.authentication import CachedTokenAuthentication, \
+    get_user_profile
+from core.conditional import make_etag, not_modified
+from core.images import get_ingest_executor
+from core.importer import RecordImporter, DEFAULT_COLUMNS
+from core.models import Category, ExpenseRecord, ImageUpload
+from core.uploads import finish_session, receive_chunk, \
+    schedule_upload, start_session
+from core.versions import get_versions
 from expense import serializers
+from expense.cache import cached_data
+from expense.export import export_csv, export_ndjson, EXPORT_FIELDS, \
+    EXPORT_CONTENT_TYPES
+from expense.filters import RecordFilter
+from expense.pagination import RecordCursorPagination, \
+    RecordSyncPagination
+from expense.summary import category_totals, category_pivot, \
+    PIVOT_PERIODS
 
 
 class CategoryViewSet(viewsets.ModelViewSet):
     """Manage category in the databases"""
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
     queryset = Category.objects.all()
 
@@ -20,10 +38,30 @@ class CategoryViewSet(viewsets.ModelViewSet):
         Return categories which is public or belongs to authenticated
         user & family
         """
-        userprofile = UserProfile.objects.get(user=self.request.user)
-        return self.queryset.filter(Q(isPublic=True) |
-                                    Q(user=self.request.user) |
-                                    Q(family=userprofile.family))
+        queryset = Category.objects.visible(
+            self.request.user.pk, get_user_profile(self.request).family_id)
+        if self.request.method == 'GET':
+            # Nested list serializer walks user, its profile and family
+            queryset = queryset.select_related('user__userprofile',
+                                               'family')
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """
+        List visible categories, cached until one of them, or the user
+        or family nested in them, changes
+        """
+        scopes = [f'user:{request.user.pk}',
+                  f'family:{get_user_profile(request).family_id}']
+        versions = get_versions('categories', ['public'] + scopes,
+                                profile=scopes)
+
+        def compute():
+            return super(CategoryViewSet, self).list(
+                request, *args, **kwargs).data
+
+        return Response(cached_data('category', scopes[0], request,
+                                    versions, compute))
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -42,9 +80,10 @@ class CategoryViewSet(viewsets.ModelViewSet):
 
 class RecordViewSet(viewsets.ModelViewSet):
     """Manage expense record in the databases"""
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
     queryset = ExpenseRecord.objects.all()
+    pagination_class = RecordCursorPagination
 
     def get_queryset(self):
         """
@@ -55,52 +94,39 @@ class RecordViewSet(viewsets.ModelViewSet):
             - year: int
             - month: int
             - day: int
-            - category: category_id
-        """
-        queryset = self.queryset
-
-        # filter by type
-        type = self.request.query_params.get('type')
-        if type == 'personal':
-            queryset = queryset.filter(user=self.request.user)\
-                        .filter(family__isnull=True)
-        elif type == 'family':
-            userprofile = UserProfile.objects.get(user=self.request.user)
-            queryset = queryset.filter(family=userprofile.family)
-        else:
-            queryset = queryset.filter(user=self.request.user)
-
-        # filter by date range
-        date_range = self.request.query_params.get('date_range')
-        if date_range:
-            dates = date_range.split(",")
-            if (len(dates) == 2):
-                queryset = queryset.filter(date__range=dates)
-
-        # filter by day/month/year
-        year = self.request.query_params.get('year')
-        month = self.request.query_params.get('month')
-        day = self.request.query_params.get('day')
-
-        if day and month and year:
-            queryset = queryset.filter(date__year=year,
-                                       date__month=month,
-                                       date__day=day)
-        elif month and year:
-            queryset = queryset.filter(date__year=year,
-                                       date__month=month)
-        elif year:
-            queryset = queryset.filter(date__year=year)
-
-        # filter by day/month/year
-        category = self.request.query_params.get('category')
-        if category:
-            queryset = queryset.filter(category=category)
+            - category: comma separated category ids
+            - cursor: opaque next/previous page cursor
+            - page_size: int
+        """
+        queryset = self.get_record_filter().filter(self.queryset)
+
+        if self.action in ('list', 'retrieve'):
+            # Load everything the nested list serializer reads in one join
+            queryset = queryset.select_related('user__userprofile',
+                                               'family', 'category')
 
         return queryset.order_by('-date', '-id')
 
+    def get_record_filter(self):
+        """Return the record filter of the request's query params"""
+        if not hasattr(self, '_record_filter'):
+            self._record_filter = RecordFilter(self.request)
+        return self._record_filter
+
+    def list(self, request, *args, **kwargs):
+        """List records, answering 304 while nothing in scope changed"""
+        scope = self.get_record_filter().get_scope_name()
+        etag = make_etag(request, get_versions(
+            'records', [scope], categories=['public', scope],
+            profile=[scope]))
+        response = not_modified(request, etag)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+            response['ETag'] = etag
+        return response
+
     def get_serializer_class(self):
-        if self.action == 'upload_image':
+        if self.action in ('upload_image', 'upload_images'):
             return serializers.RecordImageSerializer
         elif self.request.method == 'GET':
             return serializers.ExpenseRecordListSerializer
@@ -117,10 +143,155 @@ class RecordViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         serializer.save()
 
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk_create(self, request):
+        """Create a list of records in one transaction"""
+        if not isinstance(request.data, list):
+            raise ValidationError({'non_field_errors': [
+                'Expected a list of records.']})
+        max_size = settings.RECORD_BULK_MAX_SIZE
+        if len(request.data) > max_size:
+            raise ValidationError({'non_field_errors': [
+                f'At most {max_size} records can be created at once.']})
+
+        serializer = self.get_serializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        records = ExpenseRecord.objects.create_many([
+            ExpenseRecord(**dict(item, user=request.user))
+            for item in serializer.validated_data
+        ])
+        return Response(
+            self.get_serializer(records, many=True).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    @bulk_create.mapping.patch
+    def bulk_update(self, request):
+        """Apply the same changes to the selected records"""
+        serializer = serializers.RecordBulkChangeSerializer(
+            data=request.data)
+        serializer.is_valid(raise_exception=True)
+        changes = serializer.validated_data.get('changes')
+        if not changes:
+            raise ValidationError({'changes': ['No changes given.']})
+
+        count = ExpenseRecord.objects.update_many(
+            self.get_bulk_queryset(serializer.validated_data), **changes)
+        return Response({'updated': count}, status=status.HTTP_200_OK)
+
+    @bulk_create.mapping.delete
+    def bulk_destroy(self, request):
+        """Delete the selected records"""
+        serializer = serializers.RecordBulkChangeSerializer(
+            data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        count = ExpenseRecord.objects.delete_many(
+            self.get_bulk_queryset(serializer.validated_data))
+        return Response({'deleted': count}, status=status.HTTP_200_OK)
+
+    def get_bulk_queryset(self, selection):
+        """
+        Return the records selected by ids and/or the list query params,
+        within the records the user may change
+        """
+        ids = selection.get('ids')
+        filters = set(self.request.query_params) & {
+            'date_range', 'year', 'month', 'day', 'category'}
+        if not ids and not filters:
+            raise ValidationError({'ids': [
+                'Select records by ids or by filter params.']})
+
+        queryset = self.get_queryset()
+        if ids:
+            queryset = queryset.filter(pk__in=ids)
+        return queryset
+
+    @action(methods=['GET'], detail=False, url_path='export')
+    def export(self, request):
+        """
+        Stream the records selected by the list query params as CSV or
+        NDJSON (export_format=csv|ndjson)
+        """
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in EXPORT_CONTENT_TYPES:
+            raise ValidationError({'export_format': [
+                'Expected one of ' + ', '.join(EXPORT_CONTENT_TYPES) + '.']})
+
+        rows = self.get_queryset().values_list(*EXPORT_FIELDS).iterator(
+            chunk_size=settings.RECORD_EXPORT_CHUNK_SIZE)
+        if export_format == 'csv':
+            content = export_csv(rows)
+        else:
+            content = export_ndjson(rows)
+
+        response = StreamingHttpResponse(
+            content, content_type=EXPORT_CONTENT_TYPES[export_format])
+        response['Content-Disposition'] = \
+            f'attachment; filename="expense-records.{export_format}"'
+        return response
+
+    @action(methods=['GET'], detail=False, url_path='sync')
+    def sync(self, request):
+        """
+        Return a page of the records changed and the ids of the records
+        deleted since the token of the previous sync, in the type scope
+        Query Params:
+            - type: personal | family | all (default)
+            - token: token returned by the last page of the previous sync
+            - cursor: opaque next page cursor
+            - page_size: int
+        """
+        paginator = RecordSyncPagination()
+        records = paginator.paginate_queryset(
+            self.queryset.select_related('user__userprofile', 'family',
+                                         'category'),
+            request, view=self
+        )
+        serializer = self.get_serializer(records, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(methods=['POST'], detail=False, url_path='import')
+    def import_csv(self, request):
+        """
+        Import records from an uploaded bank statement CSV (file), mapping
+        the date/amount/category/notes fields from <field>_column headers
+        """
+        serializer = serializers.RecordImportSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        family = None
+        if params['family']:
+            family = get_user_profile(request).family
+
+        columns = {field: params[f'{field}_column']
+                   for field in DEFAULT_COLUMNS
+                   if params.get(f'{field}_column')}
+        importer = RecordImporter(request.user, family=family,
+                                  columns=columns,
+                                  date_format=params['date_format'])
+        csvfile = io.TextIOWrapper(params['file'].file,
+                                   encoding=params['encoding'], newline='')
+        return Response(importer.run(csvfile), status=status.HTTP_200_OK)
+
     @action(methods=['POST'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
-        """Upload an image to a record"""
+        """
+        Upload an image to a record
+        Headers:
+            - Prefer: respond-async to spool the image and answer 202
+              right away, with the URL of the upload's status
+        """
         record = self.get_object()
+        if 'respond-async' in request.META.get('HTTP_PREFER', ''):
+            return self.upload_image_async(request, record)
+
         serializer = self.get_serializer(
             record,
             data=request.data
@@ -129,7 +300,8 @@ class RecordViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             serializer.save()
             return Response(
-                serializer.data,
+                dict(serializer.data, ingest=getattr(
+                    serializer, 'ingest_report', None)),
                 status=status.HTTP_200_OK
             )
 
@@ -138,67 +310,207 @@ class RecordViewSet(viewsets.ModelViewSet):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    @action(methods=['POST'], detail=False, url_path='upload-images')
+    def upload_images(self, request):
+        """
+        Upload images to many records in one request
+        Body (multipart):
+            - record: record id, repeated
+            - image: image of the record at the same position, repeated
+        The images are re-encoded in parallel, each item of the response
+        has the status of its upload.
+        """
+        if not hasattr(request.data, 'getlist'):
+            raise ValidationError({'non_field_errors': [
+                'Expected a multipart body.']})
+        ids = request.data.getlist('record')
+        images = request.data.getlist('image')
+        if not ids or len(ids) != len(images):
+            raise ValidationError({'non_field_errors': [
+                'Expected record and image pairs.']})
+        max_size = settings.IMAGE_BATCH_MAX_SIZE
+        if len(ids) > max_size:
+            raise ValidationError({'non_field_errors': [
+                f'At most {max_size} images can be uploaded at once.']})
+        try:
+            ids = [int(pk) for pk in ids]
+        except ValueError:
+            raise ValidationError({'record': ['Expected record ids.']})
+
+        # Ownership of every record in one query
+        records = {record.pk: record
+                   for record in self.get_queryset().filter(pk__in=ids)}
+
+        def validate(record, image):
+            serializer = self.get_serializer(record, data={'image': image})
+            serializer.is_valid()
+            return serializer
+
+        executor = get_ingest_executor()
+        futures = [executor.submit(validate, records[pk], image)
+                   if pk in records else None
+                   for pk, image in zip(ids, images)]
+
+        results = []
+        for pk, future in zip(ids, futures):
+            if future is None:
+                results.append({'id': pk, 'status': 404,
+                                'errors': {'record': ['Not found.']}})
+                continue
+            serializer = future.result()
+            if serializer.errors:
+                results.append({'id': pk, 'status': 400,
+                                'errors': serializer.errors})
+                continue
+            serializer.save()
+            results.append(dict(serializer.data, status=200, ingest=getattr(
+                serializer, 'ingest_report', None)))
+        return Response(results, status=status.HTTP_200_OK)
+
+    @action(methods=['POST'], detail=True, url_path='upload-session')
+    def upload_session(self, request, pk=None):
+        """
+        Start a resumable chunked image upload to a record, its chunks
+        are then PUT to the returned URL and finalized there
+        Body:
+            - size: total bytes of the image
+            - filename: name of the image, optional
+        """
+        record = self.get_object()
+        serializer = serializers.UploadSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = start_session(request.user, record,
+                               **serializer.validated_data)
+        data = serializers.ImageUploadSerializer(
+            upload, context=self.get_serializer_context()).data
+        return Response(data, status=status.HTTP_201_CREATED,
+                        headers={'Location': data['url']})
+
+    def upload_image_async(self, request, record):
+        """Spool an image upload and queue it for processing"""
+        serializer = serializers.ImageUploadSerializer(
+            data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        schedule_upload(serializer.save(user=request.user, record=record))
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED,
+                        headers={'Location': serializer.data['url'],
+                                 'Preference-Applied': 'respond-async'})
+
 
 class RecordSummaryViewSet(viewsets.GenericViewSet,
                            mixins.ListModelMixin,):
     """Expense Record summary in the databases"""
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
     queryset = ExpenseRecord.objects.all()
     serializer_class = serializers.ExpenseRecordSummarySerializer
 
     def get_queryset(self):
         """
-        Retrieve the expense records for the authenticated user
+        Retrieve the per category totals for the authenticated user
         Query Params:
             - type: personal | family | all (default)
             - date_range: start_date,end_date in yyyy-mm-dd format
             - year: int
             - month: int
             - day: int
-            - category: category_id
-        """
-        queryset = self.queryset
-
-        # filter by type
-        type = self.request.query_params.get('type')
-        if type == 'personal':
-            queryset = queryset.filter(user=self.request.user)\
-                        .filter(family__isnull=True)
-        elif type == 'family':
-            userprofile = UserProfile.objects.get(user=self.request.user)
-            queryset = queryset.filter(family=userprofile.family)
-        else:
-            queryset = queryset.filter(user=self.request.user)
-
-        # filter by date range
-        date_range = self.request.query_params.get('date_range')
-        if date_range:
-            dates = date_range.split(",")
-            if (len(dates) == 2):
-                queryset = queryset.filter(date__range=dates)
-
-        # filter by day/month/year
-        year = self.request.query_params.get('year')
-        month = self.request.query_params.get('month')
-        day = self.request.query_params.get('day')
-
-        if day and month and year:
-            queryset = queryset.filter(date__year=year,
-                                       date__month=month,
-                                       date__day=day)
-        elif month and year:
-            queryset = queryset.filter(date__year=year,
-                                       date__month=month)
-        elif year:
-            queryset = queryset.filter(date__year=year)
-
-        # filter by day/month/year
-        category = self.request.query_params.get('category')
-        if category:
-            queryset = queryset.filter(category=category)
-
-        queryset = queryset.values(
-            'category__id',
-            'category__name').annotate(total_amount=Sum('amount'))
-        return queryset.order_by('category__id')
+            - category: comma separated category ids
+        """
+        return category_totals(RecordFilter(self.request))
+
+    def list(self, request, *args, **kwargs):
+        """
+        Return the category totals, or with group_by=day|week|month|year
+        a category x period matrix of totals
+        """
+        group_by = request.query_params.get('group_by')
+        if group_by and group_by not in PIVOT_PERIODS:
+            raise ValidationError({'group_by': 'Expected one of ' +
+                                   ', '.join(PIVOT_PERIODS) + '.'})
+
+        record_filter = RecordFilter(request)
+        scope = record_filter.get_scope_name()
+        versions = get_versions('records', [scope],
+                                categories=['public', scope])
+        etag = make_etag(request, versions)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        def compute():
+            if group_by:
+                return category_pivot(record_filter, group_by)
+            serializer = self.get_serializer(
+                category_totals(record_filter), many=True)
+            return [dict(row) for row in serializer.data]
+
+        data = cached_data('summary', scope, request, versions, compute)
+        return Response(data, headers={'ETag': etag})
+
+
+class ImageUploadViewSet(viewsets.GenericViewSet,
+                         mixins.RetrieveModelMixin):
+    """
+    Status of the images uploaded with Prefer: respond-async, and the
+    chunks of resumable uploads
+    """
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+    serializer_class = serializers.ImageUploadSerializer
+    queryset = ImageUpload.objects.all()
+
+    def get_queryset(self):
+        """Return the uploads of the authenticated user"""
+        return self.queryset.filter(user=self.request.user) \
+            .select_related('record')
+
+    def update(self, request, *args, **kwargs):
+        """
+        Write a chunk of a chunked upload, the request body
+        Headers:
+            - Upload-Offset: byte offset of the chunk, which must be the
+              upload's offset. A 409 response carries the current one.
+        """
+        upload = self.get_object()
+        if upload.status != ImageUpload.RECEIVING:
+            return self.conflict(upload, 'The upload is not receiving.')
+        try:
+            offset = int(request.META['HTTP_UPLOAD_OFFSET'])
+        except (KeyError, ValueError):
+            raise ValidationError(
+                {'Upload-Offset': ['Expected the offset of the chunk.']})
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length <= 0:
+            raise ValidationError(
+                {'Content-Length': ['Expected the length of the chunk.']})
+        if offset != upload.offset:
+            return self.conflict(upload, 'Expected the upload offset.')
+        if offset + length > upload.size:
+            raise ValidationError(
+                {'Content-Length': ['The chunk ends past the size.']})
+
+        if not receive_chunk(upload, offset, request.stream, length):
+            upload.refresh_from_db()
+            return self.conflict(upload, 'The chunk was not received.')
+        upload.refresh_from_db()
+        return Response(self.get_serializer(upload).data,
+                        headers={'Upload-Offset': upload.offset})
+
+    @action(methods=['POST'], detail=True)
+    def finalize(self, request, pk=None):
+        """Queue a completely received chunked upload for processing"""
+        upload = self.get_object()
+        if not finish_session(upload):
+            return self.conflict(upload, 'The upload is not complete.')
+        serializer = self.get_serializer(upload)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED,
+                        headers={'Location': serializer.data['url']})
+
+    def conflict(self, upload, detail):
+        """Return a 409 response telling the client where to resume"""
+        return Response({'detail': detail, 'offset': upload.offset},
+                        status=status.HTTP_409_CONFLICT,
+                        headers={'Upload-Offset': upload.offset})
@@ -1,15 +1,31 @@
 from django.contrib.auth import get_user_model, authenticate
+from django.core.files.storage import default_storage
 from django.utils.translation import ugettext_lazy as _
 from core.models import UserProfile, Family
 
 from rest_framework import serializers
 
 
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Field for the variant name -> URL map of an image"""
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        urls = {}
+        for variant, name in value.items():
+            url = default_storage.url(name)
+            urls[variant] = request.build_absolute_uri(url) \
+                if request is not None else url
+        return urls
+
+
 class UserAttrSerializer(serializers.ModelSerializer):
     """Serializer for user avatar"""
+    avatar_variants = ImageVariantsField()
+
     class Meta:
         model = UserProfile
-        fields = ('avatar',)
+        fields = ('avatar', 'avatar_variants')
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -65,6 +81,8 @@ class AuthTokenSerializer(serializers.Serializer):
 
 class FamilySerializer(serializers.ModelSerializer):
     """Serializer for family"""
+    avatar_variants = ImageVariantsField()
+
     class Meta:
         model = Family
         fields = '__all__'
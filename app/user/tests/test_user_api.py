@@ -168,3 +168,15 @@ class PrivateUserApiTests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(len(res.data), 2)
+
+    def test_retrieve_user_profile_not_modified(self):
+        """Test an unchanged profile answers 304 until it changes"""
+        etag = self.client.get(PROFILE_URL)['ETag']
+
+        res = self.client.get(PROFILE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.patch(ME_URL, {'name': 'new name'})
+        res = self.client.get(PROFILE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['user']['name'], 'new name')
@@ -1,10 +1,13 @@
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from core.models import UserProfile
+from core.authentication import CachedTokenAuthentication, \
+    get_user_profile
+from core.conditional import make_etag, not_modified
+from core.versions import get_versions
 from user.serializers import UserSerializer, \
     AuthTokenSerializer, UserProfileSerializer
 
@@ -23,7 +26,7 @@ class CreateTokenView(ObtainAuthToken):
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """Manage the authenticated user"""
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_object(self):
@@ -32,10 +35,16 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
 
 class UserProfileView(APIView):
     """User profile view"""
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, format=None):
-        user_profile = UserProfile.objects.get(user=self.request.user)
-        serializer = UserProfileSerializer(user_profile, many=False)
-        return Response(serializer.data)
+        etag = make_etag(self.request, get_versions(
+            'profile', [f'user:{self.request.user.pk}']))
+        response = not_modified(self.request, etag)
+        if response is not None:
+            return response
+
+        serializer = UserProfileSerializer(get_user_profile(self.request),
+                                           many=False)
+        return Response(serializer.data, headers={'ETag': etag})